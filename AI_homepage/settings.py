@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chat_app.middleware.server_timing_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,12 +75,81 @@ WSGI_APPLICATION = 'AI_homepage.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE으로 프로필을 고릅니다.
+#  - 'sqlite' (기본값): WAL 저널 + busy timeout + IMMEDIATE 트랜잭션으로 여러 gunicorn 워커의
+#    동시 쓰기에서 "database is locked" 오류를 줄입니다. SQLITE_TUNED=0이면 예전 기본 설정을 씁니다.
+#  - 'postgresql': 지속 연결(CONN_MAX_AGE) + 연결 상태 확인, DB_POOL_MAX_SIZE > 0이면 psycopg 연결 풀을 씁니다.
+# 동시 쓰기 성능은 `python manage.py bench_db_writes`로 비교할 수 있습니다.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 0))
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'ai_homepage'),
+            'USER': os.getenv('DB_USER', 'postgres'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # 풀을 쓸 때는 Django가 연결을 유지하지 않아야 합니다. (CONN_MAX_AGE=0)
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DB_POOL_MAX_SIZE:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
     }
+    if os.getenv('SQLITE_TUNED', '1') == '1':
+        DATABASES['default']['OPTIONS'] = {
+            # 잠금을 기다리는 최대 시간(초)
+            'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+            # 쓰기 트랜잭션이 처음부터 쓰기 잠금을 잡아, 읽기->쓰기 승격 중 교착으로 실패하지 않게 합니다.
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA mmap_size=134217728;'
+            ),
+        }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 여러 gunicorn 워커가 공유해야 하므로 기본값은 파일 기반 캐시입니다.
+# (Redis 등은 CACHE_BACKEND / CACHE_LOCATION 환경 변수로 지정)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / '.django_cache')),
+        'TIMEOUT': 300,
+    },
+    # 잠금/슬롯 전용 (single_flight, admission, 대화 요약 압축. chat_app/services/locks.py 참고)
+    # cache.add가 원자적인 Redis/Memcached여야 하며, 아니면 앱 시작 시 ImproperlyConfigured로 실패합니다.
+    'locks': {
+        'BACKEND': os.getenv('LOCK_CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.getenv('LOCK_CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+        'KEY_PREFIX': 'locks',
+    },
 }
+# 단일 프로세스(runserver 등)에서만 LocMemCache를 잠금 캐시로 허용합니다. (워커끼리 공유되지 않음)
+LOCK_CACHE_ALLOW_LOCAL = os.getenv('LOCK_CACHE_ALLOW_LOCAL', 'false').lower() in ('1', 'true', 'yes')
 
 
 # Password validation
@@ -120,6 +190,206 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Chat history pagination
+# /api/chat/history/ 한 페이지에 담을 메시지 쌍 개수
+
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 30))
+
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', 100))
+
+# Chat prompt
+# 시스템 프롬프트 뒤에 붙일 최근 대화 턴 수 (사용자+AI 한 쌍이 1턴)
+
+CHAT_PROMPT_HISTORY_TURNS = int(os.getenv('CHAT_PROMPT_HISTORY_TURNS', 5))
+
+# Chat send de-duplication (chat_app/services/single_flight.py)
+# 같은 사용자의 같은 메시지(+ Idempotency-Key 헤더)는 한 번만 처리합니다.
+# 처리 중에 들어온 중복 요청은 최대 CHAT_SEND_INFLIGHT_TIMEOUT초 동안 첫 요청의 결과를 기다리고,
+# 첫 요청의 결과는 기다리던 요청이 가져가도록 CHAT_SEND_DEDUP_WINDOW초 동안만 남기고,
+# 처리가 끝난 뒤 들어온 요청에 결과를 재사용하는 것은 Idempotency-Key가 있을 때(CHAT_SEND_IDEMPOTENCY_TTL초)뿐입니다.
+
+CHAT_SEND_INFLIGHT_TIMEOUT = int(os.getenv('CHAT_SEND_INFLIGHT_TIMEOUT', 120))
+
+CHAT_SEND_DEDUP_WINDOW = int(os.getenv('CHAT_SEND_DEDUP_WINDOW', 10))
+
+CHAT_SEND_IDEMPOTENCY_TTL = int(os.getenv('CHAT_SEND_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+# LLM admission control (chat_app/services/admission.py)
+# 모든 워커를 합쳐 채팅 요청을 동시에 LLM_MAX_CONCURRENCY개까지 실행하고, 최대 LLM_QUEUE_MAX개까지
+# LLM_QUEUE_TIMEOUT초 동안 기다리게 합니다. 넘치면 503 + Retry-After. (슬롯은 공유 캐시에 있습니다)
+# 반납되지 못한 슬롯(프로세스 종료 등)은 LLM_SLOT_TTL초 뒤 풀리므로, 가장 긴 채팅 한 턴보다 길게 잡습니다.
+# 사용자별로는 분당 LLM_USER_RATE_PER_MINUTE개(최대 LLM_USER_BURST개까지 몰아서) 허용하고, 넘치면 429. (0이면 끔)
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+
+LLM_QUEUE_MAX = int(os.getenv('LLM_QUEUE_MAX', 16))
+
+LLM_QUEUE_TIMEOUT = int(os.getenv('LLM_QUEUE_TIMEOUT', 5))
+
+LLM_SLOT_TTL = int(os.getenv('LLM_SLOT_TTL', 300))
+
+LLM_USER_RATE_PER_MINUTE = int(os.getenv('LLM_USER_RATE_PER_MINUTE', 20))
+
+LLM_USER_BURST = int(os.getenv('LLM_USER_BURST', 5))
+
+# Conversation compaction (manage.py compact_conversations, chat_app/services/conversation_summary.py)
+# 최근 CONVERSATION_KEEP_TURNS턴은 그대로 두고, 그보다 오래된 메시지가 CONVERSATION_COMPACT_MIN_MESSAGES개 이상 쌓이면
+# CONVERSATION_COMPACT_BATCH_MESSAGES개씩 롤링 요약(ConversationSummary)에 접어 넣습니다.
+# CONVERSATION_ARCHIVE=true이면 요약된 메시지를 ArchivedChatMessage로 옮겨 ChatMessage 테이블을 작게 유지합니다.
+
+CONVERSATION_KEEP_TURNS = int(os.getenv('CONVERSATION_KEEP_TURNS', 10))
+
+CONVERSATION_COMPACT_MIN_MESSAGES = int(os.getenv('CONVERSATION_COMPACT_MIN_MESSAGES', 40))
+
+CONVERSATION_COMPACT_BATCH_MESSAGES = int(os.getenv('CONVERSATION_COMPACT_BATCH_MESSAGES', 40))
+
+CONVERSATION_SUMMARY_MODEL = os.getenv('CONVERSATION_SUMMARY_MODEL', 'gpt-3.5-turbo')
+
+CONVERSATION_SUMMARY_MAX_TOKENS = int(os.getenv('CONVERSATION_SUMMARY_MAX_TOKENS', 400))
+
+CONVERSATION_ARCHIVE = os.getenv('CONVERSATION_ARCHIVE', 'false').lower() in ('1', 'true', 'yes')
+
+# User context (시스템 프롬프트에 넣을 사용자 프로필 블록, chat_app/services/user_context.py)
+
+USER_CONTEXT_TOKEN_BUDGET = int(os.getenv('USER_CONTEXT_TOKEN_BUDGET', 300))
+
+USER_CONTEXT_CACHE_TTL = int(os.getenv('USER_CONTEXT_CACHE_TTL', 24 * 60 * 60))
+
+# Metrics (단계별 지연 시간 / 토큰 사용량, chat_app/services/metrics.py)
+# 각 워커는 METRICS_FLUSH_INTERVAL초마다 공유 캐시에 지표를 올리고, METRICS_PROCESS_TTL초 동안 갱신이 없으면 집계에서 빠집니다.
+# METRICS_TOKEN을 설정하면 /metrics/ 요청에 "Authorization: Bearer <토큰>"이 필요합니다.
+# /api/health/vector/의 오류 세부 정보도 이 토큰을 보내거나 스태프로 로그인해야 보입니다.
+
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+METRICS_PROCESS_TTL = int(os.getenv('METRICS_PROCESS_TTL', 300))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Relationship mention tagger (메시지에서 언급된 인간관계 찾기, chat_app/services/mention_tagger.py)
+# 프로세스마다 오토마톤을 보관할 최대 사용자 수
+
+MENTION_TAGGER_CACHE_USERS = int(os.getenv('MENTION_TAGGER_CACHE_USERS', 1000))
+
+# Semantic response cache
+# 사용자가 opt-in(UserProfile.response_cache_enabled)한 경우에만 사용합니다. (chat_app/services/response_cache.py)
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.95))
+
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 600))
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 20))
+
+# Memory export / import (api/memory/export/, manage.py export_memory / import_memory)
+# 내보내기는 MEMORY_EXPORT_CHUNK_SIZE행씩 읽고, 가져오기는 MEMORY_IMPORT_BATCH_SIZE행씩 bulk_create합니다.
+
+MEMORY_EXPORT_CHUNK_SIZE = int(os.getenv('MEMORY_EXPORT_CHUNK_SIZE', 1000))
+
+MEMORY_IMPORT_BATCH_SIZE = int(os.getenv('MEMORY_IMPORT_BATCH_SIZE', 1000))
+
+# Background tasks (chat_app/services/background.py)
+# 채팅 응답 후 새 메시지 벡터 업서트, 활동 롤업 반영 같은 부수 작업을 프로세스 내 작업자 스레드가 처리합니다.
+# 실패하면 BACKGROUND_RETRY_DELAY초부터 두 배씩 늘려 BACKGROUND_MAX_ATTEMPTS번까지 시도하고,
+# 큐(BACKGROUND_QUEUE_SIZE)가 꽉 차면 호출한 스레드에서 바로 실행합니다.
+# 프로세스 종료 시 남은 작업을 BACKGROUND_SHUTDOWN_TIMEOUT초 동안 마저 처리합니다.
+# CHAT_VECTOR_UPSERT=false이면 채팅 메시지는 ingest_vectors를 실행할 때만 벡터 저장소에 들어갑니다.
+
+BACKGROUND_TASKS_ENABLED = os.getenv('BACKGROUND_TASKS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+BACKGROUND_QUEUE_SIZE = int(os.getenv('BACKGROUND_QUEUE_SIZE', 1000))
+
+BACKGROUND_MAX_ATTEMPTS = int(os.getenv('BACKGROUND_MAX_ATTEMPTS', 3))
+
+BACKGROUND_RETRY_DELAY = float(os.getenv('BACKGROUND_RETRY_DELAY', 1.0))
+
+BACKGROUND_SHUTDOWN_TIMEOUT = float(os.getenv('BACKGROUND_SHUTDOWN_TIMEOUT', 10))
+
+CHAT_VECTOR_UPSERT = os.getenv('CHAT_VECTOR_UPSERT', 'true').lower() in ('1', 'true', 'yes')
+
+# Room editing
+# /api/room/furniture/batch/ 한 요청에 담을 수 있는 최대 변경 수
+
+ROOM_BATCH_MAX_OPERATIONS = int(os.getenv('ROOM_BATCH_MAX_OPERATIONS', 500))
+
+# Pinecone connection pool
+# 워커 프로세스당 하나의 인덱스 핸들을 재사용합니다. (chat_app/services/pinecone_pool.py)
+
+PINECONE_WARMUP = os.getenv('PINECONE_WARMUP', 'false').lower() in ('1', 'true', 'yes')
+
+PINECONE_POOL_THREADS = int(os.getenv('PINECONE_POOL_THREADS', 1))
+
+PINECONE_CONNECTION_POOL_MAXSIZE = int(os.getenv('PINECONE_CONNECTION_POOL_MAXSIZE', 10))
+
+PINECONE_RECONNECT_BACKOFF = float(os.getenv('PINECONE_RECONNECT_BACKOFF', 5))
+
+# Query embedding cache
+# L1: 워커 프로세스 내 LRU (바이트 단위 상한), L2: DB 공유 캐시 (chat_app/services/embedding_cache.py)
+
+EMBEDDING_CACHE_L1_MAX_BYTES = int(os.getenv('EMBEDDING_CACHE_L1_MAX_BYTES', 32 * 1024 * 1024))
+
+EMBEDDING_CACHE_L2_MAX_AGE_DAYS = int(os.getenv('EMBEDDING_CACHE_L2_MAX_AGE_DAYS', 30))
+
+EMBEDDING_CACHE_PRUNE_EVERY = int(os.getenv('EMBEDDING_CACHE_PRUNE_EVERY', 1000))
+
+# Vector store
+# 'pinecone' | 'local' | 'auto' (auto: 벡터 수가 VECTOR_STORE_LOCAL_MAX_VECTORS 이하인 사용자는 로컬에서 조회)
+# auto는 사용자의 벡터를 Pinecone에서 모두 받아 온 뒤에만 로컬에서 조회하며,
+# 백필은 사용자당 VECTOR_STORE_MIRROR_RETRY초에 한 번 백그라운드에서 시도합니다.
+
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'pinecone')
+
+VECTOR_STORE_LOCAL_DIR = os.getenv('VECTOR_STORE_LOCAL_DIR', str(BASE_DIR / 'vector_store'))
+
+VECTOR_STORE_LOCAL_DTYPE = os.getenv('VECTOR_STORE_LOCAL_DTYPE', 'float16') # float32 | float16 | int8
+
+VECTOR_STORE_LOCAL_MAX_VECTORS = int(os.getenv('VECTOR_STORE_LOCAL_MAX_VECTORS', 2000))
+
+VECTOR_STORE_LOCAL_CACHE_USERS = int(os.getenv('VECTOR_STORE_LOCAL_CACHE_USERS', 256))
+
+VECTOR_STORE_MIRROR_RETRY = int(os.getenv('VECTOR_STORE_MIRROR_RETRY', 3600))
+
+# Retrieval cache (chat_app/services/retrieval_cache.py)
+# 같은 쿼리 임베딩의 벡터 검색 결과를 사용자별로 RETRIEVAL_CACHE_TTL초 동안 재사용합니다. (0이면 끔)
+# 그 사용자의 벡터가 업서트되면 즉시 무효화됩니다.
+
+RETRIEVAL_CACHE_TTL = int(os.getenv('RETRIEVAL_CACHE_TTL', 30))
+
+# Keyword index (문자 n-gram BM25, chat_app/services/keyword_index.py)
+# 채팅/활동 기록을 저장할 때마다 색인하고, 검색 시 벡터 결과와 RRF로 합칩니다. (기존 데이터는 manage.py rebuild_keyword_index)
+# 질문 n-gram이 KEYWORD_SKIP_VECTOR_MIN_TERMS개 이상이고 점수가 가장 높은 활동 기록 문서가 그 IDF 가중치의
+# KEYWORD_SKIP_VECTOR_COVERAGE 이상을 덮으면 벡터 조회를 생략합니다. (1보다 크게 하면 생략하지 않음)
+# 문서의 KEYWORD_MAX_DF_RATIO 넘게 나오는 n-gram은 검색할 때 건너뜁니다.
+
+KEYWORD_INDEX_ENABLED = os.getenv('KEYWORD_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+KEYWORD_SKIP_VECTOR_COVERAGE = float(os.getenv('KEYWORD_SKIP_VECTOR_COVERAGE', 0.9))
+
+KEYWORD_SKIP_VECTOR_MIN_TERMS = int(os.getenv('KEYWORD_SKIP_VECTOR_MIN_TERMS', 3))
+
+KEYWORD_MAX_DF_RATIO = float(os.getenv('KEYWORD_MAX_DF_RATIO', 0.5))
+
+# Vector ingestion (python manage.py ingest_vectors)
+
+INGESTION_CHUNK_SIZE = int(os.getenv('INGESTION_CHUNK_SIZE', 2000))
+
+INGESTION_EMBEDDING_BATCH_SIZE = int(os.getenv('INGESTION_EMBEDDING_BATCH_SIZE', 256))
+
+INGESTION_UPSERT_BATCH_SIZE = int(os.getenv('INGESTION_UPSERT_BATCH_SIZE', 100))
+
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', 4))
+
+# 매 실행마다 커서 뒤 이만큼의 id 범위를 다시 훑어 늦게 커밋된 행(id가 커밋 순서와 다른 경우)을 적재합니다.
+# (동시에 진행 중인 트랜잭션이 받아 갈 수 있는 id 수보다 넉넉하게)
+INGESTION_CURSOR_LAG = int(os.getenv('INGESTION_CURSOR_LAG', 1000))
+
+# 임베딩 모델 입력 한도(text-embedding-3: 8191토큰)보다 조금 작게 잡은, 한 텍스트의 최대 토큰 수
+INGESTION_MAX_TOKENS = int(os.getenv('INGESTION_MAX_TOKENS', 8000))
+
+# 이미 적재된 채팅/활동/인간관계 행이 수정·삭제되면 커밋 뒤 백그라운드에서 벡터도 고칩니다.
+INGESTION_SYNC_CHANGES = os.getenv('INGESTION_SYNC_CHANGES', 'true').lower() in ('1', 'true', 'yes')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
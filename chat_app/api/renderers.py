@@ -0,0 +1,23 @@
+from rest_framework.renderers import BaseRenderer
+
+from ..views import format_sse
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Accept: text/event-stream 요청을 DRF 콘텐츠 협상에서 받아들이기 위한 렌더러입니다.
+    (EventSource 클라이언트는 항상 이 헤더를 보냅니다.)
+
+    정상 응답은 뷰가 StreamingHttpResponse로 직접 내보내므로, 이 렌더러는 그 전에 돌려준
+    오류 응답(400/429/503 등)만 SSE 'error' 이벤트 하나로 바꿔 보냅니다.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'error': data}
+        return format_sse(data, event='error').encode(self.charset)
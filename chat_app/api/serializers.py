@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from ..models import Room, FurnitureItem # Room, FurnitureItem 모델 임포트
 
 class ChatPairSerializer(serializers.Serializer):
     """
@@ -23,3 +24,45 @@ class ChatPairSerializer(serializers.Serializer):
             'ai_response': instance['ai_msg'],
             'timestamp': instance['timestamp'].isoformat(),
         }
+
+# ----------------------------------------------------
+# 🌟 신규: 가구 인테리어 Serializers 🌟
+# ----------------------------------------------------
+class FurnitureItemSerializer(serializers.ModelSerializer):
+    """
+    FurnitureItem 모델을 Flutter용 JSON으로 변환합니다.
+    """
+    class Meta:
+        model = FurnitureItem
+        # id는 자동으로 포함되며, room 필드는 RoomSerializer에서 처리합니다.
+        fields = (
+            'id', 'item_type', 'position_x', 'position_y', 'position_z', 
+            'rotation', 'scale', 'custom_name'
+        )
+        read_only_fields = ('id',) # id는 생성 시 자동으로 부여
+
+class RoomSerializer(serializers.ModelSerializer):
+    """
+    Room 모델과 이에 속한 모든 FurnitureItem을 함께 직렬화합니다.
+    """
+    # related_name='furniture_items'를 사용하여 가구 목록을 Nested Serializer로 포함
+    furniture_items = FurnitureItemSerializer(many=True, read_only=True) 
+
+    class Meta:
+        model = Room
+        # user는 primary_key이고 요청 시점에서 결정되므로 fields에서 제외합니다.
+        fields = ('room_name', 'background_style', 'furniture_items', 'last_updated', 'version')
+        read_only_fields = ('furniture_items', 'last_updated', 'version') 
+
+class FurnitureBatchSerializer(serializers.Serializer):
+    """
+    가구 일괄 변경 요청을 검증합니다.
+    - version: 클라이언트가 마지막으로 받은 Room.version
+    - create: 새 가구 목록 (client_id를 넣으면 응답에서 그대로 돌려줍니다)
+    - update: id와 바뀐 필드만 담은 목록
+    - delete: 삭제할 가구 id 목록
+    """
+    version = serializers.IntegerField(min_value=0)
+    create = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    update = serializers.ListField(child=serializers.DictField(), required=False, default=list)
+    delete = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
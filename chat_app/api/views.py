@@ -1,11 +1,25 @@
+import hashlib
 import json
-from rest_framework.decorators import api_view, permission_classes
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+from django.views.decorators.http import require_POST
+from django.db import transaction
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Coalesce
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
-from ..models import ChatMessage # ChatMessage 모델 임포트 가정
-from ..services.chat_service import process_chat_interaction
-from .serializers import ChatPairSerializer 
+from ..models import ArchivedChatMessage, ChatMessage, FurnitureItem, Room
+from ..services import admission, memory_export, single_flight
+from ..services.chat_service import aprocess_chat_interaction, process_chat_interaction, stream_chat_interaction
+from ..services.clients import closes_async_openai_client
+from ..views import sse_response
+from .renderers import EventStreamRenderer
+from .serializers import ChatPairSerializer, FurnitureBatchSerializer, FurnitureItemSerializer, RoomSerializer
 
 # ----------------------------------------------------
 # 1. 채팅 기록 로드 API (GET)
@@ -16,43 +30,144 @@ from .serializers import ChatPairSerializer
 def get_chat_history(request):
     """
     사용자 채팅 기록을 로드하고, 사용자-AI 메시지 쌍으로 묶어 JSON 목록으로 반환합니다.
+
+    키셋(커서) 페이지네이션을 사용합니다.
+    - before_id: 이 ID보다 이전의 AI 메시지부터 가져옵니다. (생략 시 최신부터)
+    - limit: 한 페이지에 담을 메시지 쌍 개수 (기본 CHAT_HISTORY_PAGE_SIZE, 최대 CHAT_HISTORY_MAX_PAGE_SIZE)
+    응답 본문은 기존과 같은 메시지 쌍 목록이고, 더 이전 페이지가 있으면 다음 before_id를
+    X-Next-Before-Id 헤더로 알려 줍니다. (마지막 페이지에는 헤더가 없습니다.)
+
+    기록 길이와 무관하게 AI 메시지 1회 + 사용자 메시지 1회, 총 2번의 쿼리만 실행합니다.
+    (핫 테이블의 마지막 페이지에서만 보관 테이블 조회가 추가됩니다.)
     """
     user = request.user
-    
-    # 1. AI 응답 메시지만 가져오고 최신 순으로 정렬합니다. (Flutter의 reverse: true에 맞춤)
-    ai_messages = ChatMessage.objects.filter(user=user, is_user=False).order_by('-timestamp')
-    
-    chat_pairs = []
-    
-    for ai_msg in ai_messages:
-        # 2. 각 AI 메시지보다 timestamp가 '같거나' 이전인 가장 최신 사용자 메시지를 찾습니다.
-        user_msg = ChatMessage.objects.filter(
-            user=user, 
-            is_user=True, 
-            timestamp__lte=ai_msg.timestamp 
-        ).order_by('-timestamp').first()
-
-        if user_msg:
-            # 3. Flutter ChatPairSerializer에 맞게 딕셔너리 쌍 생성
-            chat_pair = {
-                'id': ai_msg.id,          # AI 메시지 ID를 쌍의 고유 ID로 사용
-                'user_msg': user_msg.message,
-                'ai_msg': ai_msg.message, # AI 응답 텍스트
-                'timestamp': ai_msg.timestamp,
-            }
-            chat_pairs.append(chat_pair)
-        else:
-            print(f"[History Error] AI 메시지(ID: {ai_msg.id})에 대응하는 사용자 메시지를 찾을 수 없습니다.")
-
-    # 4. Serializer를 사용하여 List[Dict]를 JSON으로 변환
+
+    try:
+        before_id = request.query_params.get('before_id')
+        before_id = int(before_id) if before_id else None
+        limit = int(request.query_params.get('limit', settings.CHAT_HISTORY_PAGE_SIZE))
+    except ValueError:
+        return Response(
+            {"error": "before_id와 limit은 정수여야 합니다."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    limit = max(1, min(limit, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+
+    chat_pairs, has_more, last_ai_id = _chat_pairs_page(ChatMessage, 'id', user, before_id, limit)
+    if not has_more:
+        # 핫 테이블이 끝나면 요약 후 보관된 더 오래된 메시지(ArchivedChatMessage)에서 이어서 채웁니다.
+        # 보관 메시지는 항상 핫 테이블의 메시지보다 오래되었고, 원래 ID를 커서로 그대로 씁니다.
+        archived_pairs, has_more, archived_last_id = _chat_pairs_page(
+            ArchivedChatMessage, 'original_id', user,
+            last_ai_id if last_ai_id is not None else before_id,
+            limit - len(chat_pairs),
+        )
+        chat_pairs += archived_pairs
+        last_ai_id = archived_last_id if archived_last_id is not None else last_ai_id
+
+    # Serializer를 사용하여 List[Dict]를 JSON으로 변환
     serializer = ChatPairSerializer(chat_pairs, many=True)
-    
-    return Response(serializer.data, status=status.HTTP_200_OK)
+
+    headers = {'X-Next-Before-Id': str(last_ai_id)} if has_more else None
+    return Response(serializer.data, status=status.HTTP_200_OK, headers=headers)
+
+
+def _chat_pairs_page(model, id_field: str, user, before_id, limit: int):
+    """
+    model(ChatMessage 또는 ArchivedChatMessage)에서 before_id 이전의 메시지 쌍을 최대 limit개 만듭니다.
+    (쌍 목록, 더 있는지 여부, 마지막 AI 메시지 ID)를 반환합니다.
+    """
+    # 1. AI 응답 메시지 한 페이지를 최신 순으로 가져옵니다. (Flutter의 reverse: true에 맞춤)
+    #    커서와 정렬 모두 id만 사용하므로 timestamp가 같거나 뒤바뀐 메시지(가져온 기록 등)가 있어도
+    #    페이지 사이에 빠지거나 겹치는 메시지가 없습니다.
+    ai_messages = model.objects.filter(user=user, is_user=False)
+    if before_id is not None:
+        ai_messages = ai_messages.filter(**{f'{id_field}__lt': before_id})
+    ai_messages = list(ai_messages.order_by(f'-{id_field}').only(id_field, 'message', 'timestamp')[:limit + 1])
+
+    has_more = len(ai_messages) > limit
+    ai_messages = ai_messages[:limit]
+
+    chat_pairs = []
+    if ai_messages:
+        newest_id = getattr(ai_messages[0], id_field)
+        oldest_id = getattr(ai_messages[-1], id_field)
+
+        # 2. 페이지 범위에 필요한 사용자 메시지만 한 번에 가져옵니다.
+        #    가장 오래된 AI 메시지 직전의 사용자 메시지까지 포함해야 하므로 하한은 서브쿼리로 계산합니다.
+        floor_id = model.objects.filter(
+            user=user,
+            is_user=True,
+            **{f'{id_field}__lt': oldest_id}
+        ).order_by(f'-{id_field}').values(id_field)[:1]
+
+        user_messages = list(
+            model.objects.filter(
+                user=user,
+                is_user=True,
+                **{
+                    f'{id_field}__lt': newest_id,
+                    f'{id_field}__gte': Coalesce(Subquery(floor_id), Value(oldest_id)),
+                }
+            ).order_by(f'-{id_field}').only(id_field, 'message')
+        )
+
+        # 3. 두 목록 모두 최신 순이므로 한 번의 순회로 짝을 맞춥니다.
+        #    각 AI 메시지는 그보다 먼저 저장된 가장 최신 사용자 메시지와 짝을 이룹니다.
+        j = 0
+        for ai_msg in ai_messages:
+            ai_id = getattr(ai_msg, id_field)
+            while j < len(user_messages) and getattr(user_messages[j], id_field) > ai_id:
+                j += 1
+
+            if j < len(user_messages):
+                # Flutter ChatPairSerializer에 맞게 딕셔너리 쌍 생성
+                chat_pairs.append({
+                    'id': ai_id, # AI 메시지 ID를 쌍의 고유 ID로 사용
+                    'user_msg': user_messages[j].message,
+                    'ai_msg': ai_msg.message, # AI 응답 텍스트
+                    'timestamp': ai_msg.timestamp,
+                })
+            else:
+                print(f"[History Error] AI 메시지(ID: {ai_id})에 대응하는 사용자 메시지를 찾을 수 없습니다.")
+
+    last_ai_id = getattr(ai_messages[-1], id_field) if ai_messages else None
+    return chat_pairs, has_more, last_ai_id
 
 # ----------------------------------------------------
 # 2. 채팅 메시지 전송 API (POST)
 # Endpoint: /api/chat/send/
 # ----------------------------------------------------
+def _send_chat_pair(request, user_message_text):
+    """
+    AI 로직을 실행하고 (응답 본문, 상태 코드)를 반환합니다.
+    single-flight로 감싸 실행하므로 Response 대신 캐시에 저장할 수 있는 값을 돌려줍니다.
+    """
+    # 1. 기존 AI 로직 서비스 호출 (가장 중요한 단계: Pinecone, LLM, RDB 저장 모두 여기서 처리됨)
+    #    과부하/사용자별 속도 제한에 걸리면 아무것도 저장하지 않고 AdmissionRejected를 던집니다.
+    with admission.admit(request.user.id):
+        result = process_chat_interaction(request, user_message_text)
+
+    if not result.get('bot_message_id'):
+        return (
+            {"error": "AI 응답 생성에 실패했습니다.", "detail": result.get('bot_message')},
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    # 2. 저장된 두 메시지를 그대로 Flutter Serializer 형식으로 변환합니다. (RDB를 다시 조회하지 않음)
+    #    벡터 업서트 등 나머지 작업은 백그라운드 작업자가 응답 후에 처리합니다.
+    ai_msg_obj = result['ai_message']
+    chat_pair = {
+        'id': ai_msg_obj.id,
+        'user_msg': result['user_message'].message,
+        'ai_msg': ai_msg_obj.message,
+        'timestamp': ai_msg_obj.timestamp,
+    }
+
+    serializer = ChatPairSerializer(chat_pair)
+    return dict(serializer.data), status.HTTP_200_OK
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def send_chat_message(request):
@@ -70,40 +185,30 @@ def send_chat_message(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 2. 기존 AI 로직 서비스 호출 (가장 중요한 단계: Pinecone, LLM, RDB 저장 모두 여기서 처리됨)
-        result = process_chat_interaction(request, user_message_text)
-        
-        bot_message_id = result.get('bot_message_id')
-        bot_message_text = result.get('bot_message')
-        
-        if not bot_message_id:
+        # 2. 같은 메시지의 중복 전송(재시도/연타)은 한 번만 처리하고 결과를 공유합니다.
+        idempotency_key = request.headers.get('Idempotency-Key')
+        key = single_flight.make_key(request.user.id, user_message_text, idempotency_key)
+        try:
+            (payload, status_code), replayed = single_flight.run_once(
+                key, idempotency_key, lambda: _send_chat_pair(request, user_message_text)
+            )
+        except single_flight.SingleFlightTimeout:
+            return Response(
+                {"error": "같은 메시지를 처리하는 중입니다. 잠시 후 다시 시도해 주세요."},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'},
+            )
+        except admission.AdmissionRejected as e:
             return Response(
-                {"error": "AI 응답 생성에 실패했습니다.", "detail": bot_message_text},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": e.message},
+                status=e.status_code,
+                headers={'Retry-After': str(e.retry_after)},
             )
 
-        # 3. 새로 생성된 AI 응답 객체를 RDB에서 가져옵니다.
-        ai_msg_obj = ChatMessage.objects.get(id=bot_message_id)
-
-        # 4. 새로 생성된 AI 메시지의 직전 사용자 메시지를 찾아 쌍을 이룹니다.
-        user_msg_obj = ChatMessage.objects.filter(
-            user=request.user, 
-            is_user=True, 
-            timestamp__lte=ai_msg_obj.timestamp
-        ).order_by('-timestamp').first()
-
-        # 5. Flutter Serializer에 맞게 데이터 준비 및 변환
-        chat_pair = {
-            'id': ai_msg_obj.id,
-            'user_msg': user_msg_obj.message if user_msg_obj else user_message_text,
-            'ai_msg': bot_message_text,
-            'timestamp': ai_msg_obj.timestamp,
-        }
-
-        serializer = ChatPairSerializer(chat_pair)
-        
-        # 6. 성공 JSON 응답 반환
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(payload, status=status_code)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
 
     except json.JSONDecodeError:
         return Response(
@@ -118,62 +223,303 @@ def send_chat_message(request):
         )
 
 
-from rest_framework import serializers
-from ..models import Room, FurnitureItem # Room, FurnitureItem 모델 임포트
-
 # ----------------------------------------------------
-# 기존 채팅 Serializer
+# 3. 채팅 메시지 스트리밍 전송 API (POST, Server-Sent Events)
+# Endpoint: /api/chat/send/stream/
 # ----------------------------------------------------
-class ChatPairSerializer(serializers.Serializer):
-    """
-    Flutter의 ChatMessageModel (사용자 메시지와 AI 응답 한 쌍) 형식에 맞춰
-    데이터를 직렬화하기 위한 커스텀 Serializer입니다.
-    
-    이 Serializer는 뷰에서 직접 가공한 딕셔너리(메시지 쌍)를 받습니다.
-    """
-    # Flutter model: id (AI message ID), userMessage, aiResponse, timestamp (AI message timestamp)
-    
-    id = serializers.IntegerField(help_text="AI 응답 메시지의 고유 ID")
-    user_message = serializers.CharField(source='user_msg', help_text="사용자가 보낸 메시지 텍스트")
-    ai_response = serializers.CharField(source='ai_msg', help_text="AI가 응답한 메시지 텍스트")
-    timestamp = serializers.DateTimeField(help_text="AI 응답이 생성된 시간")
-    
-    # Python의 snake_case(user_msg)를 Flutter의 camelCase(userMessage)로 변환하고
-    # DateTime 객체를 ISO 8601 형식의 문자열로 변환합니다.
-    def to_representation(self, instance):
-        return {
-            'id': instance['id'],
-            'user_message': instance['user_msg'],
-            'ai_response': instance['ai_msg'],
-            'timestamp': instance['timestamp'].isoformat(),
-        }
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def send_chat_message_stream(request):
+    """
+    send_chat_message의 스트리밍 버전입니다.
+    AI 응답 토큰을 생성되는 대로 SSE로 보내고, 끝나면 저장된 메시지 쌍을 'done' 이벤트로 보냅니다.
+    Accept: text/event-stream 요청이면 스트림 시작 전 오류도 SSE 'error' 이벤트로 받습니다.
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return Response(
+            {"error": "잘못된 JSON 형식입니다."}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    user_message_text = data.get('message')
+    if not user_message_text:
+        return Response(
+            {"error": "메시지 내용이 필요합니다."}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        ticket = admission.acquire(request.user.id)
+    except admission.AdmissionRejected as e:
+        return Response(
+            {"error": e.message},
+            status=e.status_code,
+            headers={'Retry-After': str(e.retry_after)},
+        )
+
+    # 입장 허가는 스트림이 끝나거나 연결이 닫힐 때 반납합니다.
+    return sse_response(admission.ReleasingStream(ticket, stream_chat_interaction(request.user, user_message_text)))
+
 
 # ----------------------------------------------------
-# 🌟 신규: 가구 인테리어 Serializers 🌟
+# 4. 채팅 메시지 전송 API - 비동기 버전 (POST)
+# Endpoint: /api/chat/send/async/
 # ----------------------------------------------------
-class FurnitureItemSerializer(serializers.ModelSerializer):
+@require_POST
+@closes_async_openai_client
+async def send_chat_message_async(request):
     """
-    FurnitureItem 모델을 Flutter용 JSON으로 변환합니다.
+    send_chat_message의 비동기(ASGI) 버전입니다.
+    OpenAI/Pinecone 응답을 기다리는 동안 워커 스레드를 점유하지 않습니다.
+    DRF 뷰는 비동기를 지원하지 않으므로 Django 세션 인증을 직접 확인합니다.
     """
-    class Meta:
-        model = FurnitureItem
-        # id는 자동으로 포함되며, room 필드는 RoomSerializer에서 처리합니다.
-        fields = (
-            'id', 'item_type', 'position_x', 'position_y', 'position_z', 
-            'rotation', 'scale', 'custom_name'
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_403_FORBIDDEN
         )
-        read_only_fields = ('id',) # id는 생성 시 자동으로 부여
 
-class RoomSerializer(serializers.ModelSerializer):
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse(
+            {"error": "잘못된 JSON 형식입니다."}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    user_message_text = data.get('message')
+    if not user_message_text:
+        return JsonResponse(
+            {"error": "메시지 내용이 필요합니다."}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    idempotency_key = request.headers.get('Idempotency-Key')
+    key = single_flight.make_key(user.id, user_message_text, idempotency_key)
+    try:
+        (payload, status_code), replayed = await single_flight.arun_once(
+            key, idempotency_key, lambda: _asend_chat_pair(user, user_message_text)
+        )
+    except single_flight.SingleFlightTimeout:
+        response = JsonResponse(
+            {"error": "같은 메시지를 처리하는 중입니다. 잠시 후 다시 시도해 주세요."},
+            status=status.HTTP_409_CONFLICT,
+            json_dumps_params={'ensure_ascii': False},
+        )
+        response['Retry-After'] = '1'
+        return response
+    except admission.AdmissionRejected as e:
+        response = JsonResponse(
+            {"error": e.message},
+            status=e.status_code,
+            json_dumps_params={'ensure_ascii': False},
+        )
+        response['Retry-After'] = str(e.retry_after)
+        return response
+
+    response = JsonResponse(payload, status=status_code, json_dumps_params={'ensure_ascii': False})
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+async def _asend_chat_pair(user, user_message_text):
+    """_send_chat_pair의 비동기 버전입니다."""
+    async with admission.aadmit(user.id):
+        result = await aprocess_chat_interaction(user, user_message_text)
+
+    if not result.get('bot_message_id'):
+        return (
+            {"error": "AI 응답 생성에 실패했습니다.", "detail": result.get('bot_message')},
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+    # 저장된 두 메시지를 그대로 사용하므로 RDB를 다시 조회하지 않습니다.
+    ai_msg_obj = result['ai_message']
+    chat_pair = {
+        'id': ai_msg_obj.id,
+        'user_msg': result['user_message'].message,
+        'ai_msg': ai_msg_obj.message,
+        'timestamp': ai_msg_obj.timestamp,
+    }
+    return dict(ChatPairSerializer(chat_pair).data), status.HTTP_200_OK
+
+
+# ----------------------------------------------------
+# 5. 방 상태 로드 API (GET, 조건부 요청 지원)
+# Endpoint: /api/room/state/
+# ----------------------------------------------------
+def room_state_etag(room) -> str:
+    """Room.last_updated와 각 가구의 (id, updated_at)으로 방 상태의 ETag를 만듭니다."""
+    digest = hashlib.sha1(f"{room.version}:{room.last_updated.isoformat()}".encode())
+    for item in room.furniture_items.all():
+        digest.update(f"|{item.id}:{item.updated_at.isoformat()}".encode())
+    return quote_etag(digest.hexdigest())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def room_state_api(request):
+    """
+    사용자의 방과 배치된 모든 가구를 반환합니다.
+    방 1회 + 가구 1회(prefetch), 최대 2번의 쿼리로 로드하며
+    If-None-Match가 현재 ETag와 같으면 본문 없이 304를 반환합니다.
+    """
+    room = Room.objects.prefetch_related('furniture_items').filter(user=request.user).first()
+    if room is None:
+        # 처음 방에 들어온 사용자는 기본 방을 만들어 줍니다.
+        room = Room.objects.create(user=request.user)
+
+    etag = room_state_etag(room)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    serializer = RoomSerializer(room)
+    return Response(serializer.data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+
+# ----------------------------------------------------
+# 6. 가구 일괄 변경 API (POST)
+# Endpoint: /api/room/furniture/batch/
+# ----------------------------------------------------
+FURNITURE_UPDATE_FIELDS = (
+    'item_type', 'position_x', 'position_y', 'position_z', 'rotation', 'scale', 'custom_name'
+)
+
+
+class FurnitureBatchError(Exception):
+    """일괄 변경 중 요청 내용이 잘못되어 트랜잭션을 되돌려야 할 때 사용합니다."""
+
+
+def _validate_furniture_items(items, partial):
+    """각 가구 항목을 FurnitureItemSerializer로 검증하고 검증된 데이터 목록을 반환합니다."""
+    validated = []
+    for item in items:
+        serializer = FurnitureItemSerializer(data=item, partial=partial)
+        if not serializer.is_valid():
+            raise FurnitureBatchError({'item': item, 'errors': serializer.errors})
+        validated.append(serializer.validated_data)
+    return validated
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def furniture_batch_api(request):
     """
-    Room 모델과 이에 속한 모든 FurnitureItem을 함께 직렬화합니다.
+    가구 생성/이동/삭제를 한 번에 받아 하나의 트랜잭션에서 bulk_create/bulk_update로 반영합니다.
+    요청의 version이 현재 Room.version과 다르면(다른 기기에서 먼저 변경됨) 409를 반환하고,
+    성공하면 새 version과 바뀐 가구만 반환합니다.
     """
-    # related_name='furniture_items'를 사용하여 가구 목록을 Nested Serializer로 포함
-    furniture_items = FurnitureItemSerializer(many=True, read_only=True) 
+    batch = FurnitureBatchSerializer(data=request.data)
+    batch.is_valid(raise_exception=True)
+    data = batch.validated_data
+
+    operations = len(data['create']) + len(data['update']) + len(data['delete'])
+    if operations > settings.ROOM_BATCH_MAX_OPERATIONS:
+        return Response(
+            {"error": f"한 번에 최대 {settings.ROOM_BATCH_MAX_OPERATIONS}개의 변경만 보낼 수 있습니다."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        creates = _validate_furniture_items(data['create'], partial=False)
+        updates = _validate_furniture_items(data['update'], partial=True)
+        update_ids = [item.get('id') for item in data['update']]
+        if not all(isinstance(item_id, int) for item_id in update_ids):
+            raise FurnitureBatchError({'update': "모든 항목에 정수 id가 필요합니다."})
+        # 같은 가구를 두 번 수정하면 bulk_update에서 어느 값이 남을지 정해지지 않습니다.
+        if len(set(update_ids)) != len(update_ids):
+            raise FurnitureBatchError({'update': "같은 가구 id가 여러 번 들어 있습니다."})
+    except FurnitureBatchError as e:
+        return Response({"error": "잘못된 가구 데이터입니다.", "detail": e.args[0]}, status=status.HTTP_400_BAD_REQUEST)
 
-    class Meta:
-        model = Room
-        # user는 primary_key이고 요청 시점에서 결정되므로 fields에서 제외합니다.
-        fields = ('room_name', 'background_style', 'furniture_items', 'last_updated')
-        read_only_fields = ('furniture_items', 'last_updated') 
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            # 1. 버전이 일치할 때만 버전을 올립니다. (이 UPDATE가 방 단위 잠금 역할도 합니다.)
+            bumped = Room.objects.filter(user=request.user, version=data['version']).update(
+                version=F('version') + 1, last_updated=now
+            )
+            if not bumped:
+                current = Room.objects.filter(user=request.user).values_list('version', flat=True).first()
+                if current is None:
+                    return Response({"error": "방이 존재하지 않습니다."}, status=status.HTTP_404_NOT_FOUND)
+                return Response(
+                    {"error": "다른 곳에서 방이 먼저 변경되었습니다. 최신 상태를 다시 불러오세요.", "version": current},
+                    status=status.HTTP_409_CONFLICT
+                )
+            room_id = request.user.pk
+
+            # 2. 삭제
+            deleted_ids = []
+            if data['delete']:
+                deleted_ids = list(
+                    FurnitureItem.objects.filter(room_id=room_id, id__in=data['delete']).values_list('id', flat=True)
+                )
+                FurnitureItem.objects.filter(room_id=room_id, id__in=deleted_ids).delete()
+
+            # 3. 이동/수정 - 바뀐 필드만 bulk_update
+            updated_items = []
+            if updates:
+                existing = FurnitureItem.objects.in_bulk(update_ids)
+                changed_fields = {'updated_at'}
+                for item_id, fields in zip(update_ids, updates):
+                    item = existing.get(item_id)
+                    if item is None or item.room_id != room_id or item_id in deleted_ids:
+                        raise FurnitureBatchError({'update': f"가구(ID: {item_id})를 찾을 수 없습니다."})
+                    for field, value in fields.items():
+                        setattr(item, field, value)
+                        changed_fields.add(field)
+                    item.updated_at = now  # bulk_update는 auto_now를 적용하지 않습니다.
+                    updated_items.append(item)
+                FurnitureItem.objects.bulk_update(updated_items, sorted(changed_fields))
+
+            # 4. 생성
+            created_items = FurnitureItem.objects.bulk_create(
+                [FurnitureItem(room_id=room_id, created_at=now, updated_at=now, **fields) for fields in creates]
+            )
+    except FurnitureBatchError as e:
+        return Response({"error": "잘못된 가구 변경 요청입니다.", "detail": e.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+    created = FurnitureItemSerializer(created_items, many=True).data
+    for item, raw in zip(created, data['create']):
+        if 'client_id' in raw:
+            item['client_id'] = raw['client_id']
+
+    return Response({
+        'version': data['version'] + 1,
+        'created': created,
+        'updated': FurnitureItemSerializer(updated_items, many=True).data,
+        'deleted': deleted_ids,
+    }, status=status.HTTP_200_OK)
+
+
+# ----------------------------------------------------
+# 7. 기억 내보내기 API (GET, NDJSON 스트리밍)
+# Endpoint: /api/memory/export/?gzip=1
+# ----------------------------------------------------
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def memory_export_api(request):
+    """
+    로그인한 사용자의 대화/활동/속성/인간관계/방 데이터를 NDJSON으로 내려받습니다.
+    전체를 메모리에 올리지 않고 청크 단위로 읽으면서 바로 보내므로 기록이 많아도 워커가 멈추지 않습니다.
+    (python manage.py import_memory로 다시 가져올 수 있습니다.)
+    """
+    use_gzip = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+    lines = memory_export.iter_export(request.user)
+    filename = f"memory-{request.user.pk}-{timezone.now():%Y%m%d}.ndjson"
 
+    if use_gzip:
+        response = StreamingHttpResponse(memory_export.gzip_stream(lines), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,6 +1,22 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ChatAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401  signal 수신기 등록
+        from .services import locks
+
+        # 잠금/슬롯 캐시가 잘못 설정되어 있으면 요청을 받기 전에 실패합니다.
+        locks.check_configuration()
+
+        # 워커가 뜰 때 Pinecone 커넥션을 미리 열어 첫 채팅 요청의 연결 비용을 없앱니다.
+        # (migrate 등 관리 명령에서는 필요 없으므로 PINECONE_WARMUP으로 켭니다.)
+        if settings.PINECONE_WARMUP:
+            from .services.pinecone_pool import pinecone_pool
+            threading.Thread(target=pinecone_pool.warm_up, daemon=True).start()
@@ -0,0 +1,210 @@
+"""
+부하 테스트용 로컬 가짜 OpenAI / Pinecone 서버
+
+실제 API 비용 없이 엔드포인트 전체 경로(HTTP 클라이언트 포함)를 측정할 수 있도록,
+임베딩 / 채팅 완성 / 벡터 검색·저장 요청에 설정한 지연 시간만큼 기다렸다가 고정된 형태의 응답을 돌려줍니다.
+(manage.py bench_e2e에서 사용합니다.)
+"""
+import hashlib
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+FAKE_ANSWER = "벤치마크용 가짜 AI 답변입니다."
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """텍스트마다 항상 같은 값을 갖는 가짜 임베딩"""
+    seed = hashlib.sha256(text.encode('utf-8')).digest()
+    return [(seed[i % len(seed)] - 128) / 128.0 for i in range(dimensions)]
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: "FakeServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = self._read_json()
+        self.server.count(self.path)
+        time.sleep(self.server.latency_for(self.path))
+        route = self.server.routes.get(self.path)
+        if route is None:
+            self._send_json({'error': {'message': f'unknown path {self.path}'}}, status=404)
+            return
+        route(self, payload)
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, routes: Dict, latency_ms: Dict[str, float]):
+        super().__init__(('127.0.0.1', 0), _FakeHandler)
+        self.routes = routes
+        self._latency = {path: ms / 1000.0 for path, ms in latency_ms.items()}
+        self._counts_lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def latency_for(self, path: str) -> float:
+        return self._latency.get(path, 0.0)
+
+    def count(self, path: str):
+        with self._counts_lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+    def handle_error(self, request, client_address):
+        # 클라이언트가 타임아웃/재시도로 먼저 연결을 끊은 경우는 조용히 넘어갑니다.
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self) -> "FakeServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+# ----------------------------------------------------
+# OpenAI (base_url = <url>/v1)
+# ----------------------------------------------------
+def _openai_embeddings(handler, payload):
+    inputs = payload.get('input')
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dimensions = payload.get('dimensions') or 1024
+    handler._send_json({
+        'object': 'list',
+        'model': payload.get('model'),
+        'data': [
+            {'object': 'embedding', 'index': i, 'embedding': fake_embedding(text, dimensions)}
+            for i, text in enumerate(inputs)
+        ],
+        'usage': {'prompt_tokens': len(inputs), 'total_tokens': len(inputs)},
+    })
+
+
+def _openai_chat_completions(handler, payload):
+    created = int(time.time())
+    if not payload.get('stream'):
+        handler._send_json({
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion',
+            'created': created,
+            'model': payload.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': FAKE_ANSWER},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120},
+        })
+        return
+
+    handler.send_response(200)
+    handler.send_header('Content-Type', 'text/event-stream')
+    handler.send_header('Connection', 'close')
+    handler.end_headers()
+    for word in FAKE_ANSWER.split(' '):
+        chunk = {
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': payload.get('model'),
+            'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}],
+        }
+        handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+    if (payload.get('stream_options') or {}).get('include_usage'):
+        usage_chunk = {
+            'id': 'chatcmpl-bench',
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': payload.get('model'),
+            'choices': [],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20, 'total_tokens': 120},
+        }
+        handler.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode('utf-8'))
+    handler.wfile.write(b"data: [DONE]\n\n")
+    handler.close_connection = True
+
+
+def start_fake_openai(embedding_latency_ms: float = 0, chat_latency_ms: float = 0) -> FakeServer:
+    return FakeServer(
+        routes={
+            '/v1/embeddings': _openai_embeddings,
+            '/v1/chat/completions': _openai_chat_completions,
+        },
+        latency_ms={
+            '/v1/embeddings': embedding_latency_ms,
+            '/v1/chat/completions': chat_latency_ms,
+        },
+    ).start()
+
+
+# ----------------------------------------------------
+# Pinecone data plane (host = <url>)
+# ----------------------------------------------------
+def _pinecone_query(handler, payload):
+    top_k = payload.get('topK') or payload.get('top_k') or 5
+    user_id = (payload.get('filter') or {}).get('user_id')
+    handler._send_json({
+        'matches': [
+            {
+                'id': f'bench-{user_id}-{i}',
+                'score': 0.9 - i * 0.05,
+                'values': [],
+                'metadata': {'user_id': user_id, 'text': f'벤치마크 문서 {i}: 사용자 {user_id}의 예전 대화 내용'},
+            }
+            for i in range(top_k)
+        ],
+        'namespace': payload.get('namespace', ''),
+        'usage': {'readUnits': 1},
+    })
+
+
+def _pinecone_upsert(handler, payload):
+    handler._send_json({'upsertedCount': len(payload.get('vectors', []))})
+
+
+def _pinecone_delete(handler, payload):
+    handler._send_json({})
+
+
+def start_fake_pinecone(query_latency_ms: float = 0, upsert_latency_ms: float = 0) -> FakeServer:
+    return FakeServer(
+        routes={
+            '/query': _pinecone_query,
+            '/vectors/upsert': _pinecone_upsert,
+            '/vectors/delete': _pinecone_delete,
+        },
+        latency_ms={
+            '/query': query_latency_ms,
+            '/vectors/upsert': upsert_latency_ms,
+        },
+    ).start()
@@ -0,0 +1,49 @@
+import uuid
+
+from django.contrib.auth import authenticate, login
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+
+class Command(BaseCommand):
+    help = "회원가입/로그인 경로에서 실행되는 DB 쿼리 수를 측정합니다. (모든 변경은 롤백됩니다)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=20, help="측정 반복 횟수")
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        verbose = options['verbosity'] >= 2
+        totals = {'signup': 0, 'login': 0}
+        samples = {}
+
+        with transaction.atomic():
+            for _ in range(rounds):
+                username = f"bench-{uuid.uuid4().hex[:12]}"
+                password = uuid.uuid4().hex
+
+                with CaptureQueriesContext(connection) as signup:
+                    User.objects.create_user(username=username, password=password)
+
+                request = RequestFactory().post('/login/')
+                request.session = SessionStore()
+                with CaptureQueriesContext(connection) as signin:
+                    user = authenticate(request, username=username, password=password)
+                    login(request, user)
+
+                totals['signup'] += len(signup)
+                totals['login'] += len(signin)
+                samples.setdefault('signup', signup.captured_queries)
+                samples.setdefault('login', signin.captured_queries)
+
+            transaction.set_rollback(True)
+
+        for path in ('signup', 'login'):
+            self.stdout.write(f"{path}: 평균 {totals[path] / rounds:.1f} 쿼리/회 ({rounds}회)")
+            if verbose:
+                for query in samples[path]:
+                    self.stdout.write(f"    {query['sql'][:120]}")
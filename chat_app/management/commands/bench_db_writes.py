@@ -0,0 +1,98 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+
+from chat_app.models import ChatMessage
+
+
+class Command(BaseCommand):
+    help = (
+        "여러 스레드에서 동시에 ChatMessage를 저장하여 현재 DB 프로필(DB_ENGINE)의 쓰기 처리량을 측정합니다. "
+        "(측정용 사용자와 메시지는 끝나면 삭제됩니다)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help="동시에 쓰는 스레드 수 (각자 별도 DB 연결)")
+        parser.add_argument('--turns', type=int, default=100, help="스레드마다 저장할 대화 턴 수 (턴마다 사용자+AI 메시지 2건)")
+        parser.add_argument('--keep', action='store_true', help="측정 후 메시지를 삭제하지 않습니다.")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        turns = options['turns']
+
+        self.stdout.write(f"DB: {self._describe_database()}")
+
+        users = [User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:12]}") for _ in range(workers)]
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(workers)
+
+        def run(user):
+            local_latencies = []
+            local_errors = []
+            try:
+                start_barrier.wait()
+                for i in range(turns):
+                    started = time.perf_counter()
+                    try:
+                        # 채팅 한 턴과 같은 모양의 쓰기: 사용자 메시지 + AI 메시지
+                        with transaction.atomic():
+                            ChatMessage.objects.create(user=user, message=f"bench question {i}", is_user=True)
+                            ChatMessage.objects.create(user=user, message=f"bench answer {i}", is_user=False)
+                    except Exception as e:
+                        local_errors.append(str(e))
+                    else:
+                        local_latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+                with lock:
+                    latencies.extend(local_latencies)
+                    errors.extend(local_errors)
+
+        threads = [threading.Thread(target=run, args=(user,)) for user in users]
+        started_at = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+
+        if not options['keep']:
+            ChatMessage.objects.filter(user__in=users).delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+        self.stdout.write(f"workers={workers}, turns/worker={turns}, elapsed={elapsed:.2f}s")
+        self.stdout.write(
+            f"committed turns: {len(latencies)} ({len(latencies) * 2} messages), "
+            f"throughput: {len(latencies) * 2 / elapsed:.1f} messages/s"
+        )
+        if latencies:
+            ordered = sorted(latencies)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            self.stdout.write(
+                f"turn latency: p50={statistics.median(ordered) * 1000:.1f}ms, "
+                f"p95={p95 * 1000:.1f}ms, max={ordered[-1] * 1000:.1f}ms"
+            )
+        if errors:
+            self.stdout.write(self.style.ERROR(f"failed turns: {len(errors)} (e.g. {errors[0]})"))
+        else:
+            self.stdout.write(self.style.SUCCESS("failed turns: 0"))
+
+    def _describe_database(self) -> str:
+        settings_dict = connection.settings_dict
+        description = f"{connection.vendor} ({settings_dict['NAME']})"
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = cursor.fetchone()[0]
+            description += f", journal_mode={journal_mode}, transaction_mode={connection.transaction_mode}"
+        else:
+            pool = settings_dict['OPTIONS'].get('pool')
+            description += f", CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}, pool={pool or 'off'}"
+        return description
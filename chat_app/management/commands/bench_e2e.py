@@ -0,0 +1,343 @@
+import json
+import os
+import platform
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from chat_app.benchmarks.fake_servers import start_fake_openai, start_fake_pinecone
+from chat_app.models import ChatMessage, UserActivity
+from chat_app.services import analytics, background
+from chat_app.services.clients import configure_openai
+from chat_app.services.pinecone_pool import create_pinecone_index, pinecone_pool
+
+# 기준값은 측정한 기계에 따라 크게 달라지므로 저장소에 올리지 않습니다. (.gitignore)
+# 같은 기계에서 변경 전/후를 비교하는 참고용이며, 기계 정보가 다르면 비교 결과는 참고만 하세요.
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'e2e_baseline.json'
+
+# 이름 -> (메서드, 경로, 요청 본문이 필요한지)
+ENDPOINTS = {
+    'send_message_api': ('post', '/api/send_message/', True),
+    'send_chat_message': ('post', '/api/chat/send/', True),
+    'send_chat_message_async': ('post', '/api/chat/send/async/', True),
+    'get_chat_history': ('get', '/api/chat/history/?limit=30', False),
+}
+
+PLACES = ['카페', '도서관', '회사', '공원', '영화관', '헬스장', '식당', '집']
+COMPANIONS = ['', '', '민수', '지영', '엄마', '개발팀 동료']
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    """정렬된 목록의 nearest-rank 백분위수"""
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class Command(BaseCommand):
+    help = (
+        "로컬 가짜 OpenAI/Pinecone 서버와 합성 사용자 데이터를 넣은 테스트 DB로 채팅 엔드포인트를 부하 측정합니다. "
+        "엔드포인트별 p50/p95/p99 지연, 처리량, 요청당 DB 쿼리 수를 출력하고 기준값(JSON)과 비교합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help=f"측정할 엔드포인트 (쉼표 구분: {', '.join(ENDPOINTS)})")
+        parser.add_argument('--requests', type=int, default=100, help="엔드포인트마다 보낼 요청 수")
+        parser.add_argument('--concurrency', type=int, default=8, help="동시에 요청을 보내는 클라이언트 스레드 수")
+        parser.add_argument('--users', type=int, default=20, help="합성 사용자 수")
+        parser.add_argument('--messages-per-user', type=int, default=2000, help="사용자마다 미리 넣을 ChatMessage 수")
+        parser.add_argument('--activities-per-user', type=int, default=500, help="사용자마다 미리 넣을 UserActivity 수")
+        parser.add_argument('--embedding-latency-ms', type=float, default=30, help="가짜 임베딩 API 지연")
+        parser.add_argument('--chat-latency-ms', type=float, default=300, help="가짜 채팅 완성 API 지연")
+        parser.add_argument('--query-latency-ms', type=float, default=40, help="가짜 Pinecone 검색 지연")
+        parser.add_argument('--client-timeout', type=float, default=10, help="가짜 서버로 보내는 OpenAI 요청 타임아웃(초)")
+        parser.add_argument('--seed', type=int, default=42, help="합성 데이터 난수 시드")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="기준값 JSON 파일 경로 (이 기계에서 --save-baseline으로 만든 참고용 결과)")
+        parser.add_argument('--save-baseline', action='store_true', help="이번 결과를 기준값으로 저장합니다.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="p95 지연이 기준값보다 이 비율 넘게 늘면 회귀로 봅니다.")
+        parser.add_argument('--fail-on-regression', action='store_true', help="회귀가 있으면 오류로 종료합니다.")
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(names) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"알 수 없는 엔드포인트: {', '.join(sorted(unknown))}")
+
+        config = {
+            key: options[key]
+            for key in (
+                'requests', 'concurrency', 'users', 'messages_per_user', 'activities_per_user',
+                'embedding_latency_ms', 'chat_latency_ms', 'query_latency_ms', 'seed',
+            )
+        }
+
+        openai_server = start_fake_openai(options['embedding_latency_ms'], options['chat_latency_ms'])
+        pinecone_server = start_fake_pinecone(options['query_latency_ms'])
+        self.stdout.write(f"fake OpenAI: {openai_server.url}, fake Pinecone: {pinecone_server.url}")
+
+        # 실제 DB/공유 캐시를 건드리지 않도록 테스트 DB와 프로세스 내부 캐시를 씁니다.
+        # SQLite는 여러 스레드가 같은 DB를 보도록 메모리 DB 대신 파일을 씁니다.
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})
+            connection.settings_dict['TEST']['NAME'] = str(Path(settings.BASE_DIR) / 'bench_e2e.sqlite3')
+
+        setup_test_environment()
+        old_db_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        restore_clients = self._use_fake_services(openai_server.url, pinecone_server.url, options['client_timeout'])
+        try:
+            with override_settings(
+                CACHES={
+                    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                    'locks': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'locks'},
+                },
+                VECTOR_STORE_BACKEND='pinecone',
+                # 파이프라인 자체를 재므로 사용자별 속도 제한은 끄고, 대기열은 모든 클라이언트가 줄 설 수 있게 잡습니다.
+                LLM_USER_RATE_PER_MINUTE=0,
+                LLM_QUEUE_MAX=options['concurrency'],
+            ):
+                users = self._seed(options)
+                results = {name: self._run_endpoint(name, users, options) for name in names}
+                # 응답 후 백그라운드 작업(벡터 업서트 등)이 테스트 DB를 지우기 전에 끝나도록 기다립니다.
+                background.worker.flush(settings.BACKGROUND_SHUTDOWN_TIMEOUT)
+        finally:
+            restore_clients()
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+            teardown_test_environment()
+            openai_server.stop()
+            pinecone_server.stop()
+
+        self._report(results)
+        self.stdout.write(f"fake API calls: {dict(openai_server.counts)} {dict(pinecone_server.counts)}")
+        self._compare_with_baseline(results, config, options)
+
+    # ----------------------------------------------------
+    # 준비
+    # ----------------------------------------------------
+    def _use_fake_services(self, openai_url: str, pinecone_url: str, client_timeout: float):
+        """OpenAI/Pinecone 클라이언트를 가짜 서버로 향하게 하고, 원래대로 되돌리는 함수를 반환합니다."""
+        saved_env = {key: os.environ.get(key) for key in (
+            'PINECONE_API_KEY', 'PINECONE_ENVIRONMENT', 'PINECONE_INDEX_NAME', 'PINECONE_INDEX_HOST',
+        )}
+
+        # 요청이 멈춰도 벤치마크 전체가 멈추지 않도록 타임아웃을 짧게 둡니다.
+        configure_openai(api_key='bench', base_url=f"{openai_url}/v1", timeout=client_timeout)
+        os.environ.update({
+            'PINECONE_API_KEY': 'bench',
+            'PINECONE_ENVIRONMENT': 'bench',
+            'PINECONE_INDEX_NAME': 'bench',
+            'PINECONE_INDEX_HOST': pinecone_url,
+        })
+        pinecone_pool.configure(create_pinecone_index)
+
+        def restore():
+            configure_openai()
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            pinecone_pool.configure(create_pinecone_index)
+
+        return restore
+
+    def _seed(self, options) -> List[User]:
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        users = [User.objects.create_user(username=f"bench-user-{i}") for i in range(options['users'])]
+
+        now = timezone.now()
+        for user in users:
+            count = options['messages_per_user']
+            messages = ChatMessage.objects.bulk_create(
+                [
+                    ChatMessage(user=user, message=f"합성 대화 {i}", is_user=(i % 2 == 0))
+                    for i in range(count)
+                ],
+                batch_size=1000,
+            )
+            # auto_now_add 때문에 생성 시각이 모두 같으므로, 1분 간격의 과거 시각으로 펼칩니다.
+            for i, message in enumerate(messages):
+                message.timestamp = now - timedelta(minutes=count - i)
+            ChatMessage.objects.bulk_update(messages, ['timestamp'], batch_size=500)
+
+            today = date.today()
+            UserActivity.objects.bulk_create(
+                [
+                    UserActivity(
+                        user=user,
+                        activity_date=today - timedelta(days=rng.randrange(730)),
+                        place=rng.choice(PLACES),
+                        companion=rng.choice(COMPANIONS) or None,
+                        memo="합성 활동 기록",
+                    )
+                    for _ in range(options['activities_per_user'])
+                ],
+                batch_size=1000,
+            )
+
+        # bulk_create는 signal을 건너뛰므로 롤업을 한 번에 다시 계산합니다.
+        analytics.rebuild_rollups([user.id for user in users])
+        self.stdout.write(
+            f"seeded {len(users)} users x {options['messages_per_user']} messages, "
+            f"{options['activities_per_user']} activities in {time.perf_counter() - started:.1f}s"
+        )
+        return users
+
+    # ----------------------------------------------------
+    # 측정
+    # ----------------------------------------------------
+    def _request(self, client: Client, name: str, n: int):
+        method, path, has_body = ENDPOINTS[name]
+        if not has_body:
+            return client.get(path)
+        body = json.dumps({'message': f"벤치마크 질문 {n}: 어제 카페에서 민수랑 나눈 이야기 기억나?"})
+        return getattr(client, method)(path, data=body, content_type='application/json')
+
+    def _run_endpoint(self, name: str, users: List[User], options) -> Dict:
+        concurrency = options['concurrency']
+        total = options['requests']
+        latencies: List[float] = []
+        query_counts: List[int] = []
+        errors: List[int] = []
+        lock = threading.Lock()
+        counter = iter(range(total))
+        barrier = threading.Barrier(concurrency + 1)
+
+        def worker(index: int):
+            local = []
+            try:
+                client = Client(raise_request_exception=False)
+                client.force_login(users[index % len(users)])
+                # 워밍업 요청 (연결 수립 등은 측정에서 제외)
+                self._request(client, name, -1 - index)
+            finally:
+                barrier.wait()
+            try:
+                while True:
+                    with lock:
+                        n = next(counter, None)
+                    if n is None:
+                        break
+                    with CaptureQueriesContext(connections['default']) as queries:
+                        started = time.perf_counter()
+                        response = self._request(client, name, n)
+                        elapsed = time.perf_counter() - started
+                    local.append((elapsed, len(queries), response.status_code))
+            finally:
+                connections.close_all()
+                with lock:
+                    for elapsed, count, status in local:
+                        latencies.append(elapsed)
+                        query_counts.append(count)
+                        if status >= 400:
+                            errors.append(status)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        ordered = sorted(latencies)
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'p50_ms': round(percentile(ordered, 50) * 1000, 1),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 1),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 1),
+            'throughput_rps': round(len(latencies) / wall, 1) if wall else 0.0,
+            'queries_avg': round(sum(query_counts) / len(query_counts), 2) if query_counts else 0.0,
+            'queries_max': max(query_counts, default=0),
+        }
+
+    # ----------------------------------------------------
+    # 출력 / 기준값
+    # ----------------------------------------------------
+    def _report(self, results: Dict[str, Dict]):
+        header = f"{'endpoint':<26}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>8}{'q/req':>7}{'q max':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<26}{r['requests']:>6}{r['errors']:>5}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+                f"{r['p99_ms']:>9}{r['throughput_rps']:>8}{r['queries_avg']:>7}{r['queries_max']:>7}"
+            )
+
+    def _machine(self) -> Dict:
+        """기준값과 함께 기록하는 측정 환경 (다른 기계의 기준값과 비교하고 있는지 알리기 위함)"""
+        return {
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+        }
+
+    def _compare_with_baseline(self, results: Dict[str, Dict], config: Dict, options):
+        path = Path(options['baseline'])
+
+        if options['save_baseline']:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            payload = {
+                'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                'machine': self._machine(),
+                'config': config,
+                'results': results,
+            }
+            path.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + '\n', encoding='utf-8')
+            self.stdout.write(self.style.SUCCESS(f"기준값 저장: {path}"))
+            return
+
+        if not path.exists():
+            self.stdout.write(f"기준값 파일이 없습니다: {path} (--save-baseline으로 만들 수 있습니다)")
+            return
+
+        baseline = json.loads(path.read_text(encoding='utf-8'))
+        if baseline.get('machine') != self._machine():
+            self.stdout.write(self.style.WARNING(
+                "기준값을 다른 기계(또는 기계 정보가 없는 예전 형식)에서 측정했습니다. 비교 결과는 참고용입니다."
+            ))
+        if baseline.get('config') != config:
+            self.stdout.write(self.style.WARNING("기준값과 측정 설정이 달라 비교가 정확하지 않을 수 있습니다."))
+
+        regressions = []
+        for name, r in results.items():
+            base = baseline.get('results', {}).get(name)
+            if not base:
+                continue
+            if r['p95_ms'] > base['p95_ms'] * (1 + options['tolerance']):
+                regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {r['p95_ms']}ms")
+            if r['queries_avg'] > base['queries_avg'] + 0.5:
+                regressions.append(f"{name}: queries/request {base['queries_avg']} -> {r['queries_avg']}")
+            if r['errors'] > base['errors']:
+                regressions.append(f"{name}: errors {base['errors']} -> {r['errors']}")
+
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"기준값 대비 회귀 없음 ({path})"))
+            return
+
+        for line in regressions:
+            self.stdout.write(self.style.ERROR(f"회귀: {line}"))
+        if options['fail_on_regression']:
+            raise CommandError(f"기준값 대비 회귀 {len(regressions)}건")
@@ -0,0 +1,78 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# 새 파이썬 프로세스에서 워커 부팅 과정을 단계별로 재는 스크립트
+PROBE = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'AI_homepage.settings')
+import django
+django.setup()
+t_setup = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+t_urls = time.perf_counter()
+from AI_homepage.wsgi import application
+t_ready = time.perf_counter()
+print(json.dumps({
+    'setup_ms': (t_setup - t0) * 1000,
+    'urls_ms': (t_urls - t_setup) * 1000,
+    'ready_ms': (t_ready - t0) * 1000,
+    'heavy_modules': sorted(m for m in ('openai', 'pinecone', 'numpy', 'httpx') if m in sys.modules),
+}))
+"""
+
+API_KEY_ENV = ('OPENAI_API_KEY',)
+
+
+class Command(BaseCommand):
+    help = (
+        "새 프로세스에서 워커가 요청을 받을 준비가 될 때까지의 시간(django.setup, URLconf/뷰 import, WSGI 앱 생성)을 측정합니다. "
+        "OPENAI_API_KEY 없이도 부팅되는지도 확인합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=7, help="측정 반복 횟수 (중앙값을 보고합니다)")
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'AI_homepage.settings'))
+
+        samples = [self._probe(env) for _ in range(rounds)]
+        for key, label in (
+            ('process_ms', "프로세스 시작 ~ 종료 (인터프리터 포함)"),
+            ('setup_ms', "django.setup()"),
+            ('urls_ms', "URLconf + 뷰 모듈 import"),
+            ('ready_ms', "워커 준비 완료 (WSGI 앱 생성까지)"),
+        ):
+            values = [sample[key] for sample in samples]
+            self.stdout.write(f"{label:<36} median={statistics.median(values):8.1f}ms  min={min(values):8.1f}ms")
+        self.stdout.write(f"부팅 후 로드된 무거운 SDK: {', '.join(samples[0]['heavy_modules']) or '없음'}")
+
+        env_without_keys = {k: v for k, v in env.items() if k not in API_KEY_ENV}
+        try:
+            self._probe(env_without_keys)
+        except CommandError as e:
+            self.stdout.write(self.style.ERROR(f"OPENAI_API_KEY 없이 부팅: 실패 ({e})"))
+        else:
+            self.stdout.write(self.style.SUCCESS("OPENAI_API_KEY 없이 부팅: 성공"))
+
+    def _probe(self, env) -> dict:
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        elapsed = (time.perf_counter() - started) * 1000
+        if result.returncode != 0:
+            last_line = (result.stderr.strip().splitlines() or ['알 수 없는 오류'])[-1]
+            raise CommandError(last_line)
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = elapsed
+        return sample
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_app.services.analytics import find_mismatches, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "ActivityAnalytics 롤업이 UserActivity 원본과 일치하는지 검사합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="대상 사용자 id (여러 번 지정 가능, 생략 시 전체)")
+        parser.add_argument('--user-chunk-size', type=int, default=200, help="한 번에 비교할 사용자 수")
+        parser.add_argument('--fix', action='store_true', help="불일치가 있는 사용자의 롤업을 다시 만듭니다.")
+
+    def handle(self, *args, **options):
+        mismatches = find_mismatches(user_ids=options['user_ids'], user_chunk_size=options['user_chunk_size'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("롤업이 원본과 일치합니다."))
+            return
+
+        for m in mismatches[:50]:
+            period_type, start, place, companion = m['key']
+            self.stdout.write(
+                f"user={m['user_id']} {period_type} {start} place={place!r} companion={companion!r}: "
+                f"expected={m['expected']} stored={m['stored']}"
+            )
+        if len(mismatches) > 50:
+            self.stdout.write(f"... 외 {len(mismatches) - 50}건")
+
+        if options['fix']:
+            user_ids = sorted({m['user_id'] for m in mismatches})
+            rebuild_rollups(user_ids=user_ids, user_chunk_size=options['user_chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f"{len(user_ids)}명의 롤업을 다시 만들었습니다."))
+            return
+
+        raise CommandError(f"불일치 {len(mismatches)}건을 발견했습니다. (--fix로 재구축)")
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from chat_app.models import ChatMessage
+from chat_app.services.conversation_summary import compact_user
+
+
+class Command(BaseCommand):
+    help = (
+        "최근 대화를 제외한 오래된 메시지를 사용자별 롤링 요약(ConversationSummary)에 접어 넣습니다. "
+        "--archive이면 요약된 메시지를 ArchivedChatMessage로 옮깁니다. (cron으로 실행하거나 --interval로 계속 실행)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="대상 사용자 id (여러 번 지정 가능, 생략 시 전체)")
+        parser.add_argument('--keep-turns', type=int, default=settings.CONVERSATION_KEEP_TURNS, help="요약하지 않고 남겨 둘 최근 턴 수")
+        parser.add_argument('--min-messages', type=int, default=settings.CONVERSATION_COMPACT_MIN_MESSAGES, help="이만큼 쌓였을 때만 요약합니다.")
+        parser.add_argument('--batch-messages', type=int, default=settings.CONVERSATION_COMPACT_BATCH_MESSAGES, help="LLM 요약 한 번에 넣을 메시지 수")
+        parser.add_argument('--archive', action='store_true', default=settings.CONVERSATION_ARCHIVE, help="요약된 메시지를 보관 테이블로 옮깁니다.")
+        parser.add_argument('--no-archive', action='store_false', dest='archive', help="요약만 하고 메시지는 그대로 둡니다.")
+        parser.add_argument('--interval', type=int, default=0, help="0보다 크면 이 간격(초)으로 계속 반복합니다.")
+
+    def handle(self, *args, **options):
+        while True:
+            self._run_once(options)
+            if options['interval'] <= 0:
+                return
+            time.sleep(options['interval'])
+
+    def _run_once(self, options):
+        keep_messages = max(options['keep_turns'], settings.CHAT_PROMPT_HISTORY_TURNS, 1) * 2
+
+        # 핫 테이블에 최근 대화 + 최소 묶음 이상이 쌓인 사용자만 대상으로 합니다.
+        users = ChatMessage.objects.values('user_id').annotate(n=Count('id')).filter(
+            n__gte=keep_messages + options['min_messages']
+        )
+        if options['user_ids']:
+            users = users.filter(user_id__in=options['user_ids'])
+
+        totals = {'users': 0, 'folded': 0, 'archived': 0, 'batches': 0}
+        for user_id in users.values_list('user_id', flat=True):
+            try:
+                result = compact_user(
+                    user_id,
+                    archive=options['archive'],
+                    keep_turns=options['keep_turns'],
+                    min_messages=options['min_messages'],
+                    batch_messages=options['batch_messages'],
+                )
+            except Exception as e:
+                # 요약에 실패해도 이미 커밋된 묶음은 유지되고, 다음 실행에서 이어서 처리합니다.
+                self.stderr.write(f"사용자 {user_id} 요약 실패: {e}")
+                continue
+
+            if result['folded']:
+                totals['users'] += 1
+                for key in ('folded', 'archived', 'batches'):
+                    totals[key] += result[key]
+                if options['verbosity'] >= 2:
+                    self.stdout.write(f"사용자 {user_id}: {result}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"사용자 {totals['users']}명, 메시지 {totals['folded']}개를 요약에 반영했습니다. "
+            f"(LLM 호출 {totals['batches']}회, 보관 {totals['archived']}개)"
+        ))
@@ -0,0 +1,45 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_app.services import memory_export
+
+
+class Command(BaseCommand):
+    help = (
+        "사용자의 대화/활동/속성/인간관계/방 데이터를 NDJSON으로 내보냅니다. "
+        "청크 단위로 읽으며 바로 쓰므로 기록 크기와 관계없이 메모리 사용량이 일정합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help="내보낼 사용자의 id 또는 username")
+        parser.add_argument('--output', '-o', default='-', help="출력 파일 경로 (기본값 '-': 표준 출력)")
+        parser.add_argument('--gzip', action='store_true', help="gzip으로 압축해서 씁니다.")
+        parser.add_argument('--chunk-size', type=int, help="한 번에 DB에서 읽을 행 수")
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['user']} if options['user'].isdigit() else {'username': options['user']}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"사용자를 찾을 수 없습니다: {options['user']}")
+
+        lines = memory_export.iter_export(user, options['chunk_size'])
+        chunks = memory_export.gzip_stream(lines) if options['gzip'] else (line.encode('utf-8') for line in lines)
+
+        to_stdout = options['output'] == '-'
+        out = sys.stdout.buffer if to_stdout else open(options['output'], 'wb')
+        written = 0
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if to_stdout:
+                out.flush()
+            else:
+                out.close()
+
+        if not to_stdout:
+            self.stderr.write(self.style.SUCCESS(f"{user.username}의 기억을 {options['output']}에 저장했습니다. ({written:,} bytes)"))
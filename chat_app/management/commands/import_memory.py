@@ -0,0 +1,42 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_app.services import memory_export
+
+
+class Command(BaseCommand):
+    help = (
+        "export_memory(또는 /api/memory/export/)로 내보낸 NDJSON(.gz 가능)을 사용자의 기억으로 가져옵니다. "
+        "종류별로 --batch-size개씩 bulk_create합니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="가져올 파일 경로 ('-'이면 표준 입력, gzip은 자동 인식)")
+        parser.add_argument('--user', required=True, help="데이터를 넣을 사용자의 id 또는 username")
+        parser.add_argument('--create-user', action='store_true', help="--user로 지정한 username이 없으면 새로 만듭니다.")
+        parser.add_argument('--batch-size', type=int, help="bulk_create 한 번에 넣을 행 수")
+
+    def handle(self, *args, **options):
+        target = options['user']
+        lookup = {'pk': target} if target.isdigit() else {'username': target}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            if not options['create_user'] or target.isdigit():
+                raise CommandError(f"사용자를 찾을 수 없습니다: {target}")
+            user = User.objects.create_user(username=target)
+
+        source = sys.stdin if options['path'] == '-' else memory_export.open_export(options['path'])
+        try:
+            counts = memory_export.import_lines(source, user, options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        summary = ", ".join(f"{record_type} {count}" for record_type, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"{user.username}에게 가져왔습니다: {summary}"))
+        self.stdout.write("벡터 검색에 반영하려면 `python manage.py ingest_vectors`를 실행하세요.")
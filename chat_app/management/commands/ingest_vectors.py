@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chat_app.services.ingestion import SOURCES, ingest_source, reset_cursor
+
+
+class Command(BaseCommand):
+    help = "새 ChatMessage/UserActivity/UserRelationship 행을 임베딩하여 벡터 저장소에 업서트합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', action='append', choices=sorted(SOURCES),
+            help="처리할 소스 (여러 번 지정 가능, 생략 시 전체)"
+        )
+        parser.add_argument('--chunk-size', type=int, help="한 번에 DB에서 읽고 커서를 전진시킬 행 수")
+        parser.add_argument('--embedding-batch-size', type=int, help="embeddings.create 한 번에 보낼 텍스트 수")
+        parser.add_argument('--upsert-batch-size', type=int, help="upsert 한 번에 보낼 벡터 수")
+        parser.add_argument('--workers', type=int, help="동시에 실행할 임베딩 요청 수")
+        parser.add_argument(
+            '--reset', action='store_true',
+            help="커서를 0으로 되돌려 처음부터 다시 적재합니다. (전체 백필)"
+        )
+
+    def handle(self, *args, **options):
+        sources = options['source'] or list(SOURCES)
+
+        def progress(source, processed, last_id):
+            self.stdout.write(f"[{source}] {processed}행 처리 (last_id={last_id})")
+
+        for source in sources:
+            if options['reset']:
+                reset_cursor(source)
+
+            try:
+                processed = ingest_source(
+                    source,
+                    chunk_size=options['chunk_size'],
+                    embedding_batch_size=options['embedding_batch_size'],
+                    upsert_batch_size=options['upsert_batch_size'],
+                    workers=options['workers'],
+                    progress=progress,
+                )
+            except EnvironmentError as e:
+                raise CommandError(str(e))
+
+            self.stdout.write(self.style.SUCCESS(f"[{source}] 완료: {processed}행"))
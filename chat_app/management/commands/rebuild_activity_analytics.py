@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from chat_app.services.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "UserActivity 원본에서 ActivityAnalytics 주/월/년 롤업을 처음부터 다시 계산합니다."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="대상 사용자 id (여러 번 지정 가능, 생략 시 전체)")
+        parser.add_argument('--user-chunk-size', type=int, default=200, help="한 트랜잭션에서 처리할 사용자 수")
+        parser.add_argument('--batch-size', type=int, default=1000, help="bulk_create 한 번에 저장할 행 수")
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(
+            user_ids=options['user_ids'],
+            user_chunk_size=options['user_chunk_size'],
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"롤업 {written}행을 다시 만들었습니다."))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat_app.services import keyword_index
+
+
+class Command(BaseCommand):
+    help = (
+        "ChatMessage/UserActivity로 키워드(BM25) 색인을 다시 만듭니다. "
+        "새로 저장되는 행은 signal로 자동 색인되므로, 처음 켤 때나 bulk 작업 후에만 실행하면 됩니다."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids', help="대상 사용자 id (여러 번 지정 가능, 생략 시 전체)")
+        parser.add_argument('--batch-size', type=int, default=500, help="한 번에 색인할 행 수")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = keyword_index.rebuild(options['user_ids'], options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"채팅 {counts['chat']}개, 활동 기록 {counts['activity']}개를 색인했습니다. ({elapsed:.1f}초)"
+        ))
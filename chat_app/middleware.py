@@ -0,0 +1,43 @@
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from .services import metrics
+
+
+def _finish(request, response, started: float, token):
+    """요청 전체 시간과 단계별 시간을 지표에 기록하고 Server-Timing 헤더를 붙입니다."""
+    total = time.perf_counter() - started
+    timings = metrics.finish_request(token)
+    timings.append(('total', total))
+    response['Server-Timing'] = metrics.server_timing_header(timings)
+
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match else 'unmatched'
+    metrics.observe('http_request_duration_seconds', total, view=view, method=request.method)
+    metrics.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+
+
+@sync_and_async_middleware
+def server_timing_middleware(get_response):
+    """
+    요청마다 단계별 소요 시간(metrics.timed)을 모아 Server-Timing 헤더로 돌려줍니다.
+    (예: Server-Timing: embedding;dur=120.3, vector_query;dur=45.0, llm;dur=830.1, total;dur=1010.2)
+    스트리밍 응답은 헤더가 먼저 나가므로 스트림 시작 전까지의 단계만 헤더에 들어갑니다.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = metrics.start_request()
+            started = time.perf_counter()
+            response = await get_response(request)
+            _finish(request, response, started, token)
+            return response
+    else:
+        def middleware(request):
+            token = metrics.start_request()
+            started = time.perf_counter()
+            response = get_response(request)
+            _finish(request, response, started, token)
+            return response
+    return middleware
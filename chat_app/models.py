@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+import copy
 import uuid
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -12,10 +13,65 @@ class UserProfile(models.Model):
     - user: Django의 기본 User 모델과 1:1 관계
     - affinity_score: AI '아이'와의 호감도 점수
     - memory: 사용자에 대한 정보를 JSON 형태로 저장 (예: {"facts": ["사용자는 고양이를 좋아한다"], "name": "홍길동"})
+    - response_cache_enabled: 시맨틱 응답 캐시 사용 여부 (opt-in)
+    - relationships_version: 인간관계가 바뀔 때마다 1씩 올라가는 번호 (언급 매처 재생성 판단용)
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     affinity_score = models.IntegerField(default=0, help_text="AI '아이'와의 호감도 점수")
     memory = models.JSONField(default=dict, help_text="사용자에 대한 기억 저장소")
+    response_cache_enabled = models.BooleanField(default=False, help_text="비슷한 질문에 캐시된 답변을 재사용할지 여부")
+    relationships_version = models.PositiveIntegerField(default=0, help_text="인간관계 변경 번호")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._record_loaded()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._record_loaded(fields)
+
+    def _tracked_values(self):
+        # 지연 로딩(deferred)된 필드는 건드리지 않도록 __dict__에 있는 값만 기록합니다.
+        return {
+            field.attname: copy.deepcopy(self.__dict__[field.attname])
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    def _record_loaded(self, fields=None):
+        """DB와 같아진 필드의 현재 값을 기록합니다. (fields가 없으면 전체)"""
+        current = self._tracked_values()
+        if fields is None:
+            self._loaded_values = current
+            return
+        attnames = {self._meta.get_field(name).attname for name in fields}
+        loaded = dict(getattr(self, '_loaded_values', {}))
+        loaded.update({attname: value for attname, value in current.items() if attname in attnames})
+        self._loaded_values = loaded
+
+    def get_dirty_fields(self):
+        """마지막으로 로드/저장한 이후 값이 바뀐 필드 이름 목록을 반환합니다. (DB에서 읽지 않은 객체는 전체)"""
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            attname for attname, value in self._tracked_values().items()
+            if attname not in loaded or loaded[attname] != value
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        이미 저장된 프로필은 바뀐 필드만 UPDATE하고, 바뀐 것이 없으면 쿼리를 실행하지 않습니다.
+        (update_fields를 직접 넘기면 그대로 따릅니다.)
+        """
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields is None:
+            dirty = self.get_dirty_fields()
+            if not dirty:
+                return
+            kwargs['update_fields'] = dirty
+        super().save(*args, **kwargs)
+        self._record_loaded(update_fields)
 
     def __str__(self):
         return f"{self.user.username}의 프로필"
@@ -27,13 +83,22 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """User가 저장될 때 UserProfile도 함께 저장합니다."""
-    try:
-        instance.profile.save()
-    except UserProfile.DoesNotExist:
-        # admin 등에서 profile이 없는 user를 다룰 때를 대비
-        UserProfile.objects.create(user=instance)
+def save_user_profile(sender, instance, created, **kwargs):
+    """
+    User가 저장될 때, 같은 User 객체를 통해 수정된 UserProfile이 있으면 바뀐 필드만 저장합니다.
+    (로그인 시 last_login 갱신처럼 프로필과 무관한 저장에서는 추가 쿼리가 없습니다.)
+    """
+    if created:
+        return  # create_user_profile에서 처리합니다.
+
+    # 한 번도 불러오지 않은 profile은 바뀌었을 리 없으므로 SELECT하지 않습니다.
+    related = User.profile.related
+    if not related.is_cached(instance):
+        return
+
+    profile = related.get_cached_value(instance)
+    if profile is not None and profile.get_dirty_fields():
+        profile.save()
 
 class ChatMessage(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -41,9 +106,130 @@ class ChatMessage(models.Model):
     is_user = models.BooleanField(default=True)  # True면 사용자 메시지, False면 AI 메시지
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # 채팅 기록 조회(사용자별 AI/사용자 메시지를 시간순으로 탐색)용 복합 인덱스
+            models.Index(fields=['user', 'is_user', 'timestamp'], name='chatmsg_user_isuser_ts_idx'),
+            # 채팅 기록 API의 키셋 페이지네이션(id 커서 + id 정렬)용
+            models.Index(fields=['user', 'is_user', 'id'], name='chatmsg_user_isuser_id_idx'),
+        ]
+
     def __str__(self):
         return f'{self.user.username}: {self.message[:50]}'
 
+class ConversationSummary(models.Model):
+    """
+    사용자별 롤링 대화 요약
+    오래된 메시지 쌍을 순서대로 접어 넣은 결과이며, 프롬프트에는 이 요약 + 최근 N턴만 들어갑니다.
+    (manage.py compact_conversations가 갱신합니다.)
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='conversation_summary')
+    summary = models.TextField(blank=True, default='')
+    last_message_id = models.BigIntegerField(default=0, help_text="요약에 반영된 마지막 ChatMessage ID")
+    message_count = models.PositiveIntegerField(default=0, help_text="요약에 반영된 메시지 수")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username}: 대화 요약 ({self.message_count}개 메시지)'
+
+class ArchivedChatMessage(models.Model):
+    """
+    요약에 반영된 뒤 ChatMessage에서 옮겨 온 메시지
+    핫 테이블(ChatMessage)과 그 인덱스를 작게 유지하면서, 채팅 기록 API에서는 계속 조회할 수 있습니다.
+    """
+    original_id = models.BigIntegerField(unique=True, help_text="원래 ChatMessage ID (채팅 기록 커서로 그대로 사용)")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_messages')
+    message = models.TextField()
+    is_user = models.BooleanField(default=True)
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_user', 'timestamp'], name='archmsg_user_isuser_ts_idx'),
+            models.Index(fields=['user', 'is_user', 'original_id'], name='archmsg_user_isuser_oid_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username}: {self.message[:50]} (보관됨)'
+
+class EmbeddingCacheEntry(models.Model):
+    """
+    쿼리 임베딩 캐시의 2단계(공유) 저장소
+    - key: 정규화한 텍스트 + 모델 + 차원의 sha256
+    - vector: float32 배열을 bytes로 저장
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=100)
+    dimensions = models.PositiveIntegerField()
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.model}({self.dimensions}) {self.key[:12]}"
+
+class IngestionCursor(models.Model):
+    """
+    벡터 인덱스 적재(ingest_vectors)의 소스별 진행 위치(high-water mark)
+    - source: 'chat', 'activity', 'relationship'
+    - last_id: 마지막으로 업서트까지 끝난 행의 id (이 값보다 큰 행만 다음 실행에서 처리)
+    """
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.last_id}"
+
+class IngestedRow(models.Model):
+    """
+    ingest_vectors의 커서보다 먼저(채팅 턴 직후 백그라운드에서) 업서트된 행
+    커서가 이 행을 지나갈 때 다시 임베딩하지 않고 건너뛰며, 지나간 기록은 지웁니다.
+    """
+    source = models.CharField(max_length=50)
+    row_id = models.BigIntegerField()
+
+    class Meta:
+        unique_together = ('source', 'row_id')
+
+    def __str__(self):
+        return f"{self.source}: {self.row_id}"
+
+class KeywordDocument(models.Model):
+    """
+    키워드(BM25) 검색용 역색인의 문서 (chat_app/services/keyword_index.py)
+    - source/source_id: 원본 행 ('chat' → ChatMessage, 'activity' → UserActivity)
+    - text: 벡터 적재와 같은 형식의 문서 텍스트 (검색 결과로 그대로 반환)
+    - length: 문서의 n-gram 수 (BM25 길이 정규화)
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='keyword_documents')
+    source = models.CharField(max_length=20)
+    source_id = models.BigIntegerField()
+    text = models.TextField()
+    length = models.PositiveIntegerField(default=0)
+    timestamp = models.DateTimeField(help_text="원본이 만들어진 시각 (현재 턴의 메시지를 검색에서 빼는 데 사용)")
+
+    class Meta:
+        unique_together = ('source', 'source_id')
+
+    def __str__(self):
+        return f"{self.user.username} [{self.source}:{self.source_id}] {self.text[:30]}"
+
+class KeywordPosting(models.Model):
+    """KeywordDocument에 나오는 n-gram 하나와 그 빈도 (user는 사용자별 조회를 위해 중복 저장)"""
+    document = models.ForeignKey(KeywordDocument, on_delete=models.CASCADE, related_name='postings')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    term = models.CharField(max_length=8)
+    tf = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'term'], name='kwposting_user_term_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} x{self.tf} → {self.document_id}"
+
 class UserAttribute(models.Model):
     """
     사용자의 불변의 속성(성격, MBTI, 생일, 신체 특징 등)를 저장하는 모델
@@ -124,6 +310,7 @@ class Room(models.Model):
     room_name = models.CharField(max_length=100, default="나만의 아늑한 방")
     background_style = models.CharField(max_length=50, default="modern_white") # Flutter에서 사용할 배경 이미지/색상 키
     last_updated = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=0) # 가구 일괄 변경 시 낙관적 동시성 제어에 사용
 
     def __str__(self):
         return f"{self.user.username}'s Room ({self.room_name})"
@@ -147,6 +334,7 @@ class FurnitureItem(models.Model):
     custom_name = models.CharField(max_length=100, blank=True, null=True) # 사용자가 지정한 가구 이름
     
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True) # 방 상태 ETag 계산에 사용 (가구별 버전)
 
     class Meta:
         # 최근에 생성된 아이템을 나중에 정렬하기 쉽게 합니다.
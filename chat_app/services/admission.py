@@ -0,0 +1,287 @@
+"""
+LLM/임베딩 호출 앞단의 입장 제어 (admission control)
+
+트래픽이 몰리면 모든 채팅 요청이 그대로 OpenAI로 나가서 공급자 rate limit에 걸리고,
+응답을 기다리는 요청이 쌓여 워커가 모두 막힙니다. 그래서 채팅 한 턴(임베딩 + LLM 호출)을 시작하기 전에
+두 가지를 확인하고, 넘치면 기다리지 않고 바로 429/503 + Retry-After로 돌려보냅니다.
+
+1. 사용자별 토큰 버킷 (공유 캐시, 모든 워커 공통)
+   LLM_USER_RATE_PER_MINUTE 속도로 채워지고 최대 LLM_USER_BURST개까지 모입니다. 비어 있으면 429.
+   (캐시 읽기-쓰기 사이의 경쟁으로 동시에 들어온 요청 몇 개가 더 통과할 수는 있습니다.)
+2. 전체 워커 공통 동시 실행 제한 (공유 캐시의 슬롯 키)
+   모든 워커를 합쳐 동시에 LLM_MAX_CONCURRENCY개까지 실행하고, 나머지는 최대 LLM_QUEUE_MAX개까지 줄을 서서
+   LLM_QUEUE_TIMEOUT초 동안 기다립니다. 줄이 꽉 찼거나 기다리다 시간이 지나면 503.
+   실행 슬롯(admission:slot:<i>)과 대기 자리(admission:queue:<j>)를 잠금 전용 캐시(locks.lock_cache())에
+   add로 잡고 반납할 때 지웁니다. (기본 캐시는 add가 원자적이지 않고 잡힌 슬롯을 임의로 버릴 수 있습니다.)
+   gunicorn sync 워커처럼 프로세스마다 요청을 하나씩만 처리해도 제한이 걸리며, 프로세스가 죽어
+   반납하지 못한 슬롯은 LLM_SLOT_TTL초 뒤에 풀립니다. 대기자는 캐시를 폴링하므로 순서(FIFO)는 보장하지 않습니다.
+
+실행 중/대기 중 요청 수와 거절 횟수는 metrics로 /metrics/에 노출됩니다.
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .locks import lock_cache
+
+# 대기자의 폴링 간격 (초): 처음엔 짧게, 점점 늘려서 최대값까지
+POLL_INITIAL = 0.02
+POLL_MAX = 0.2
+
+
+class AdmissionRejected(Exception):
+    """요청을 받아들일 수 없습니다. status_code와 retry_after(초)로 응답합니다."""
+
+    def __init__(self, status_code: int, retry_after: int, reason: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+        self.message = message
+
+
+def _reject(status_code: int, retry_after: float, reason: str, message: str) -> AdmissionRejected:
+    metrics.inc('admission_rejected_total', reason=reason)
+    return AdmissionRejected(status_code, max(1, math.ceil(retry_after)), reason, message)
+
+
+# ----------------------------------------------------
+# 사용자별 토큰 버킷
+# ----------------------------------------------------
+def _bucket_key(user_id: int) -> str:
+    return f"admission:bucket:{user_id}"
+
+
+def take_token(user_id: Optional[int]):
+    """사용자의 버킷에서 토큰 하나를 꺼냅니다. 비어 있으면 429 AdmissionRejected를 던집니다."""
+    rate = settings.LLM_USER_RATE_PER_MINUTE / 60.0
+    burst = settings.LLM_USER_BURST
+    if user_id is None or rate <= 0 or burst <= 0:
+        return
+
+    now = time.time()
+    tokens, updated_at = cache.get(_bucket_key(user_id)) or (burst, now)
+    tokens = min(burst, tokens + (now - updated_at) * rate)
+    if tokens < 1:
+        raise _reject(
+            429, (1 - tokens) / rate, 'rate_limited',
+            "메시지를 너무 빠르게 보내고 있습니다. 잠시 후 다시 시도해 주세요.",
+        )
+    # 버킷이 가득 찰 때까지만 보관하면 충분합니다.
+    cache.set(_bucket_key(user_id), (tokens - 1, now), timeout=math.ceil(burst / rate) + 1)
+
+
+# ----------------------------------------------------
+# 전체 워커 공통 동시 실행 제한 + 대기열
+# ----------------------------------------------------
+Lease = Tuple[str, str]  # (슬롯 키, 토큰)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, prefix: str = 'admission'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # 이 프로세스가 잡고 있는 슬롯/대기 자리 수 (지표용, /metrics/에서 워커 합계로 집계)
+        self.active = 0
+        self.waiting = 0
+
+    def _slot_keys(self) -> List[str]:
+        return [f"{self.prefix}:slot:{i}" for i in range(settings.LLM_MAX_CONCURRENCY)]
+
+    def _queue_keys(self) -> List[str]:
+        return [f"{self.prefix}:queue:{i}" for i in range(settings.LLM_QUEUE_MAX)]
+
+    def _count(self, active: int = 0, waiting: int = 0):
+        with self._lock:
+            self.active += active
+            self.waiting += waiting
+            metrics.set_gauge('admission_inflight', self.active)
+            metrics.set_gauge('admission_queue_depth', self.waiting)
+
+    @staticmethod
+    def _free_keys(keys: List[str], taken) -> List[str]:
+        # 여러 워커가 같은 자리를 두고 다투지 않도록 빈 자리를 섞어서 시도합니다.
+        free = [key for key in keys if key not in taken]
+        random.shuffle(free)
+        return free
+
+    def _claim(self, keys: List[str], token: str, timeout: int) -> Optional[Lease]:
+        if not keys:
+            return None
+        slots = lock_cache()
+        for key in self._free_keys(keys, slots.get_many(keys)):
+            if slots.add(key, token, timeout=timeout):
+                return key, token
+        return None
+
+    async def _aclaim(self, keys: List[str], token: str, timeout: int) -> Optional[Lease]:
+        if not keys:
+            return None
+        slots = lock_cache()
+        for key in self._free_keys(keys, await slots.aget_many(keys)):
+            if await slots.aadd(key, token, timeout=timeout):
+                return key, token
+        return None
+
+    @staticmethod
+    def _free(lease: Lease):
+        # 만료되어 다른 요청이 잡은 슬롯은 지우지 않습니다.
+        key, token = lease
+        slots = lock_cache()
+        if slots.get(key) == token:
+            slots.delete(key)
+
+    def _queue_full(self) -> AdmissionRejected:
+        return _reject(
+            503, settings.LLM_QUEUE_TIMEOUT, 'queue_full',
+            "요청이 많아 지금은 처리할 수 없습니다. 잠시 후 다시 시도해 주세요.",
+        )
+
+    def _timeout_error(self) -> AdmissionRejected:
+        return _reject(
+            503, settings.LLM_QUEUE_TIMEOUT, 'queue_timeout',
+            "요청이 많아 대기 시간이 초과되었습니다. 잠시 후 다시 시도해 주세요.",
+        )
+
+    def acquire(self) -> Lease:
+        started = time.perf_counter()
+        token = uuid.uuid4().hex
+        lease = self._claim(self._slot_keys(), token, settings.LLM_SLOT_TTL)
+        if lease is None:
+            place = self._claim(self._queue_keys(), token, settings.LLM_QUEUE_TIMEOUT + 1)
+            if place is None:
+                raise self._queue_full()
+            self._count(waiting=1)
+            try:
+                deadline = time.monotonic() + settings.LLM_QUEUE_TIMEOUT
+                delay = POLL_INITIAL
+                while lease is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timeout_error()
+                    time.sleep(min(delay, remaining))
+                    delay = min(delay * 2, POLL_MAX)
+                    lease = self._claim(self._slot_keys(), token, settings.LLM_SLOT_TTL)
+            finally:
+                self._free(place)
+                self._count(waiting=-1)
+        self._count(active=1)
+        metrics.observe('admission_queue_wait_seconds', time.perf_counter() - started)
+        return lease
+
+    async def aacquire(self) -> Lease:
+        """acquire의 비동기 버전입니다."""
+        started = time.perf_counter()
+        token = uuid.uuid4().hex
+        lease = await self._aclaim(self._slot_keys(), token, settings.LLM_SLOT_TTL)
+        if lease is None:
+            place = await self._aclaim(self._queue_keys(), token, settings.LLM_QUEUE_TIMEOUT + 1)
+            if place is None:
+                raise self._queue_full()
+            self._count(waiting=1)
+            try:
+                deadline = time.monotonic() + settings.LLM_QUEUE_TIMEOUT
+                delay = POLL_INITIAL
+                while lease is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._timeout_error()
+                    await asyncio.sleep(min(delay, remaining))
+                    delay = min(delay * 2, POLL_MAX)
+                    lease = await self._aclaim(self._slot_keys(), token, settings.LLM_SLOT_TTL)
+            finally:
+                await sync_to_async(self._free)(place)
+                self._count(waiting=-1)
+        self._count(active=1)
+        metrics.observe('admission_queue_wait_seconds', time.perf_counter() - started)
+        return lease
+
+    def release(self, lease: Lease):
+        self._free(lease)
+        self._count(active=-1)
+
+
+limiter = ConcurrencyLimiter()
+
+
+# ----------------------------------------------------
+# 뷰에서 쓰는 진입점
+# ----------------------------------------------------
+class Ticket:
+    """입장 허가. release()는 여러 번 불러도 한 번만 반납합니다."""
+
+    def __init__(self, lease: Lease):
+        self._lease = lease
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            limiter.release(self._lease)
+
+
+def acquire(user_id: Optional[int]) -> Ticket:
+    take_token(user_id)
+    return Ticket(limiter.acquire())
+
+
+async def aacquire(user_id: Optional[int]) -> Ticket:
+    await sync_to_async(take_token)(user_id)
+    return Ticket(await limiter.aacquire())
+
+
+@contextmanager
+def admit(user_id: Optional[int]):
+    ticket = acquire(user_id)
+    try:
+        yield
+    finally:
+        ticket.release()
+
+
+@asynccontextmanager
+async def aadmit(user_id: Optional[int]):
+    ticket = await aacquire(user_id)
+    try:
+        yield
+    finally:
+        ticket.release()
+
+
+class ReleasingStream:
+    """
+    스트리밍 응답이 끝나거나 닫힐 때 입장 허가를 반납하는 이터레이터입니다.
+    (StreamingHttpResponse는 연결이 끊기면 close()를 부르지만, 시작하지 않은 제너레이터의 finally는 실행되지 않습니다.)
+    """
+
+    def __init__(self, ticket: Ticket, events: Iterator[str]):
+        self._ticket = ticket
+        self._events = events
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._events)
+        except BaseException:
+            self._ticket.release()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._events, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._ticket.release()
@@ -0,0 +1,179 @@
+"""
+UserActivity -> ActivityAnalytics(주/월/년 × 장소 × 동행인 방문 횟수) 롤업 관리
+
+- 증분 반영: UserActivity가 추가/수정/삭제될 때마다 해당하는 세 기간 행의 count만
+  F() 식으로 원자적으로 증감합니다. (signals.py가 커밋 후 백그라운드 작업자에 넘겨 호출)
+- 재구축: rebuild_rollups()가 사용자 묶음 단위로 원본에서 다시 계산해 일괄 저장합니다.
+- 검사: find_mismatches()가 롤업과 원본 데이터를 비교합니다.
+
+장소나 날짜가 없는 활동은 집계하지 않으며, 동행인이 없으면 companion을 빈 문자열로 저장합니다.
+(NULL은 unique_together에서 서로 다른 값으로 취급되어 중복 행이 생길 수 있기 때문입니다.)
+"""
+from collections import Counter
+from datetime import date, timedelta
+from functools import reduce
+from operator import or_
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from ..models import ActivityAnalytics, UserActivity
+
+PERIOD_TYPES = ('weekly', 'monthly', 'yearly')
+
+# (period_type, period_start_date, place, companion)
+RollupKey = Tuple[str, date, str, str]
+
+
+def period_starts(day: date) -> List[Tuple[str, date]]:
+    """날짜가 속한 주(월요일 시작)/월/년의 시작일을 반환합니다."""
+    return [
+        ('weekly', day - timedelta(days=day.weekday())),
+        ('monthly', day.replace(day=1)),
+        ('yearly', day.replace(month=1, day=1)),
+    ]
+
+
+def rollup_keys(activity_date: Optional[date], place: Optional[str], companion: Optional[str]) -> List[RollupKey]:
+    place = (place or '').strip()
+    if not activity_date or not place:
+        return []
+    companion = (companion or '').strip()
+    return [(period_type, start, place, companion) for period_type, start in period_starts(activity_date)]
+
+
+def activity_rollup_keys(activity: UserActivity) -> List[RollupKey]:
+    return rollup_keys(activity.activity_date, activity.place, activity.companion)
+
+
+def _keys_filter(keys: Iterable[RollupKey]) -> Q:
+    return reduce(or_, (
+        Q(period_type=period_type, period_start_date=start, place=place, companion=companion)
+        for period_type, start, place, companion in keys
+    ))
+
+
+def apply_delta(user_id: int, keys: List[RollupKey], delta: int):
+    """keys에 해당하는 롤업 행의 count를 delta만큼 한 번의 UPDATE로 증감합니다."""
+    if not keys or not delta:
+        return
+
+    with transaction.atomic():
+        if delta > 0:
+            # 없는 행만 count=0으로 먼저 만들고 (이미 있으면 무시), 아래 UPDATE로 함께 증가시킵니다.
+            ActivityAnalytics.objects.bulk_create(
+                [
+                    ActivityAnalytics(
+                        user_id=user_id, period_type=period_type, period_start_date=start,
+                        place=place, companion=companion, count=0,
+                    )
+                    for period_type, start, place, companion in keys
+                ],
+                ignore_conflicts=True,
+            )
+
+        rows = ActivityAnalytics.objects.filter(user_id=user_id).filter(_keys_filter(keys))
+        if delta > 0:
+            rows.update(count=F('count') + delta)
+        else:
+            rows.update(count=Case(
+                When(count__gt=-delta, then=F('count') + delta),
+                default=0,
+            ))
+            rows.filter(count=0).delete()
+
+
+def apply_change(user_id: int, old_keys: List[RollupKey], new_keys: List[RollupKey]):
+    """활동 한 건이 old_keys -> new_keys로 바뀐 것을 반영합니다. (추가: old 없음, 삭제: new 없음)"""
+    if old_keys == new_keys:
+        return
+    # 한 트랜잭션으로 묶어 실패 후 재시도해도 한쪽만 두 번 반영되지 않게 합니다.
+    with transaction.atomic():
+        apply_delta(user_id, old_keys, -1)
+        apply_delta(user_id, new_keys, 1)
+
+
+# ----------------------------------------------------
+# 재구축 / 검사
+# ----------------------------------------------------
+def expected_rollups(user_ids: List[int]) -> Dict[Tuple[int, RollupKey], int]:
+    """user_ids의 UserActivity 원본에서 기대되는 롤업 값을 계산합니다."""
+    counts: Counter = Counter()
+    activities = (
+        UserActivity.objects.filter(user_id__in=user_ids, activity_date__isnull=False)
+        .values_list('user_id', 'activity_date', 'place', 'companion')
+        .iterator(chunk_size=5000)
+    )
+    for user_id, activity_date, place, companion in activities:
+        for key in rollup_keys(activity_date, place, companion):
+            counts[(user_id, key)] += 1
+    return counts
+
+
+def stored_rollups(user_ids: List[int]) -> Dict[Tuple[int, RollupKey], int]:
+    rows = (
+        ActivityAnalytics.objects.filter(user_id__in=user_ids, count__gt=0)
+        .values_list('user_id', 'period_type', 'period_start_date', 'place', 'companion', 'count')
+        .iterator(chunk_size=5000)
+    )
+    return {
+        (user_id, (period_type, start, place, companion or '')): count
+        for user_id, period_type, start, place, companion, count in rows
+    }
+
+
+def _user_id_chunks(user_ids: Optional[List[int]], chunk_size: int) -> Iterable[List[int]]:
+    if user_ids is None:
+        # 활동이 모두 지워져 롤업만 남은 사용자도 포함합니다.
+        user_ids = sorted(
+            set(UserActivity.objects.values_list('user_id', flat=True).distinct())
+            | set(ActivityAnalytics.objects.values_list('user_id', flat=True).distinct())
+        )
+    for start in range(0, len(user_ids), chunk_size):
+        yield user_ids[start:start + chunk_size]
+
+
+def rebuild_rollups(
+    user_ids: Optional[List[int]] = None, user_chunk_size: int = 200, batch_size: int = 1000
+    ) -> int:
+    """
+    롤업을 원본에서 다시 계산합니다. (user_ids가 없으면 전체 사용자)
+    사용자 묶음마다 하나의 트랜잭션으로 기존 행을 지우고 bulk_create로 일괄 저장합니다.
+    저장한 행 수를 반환합니다.
+    """
+    written = 0
+    for chunk in _user_id_chunks(user_ids, user_chunk_size):
+        expected = expected_rollups(chunk)
+        with transaction.atomic():
+            ActivityAnalytics.objects.filter(user_id__in=chunk).delete()
+            ActivityAnalytics.objects.bulk_create(
+                [
+                    ActivityAnalytics(
+                        user_id=user_id, period_type=period_type, period_start_date=start,
+                        place=place, companion=companion, count=count,
+                    )
+                    for (user_id, (period_type, start, place, companion)), count in expected.items()
+                ],
+                batch_size=batch_size,
+            )
+        written += len(expected)
+    return written
+
+
+def find_mismatches(user_ids: Optional[List[int]] = None, user_chunk_size: int = 200) -> List[Dict]:
+    """롤업과 원본이 다른 항목을 [{'user_id', 'key', 'expected', 'stored'}] 형태로 반환합니다."""
+    mismatches = []
+    for chunk in _user_id_chunks(user_ids, user_chunk_size):
+        expected = expected_rollups(chunk)
+        stored = stored_rollups(chunk)
+        for user_key in expected.keys() | stored.keys():
+            if expected.get(user_key, 0) != stored.get(user_key, 0):
+                user_id, key = user_key
+                mismatches.append({
+                    'user_id': user_id,
+                    'key': key,
+                    'expected': expected.get(user_key, 0),
+                    'stored': stored.get(user_key, 0),
+                })
+    return mismatches
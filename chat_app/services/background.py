@@ -0,0 +1,182 @@
+"""
+응답을 보낸 뒤에 해도 되는 부수 작업을 처리하는 프로세스 내 백그라운드 작업자
+
+채팅 한 턴의 응답에는 두 메시지의 저장만 필요합니다. 새 메시지의 벡터 업서트나 활동 통계 갱신처럼
+실패해도 나중에 다시 맞출 수 있는 작업은 submit()으로 넘겨 요청 스레드가 기다리지 않게 합니다.
+
+- 워커 프로세스마다 데몬 스레드 하나가 큐(최대 BACKGROUND_QUEUE_SIZE개)를 순서대로 처리합니다.
+  큐가 꽉 차면 작업을 버리지 않고 호출한 스레드에서 바로 실행합니다. (배압)
+- 실패한 작업은 BACKGROUND_RETRY_DELAY초부터 두 배씩 늘려 최대 BACKGROUND_MAX_ATTEMPTS번까지 다시 시도합니다.
+- 프로세스가 정상 종료될 때(atexit) 남은 작업을 BACKGROUND_SHUTDOWN_TIMEOUT초 동안 마저 처리합니다.
+  이때 재시도 대기 중인 작업은 기다리지 않고 바로 한 번 더 실행합니다.
+- BACKGROUND_TASKS_ENABLED=false이면 submit()이 그 자리에서 바로 실행합니다.
+
+프로세스가 강제 종료되면 큐에 남은 작업은 사라집니다. 벡터는 ingest_vectors, 통계는
+check_activity_analytics / rebuild_activity_analytics가 나중에 원본에서 다시 맞춥니다.
+"""
+import atexit
+import heapq
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from . import metrics
+
+
+@dataclass
+class Task:
+    name: str
+    fn: Callable
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    attempts: int = 0
+
+
+class BackgroundWorker:
+    def __init__(self):
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # 재시도 대기 중인 작업 [(실행 시각, 순번, 작업)] (작업자 스레드만 다룹니다)
+        self._delayed: List[Tuple[float, int, Task]] = []
+        self._sequence = itertools.count()
+        self._pending = 0 # 큐 + 재시도 대기 + 실행 중인 작업 수
+        self._idle = threading.Condition()
+        self._stopping = False
+
+    # ------------------------------------------------
+    # 제출
+    # ------------------------------------------------
+    def submit(self, name: str, fn: Callable, *args, **kwargs):
+        task = Task(name, fn, args, kwargs)
+        if not settings.BACKGROUND_TASKS_ENABLED or self._stopping:
+            self._run_inline(task)
+            return
+
+        self._ensure_started()
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            with self._idle:
+                self._pending -= 1
+            metrics.inc('background_tasks_total', task=name, result='inline')
+            self._run_inline(task)
+            return
+        metrics.set_gauge('background_queue_depth', self._queue.qsize())
+
+    def _run_inline(self, task: Task):
+        try:
+            task.fn(*task.args, **task.kwargs)
+        except Exception as e:
+            metrics.inc('background_tasks_total', task=task.name, result='failed')
+            print(f"[Background] '{task.name}' 작업 실패: {e}")
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if self._queue is None:
+                self._queue = queue.Queue(maxsize=settings.BACKGROUND_QUEUE_SIZE)
+                atexit.register(self.shutdown)
+            self._thread = threading.Thread(target=self._loop, name='chat-background', daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------
+    # 작업자 스레드
+    # ------------------------------------------------
+    def _loop(self):
+        try:
+            while True:
+                timeout = None
+                if self._delayed:
+                    timeout = max(0.0, self._delayed[0][0] - time.monotonic())
+                try:
+                    task = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    task = heapq.heappop(self._delayed)[2]
+                if task is None: # shutdown 신호
+                    return
+                metrics.set_gauge('background_queue_depth', self._queue.qsize())
+                self._execute(task)
+        finally:
+            connections.close_all()
+
+    def _execute(self, task: Task, final: bool = False):
+        close_old_connections()
+        task.attempts += 1
+        try:
+            task.fn(*task.args, **task.kwargs)
+        except Exception as e:
+            if task.attempts < settings.BACKGROUND_MAX_ATTEMPTS and not final:
+                delay = settings.BACKGROUND_RETRY_DELAY * (2 ** (task.attempts - 1))
+                heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), task))
+                metrics.inc('background_tasks_total', task=task.name, result='retry')
+                print(f"[Background] '{task.name}' 작업 실패, {delay:.1f}초 뒤 다시 시도합니다. ({task.attempts}회): {e}")
+                return
+            metrics.inc('background_tasks_total', task=task.name, result='failed')
+            print(f"[Background] '{task.name}' 작업을 {task.attempts}회 시도했지만 실패했습니다: {e}")
+        else:
+            metrics.inc('background_tasks_total', task=task.name, result='ok')
+        finally:
+            close_old_connections()
+        self._done()
+
+    def _done(self):
+        with self._idle:
+            self._pending -= 1
+            if self._pending <= 0:
+                self._idle.notify_all()
+
+    # ------------------------------------------------
+    # 대기 / 종료
+    # ------------------------------------------------
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """제출된 작업(재시도 포함)이 모두 끝날 때까지 기다립니다. 시간 안에 끝나면 True"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """남은 작업을 처리하고 작업자 스레드를 멈춥니다. (atexit에서 호출)"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        timeout = settings.BACKGROUND_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._stopping = True
+        try:
+            # 큐가 꽉 차 있으면 자리가 날 때까지만 기다립니다. (종료가 무한히 막히지 않도록)
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            print(f"[Background] 종료 시간 안에 큐가 비지 않았습니다. 남은 작업 {self._pending}개를 버립니다.")
+            return
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        if self._thread.is_alive():
+            print(f"[Background] 종료 시간 안에 끝나지 않은 작업이 {self._pending}개 있습니다.")
+            return
+
+        # 재시도를 기다리던 작업은 기다리지 않고 마지막으로 한 번 더 실행합니다.
+        while self._delayed:
+            self._execute(heapq.heappop(self._delayed)[2], final=True)
+        connections.close_all()
+
+
+worker = BackgroundWorker()
+
+
+def submit(name: str, fn: Callable, *args, **kwargs):
+    worker.submit(name, fn, *args, **kwargs)
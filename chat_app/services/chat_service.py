@@ -0,0 +1,308 @@
+"""
+채팅 한 턴(사용자 메시지 저장 → 문서 검색 → LLM 응답 생성 → AI 메시지 저장)을 처리하는 서비스
+
+동기 경로(process_chat_interaction, stream_chat_interaction)와
+ASGI용 비동기 경로(aprocess_chat_interaction)가 같은 프롬프트 구성을 사용합니다.
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import ChatMessage
+from ..views import (
+    LLM_ERROR_MESSAGE,
+    agenerate_response,
+    aget_query_embedding,
+    asearch_documents,
+    format_sse,
+    generate_response,
+    generate_response_stream,
+    get_query_embedding,
+    search_documents,
+)
+from . import background, ingestion, metrics, response_cache
+from .mention_tagger import tag_mentions
+from .user_context import build_user_context, get_user_context
+
+
+# ----------------------------------------------------
+# 프롬프트 컨텍스트 (최근 대화 + 캐시된 사용자 컨텍스트/이전 대화 요약)
+# ----------------------------------------------------
+def _recent_history_queryset(user, before: datetime):
+    limit = settings.CHAT_PROMPT_HISTORY_TURNS * 2
+    return (
+        ChatMessage.objects.filter(user=user, timestamp__lt=before)
+        .order_by('-timestamp', '-id')
+        .only('message', 'is_user')[:limit]
+    )
+
+
+def _history_to_messages(recent_messages: List[ChatMessage]) -> List[Dict]:
+    """최신 순으로 가져온 메시지를 LLM 메시지 형식(오래된 순)으로 바꿉니다."""
+    return [
+        {"role": "user" if msg.is_user else "assistant", "content": msg.message}
+        for msg in reversed(recent_messages)
+    ]
+
+
+def load_recent_history(user, before: datetime) -> List[Dict]:
+    return _history_to_messages(list(_recent_history_queryset(user, before)))
+
+
+async def aload_recent_history(user, before: datetime) -> List[Dict]:
+    return _history_to_messages([msg async for msg in _recent_history_queryset(user, before)])
+
+
+async def aget_user_context(user) -> Dict:
+    return await sync_to_async(get_user_context)(user.id)
+
+
+def prompt_user_context(context: Dict, user_id: int, user_message_text: str) -> str:
+    """메시지에서 언급된 인간관계를 찾아 우선 포함한 사용자 컨텍스트 블록을 만듭니다."""
+    return build_user_context(
+        context, user_message_text, boost_serial_codes=tag_mentions(user_id, user_message_text)
+    )
+
+
+# ----------------------------------------------------
+# 시맨틱 응답 캐시
+# ----------------------------------------------------
+def lookup_cached_response(
+    context: Dict, user_id: int, query: str, retrieved_docs: List[str]
+    ) -> Tuple[Optional[str], Optional[Tuple]]:
+    """
+    응답 캐시를 조회합니다. (캐시 미사용/실패 시 (None, None))
+    적중하지 않았을 때 store_cached_response에 넘길 캐시 항목 정보도 함께 반환합니다.
+    """
+    if not response_cache.is_enabled(context['response_cache_enabled']):
+        return None, None
+    try:
+        query_embedding = get_query_embedding(query)
+        context_fp = response_cache.context_fingerprint(context)
+        cached = response_cache.lookup(user_id, query_embedding, query, retrieved_docs, context_fp)
+        return cached, (query_embedding, query, retrieved_docs, context_fp)
+    except Exception as e:
+        print(f"[Chat Service] 응답 캐시 조회 실패: {e}")
+        return None, None
+
+
+def store_cached_response(cache_entry: Optional[Tuple], user_id: int, bot_message: str):
+    if cache_entry is None or bot_message == LLM_ERROR_MESSAGE:
+        return
+    query_embedding, query, retrieved_docs, context_fp = cache_entry
+    try:
+        response_cache.store(user_id, query_embedding, query, retrieved_docs, context_fp, bot_message)
+    except Exception as e:
+        print(f"[Chat Service] 응답 캐시 저장 실패: {e}")
+
+
+async def alookup_cached_response(
+    context: Dict, user_id: int, query: str, retrieved_docs: List[str]
+    ) -> Tuple[Optional[str], Optional[Tuple]]:
+    """lookup_cached_response의 비동기 버전입니다."""
+    if not response_cache.is_enabled(context['response_cache_enabled']):
+        return None, None
+    try:
+        query_embedding = await aget_query_embedding(query)
+        context_fp = response_cache.context_fingerprint(context)
+        cached = await sync_to_async(response_cache.lookup)(user_id, query_embedding, query, retrieved_docs, context_fp)
+        return cached, (query_embedding, query, retrieved_docs, context_fp)
+    except Exception as e:
+        print(f"[Chat Service] 응답 캐시 조회 실패: {e}")
+        return None, None
+
+
+# ----------------------------------------------------
+# 응답 후 처리 (백그라운드 작업자)
+# ----------------------------------------------------
+def defer_post_turn(user_msg: ChatMessage, ai_msg: ChatMessage):
+    """
+    응답에 필요 없는 턴 이후 작업을 백그라운드 작업자에 넘깁니다.
+    새 두 메시지를 바로 벡터 저장소에 넣어 다음 턴부터 검색되도록 합니다. (ingest_vectors와 같은 벡터 id)
+    두 메시지는 다음 턴들의 최근 대화로 프롬프트에 들어가므로 검색 결과 캐시는 비우지 않습니다. (live=True)
+    """
+    if settings.CHAT_VECTOR_UPSERT:
+        background.submit('chat_vector_upsert', ingestion.upsert_rows, 'chat', [user_msg, ai_msg], live=True)
+
+
+# ----------------------------------------------------
+# 동기 경로
+# ----------------------------------------------------
+def process_chat_interaction(request, user_message_text: str) -> Dict:
+    """
+    사용자 메시지에 대한 AI 응답을 생성하고 두 메시지를 모두 RDB에 저장합니다.
+    저장한 두 메시지 객체(user_message, ai_message)도 함께 반환하므로 호출 측에서 다시 조회할 필요가 없습니다.
+    실패 시 bot_message_id 없이 오류 내용을 bot_message로 반환합니다.
+    """
+    user = request.user
+
+    try:
+        started_at = timezone.now()
+        with metrics.timed('history'):
+            history = load_recent_history(user, started_at)
+        with metrics.timed('user_context'):
+            context = get_user_context(user.id)
+
+        # 1. 사용자 메시지 저장
+        with metrics.timed('db_write'):
+            user_msg = ChatMessage.objects.create(user=user, message=user_message_text, is_user=True)
+
+        # 2. Pinecone 검색 + LLM 응답 생성 (비슷한 질문의 캐시된 답변이 있으면 재사용)
+        retrieved_documents = search_documents(
+            query=user_message_text,
+            user_id=user.id,
+            n_results=5,
+            before=started_at
+        )
+        bot_message, cache_entry = lookup_cached_response(context, user.id, user_message_text, retrieved_documents)
+        if bot_message is None:
+            bot_message = generate_response(
+                user_message_text, retrieved_documents, history,
+                prompt_user_context(context, user.id, user_message_text),
+                context.get('conversation_summary', ''),
+            )
+            store_cached_response(cache_entry, user.id, bot_message)
+
+        # 3. AI 메시지 저장
+        with metrics.timed('db_write'):
+            ai_msg = ChatMessage.objects.create(user=user, message=bot_message, is_user=False)
+    except Exception as e:
+        print(f"[Chat Service] 채팅 처리 중 오류 발생: {e}")
+        return {'bot_message_id': None, 'bot_message': str(e)}
+
+    defer_post_turn(user_msg, ai_msg)
+    return {
+        'user_message_id': user_msg.id,
+        'user_message': user_msg,
+        'bot_message_id': ai_msg.id,
+        'bot_message': bot_message,
+        'ai_message': ai_msg,
+    }
+
+
+def stream_chat_interaction(user, user_message_text: str) -> Iterator[str]:
+    """
+    process_chat_interaction의 스트리밍 버전입니다. SSE 메시지를 yield합니다.
+    - data: {"delta": "..."}  생성되는 토큰 조각
+    - event: done             저장된 메시지 쌍 (ChatPairSerializer 형식)
+    - event: error            오류 ({"error": "..."})
+
+    사용자 메시지는 스트림 시작 전에, AI 메시지는 스트림이 끝난 뒤 전체 텍스트로 저장합니다.
+    클라이언트가 도중에 연결을 끊으면 그때까지 생성된 답변을 AI 메시지로 저장합니다.
+    """
+    from ..api.serializers import ChatPairSerializer
+
+    started_at = timezone.now()
+    with metrics.timed('history'):
+        history = load_recent_history(user, started_at)
+    with metrics.timed('user_context'):
+        context = get_user_context(user.id)
+
+    with metrics.timed('db_write'):
+        user_msg = ChatMessage.objects.create(user=user, message=user_message_text, is_user=True)
+
+    retrieved_documents = search_documents(
+        query=user_message_text,
+        user_id=user.id,
+        n_results=5,
+        before=started_at
+    )
+
+    bot_message, cache_entry = lookup_cached_response(context, user.id, user_message_text, retrieved_documents)
+    chunks = []
+    ai_msg = None
+
+    def save_reply(text: str) -> ChatMessage:
+        with metrics.timed('db_write'):
+            saved = ChatMessage.objects.create(user=user, message=text, is_user=False)
+        defer_post_turn(user_msg, saved)
+        return saved
+
+    try:
+        if bot_message is not None:
+            # 캐시 적중 시 전체 답변을 한 조각으로 보냅니다.
+            chunks.append(bot_message)
+            yield format_sse({'delta': bot_message})
+        else:
+            try:
+                for delta in generate_response_stream(
+                    user_message_text, retrieved_documents, history,
+                    prompt_user_context(context, user.id, user_message_text),
+                    context.get('conversation_summary', ''),
+                ):
+                    chunks.append(delta)
+                    yield format_sse({'delta': delta})
+            except Exception as e:
+                print(f"[Chat Service] LLM 스트리밍 중 오류 발생: {e}")
+                chunks = []
+                yield format_sse({'error': LLM_ERROR_MESSAGE}, event='error')
+                return
+
+            bot_message = ''.join(chunks).strip()
+            store_cached_response(cache_entry, user.id, bot_message)
+        ai_msg = save_reply(bot_message)
+    finally:
+        # 클라이언트가 스트림 도중 연결을 끊으면(GeneratorExit) 그때까지 받은 답변을 저장해
+        # 사용자 메시지만 남고 답변이 사라지지 않게 합니다.
+        partial = ''.join(chunks).strip()
+        if ai_msg is None and partial:
+            try:
+                save_reply(partial)
+            except Exception as e:
+                print(f"[Chat Service] 끊긴 스트림의 답변 저장 중 오류 발생: {e}")
+
+    chat_pair = {
+        'id': ai_msg.id,
+        'user_msg': user_msg.message,
+        'ai_msg': bot_message,
+        'timestamp': ai_msg.timestamp,
+    }
+    yield format_sse(ChatPairSerializer(chat_pair).data, event='done')
+
+
+# ----------------------------------------------------
+# 비동기 경로 (ASGI)
+# ----------------------------------------------------
+async def aprocess_chat_interaction(user, user_message_text: str) -> Dict:
+    """
+    process_chat_interaction의 비동기 버전입니다.
+    서로 의존하지 않는 단계(임베딩+벡터 검색, 프로필 로드, 최근 대화 로드, 사용자 메시지 저장)를
+    동시에 실행하여 한 턴의 대기 시간을 가장 느린 단계 하나로 줄입니다.
+    """
+    try:
+        started_at = timezone.now()
+
+        retrieved_documents, context, history, user_msg = await asyncio.gather(
+            asearch_documents(query=user_message_text, user_id=user.id, n_results=5, before=started_at),
+            metrics.atimed('user_context', aget_user_context(user)),
+            metrics.atimed('history', aload_recent_history(user, started_at)),
+            metrics.atimed('db_write', ChatMessage.objects.acreate(user=user, message=user_message_text, is_user=True)),
+        )
+
+        bot_message, cache_entry = await alookup_cached_response(context, user.id, user_message_text, retrieved_documents)
+        if bot_message is None:
+            user_context_block = await sync_to_async(prompt_user_context)(context, user.id, user_message_text)
+            bot_message = await agenerate_response(
+                user_message_text, retrieved_documents, history, user_context_block,
+                context.get('conversation_summary', ''),
+            )
+            await sync_to_async(store_cached_response)(cache_entry, user.id, bot_message)
+        with metrics.timed('db_write'):
+            ai_msg = await ChatMessage.objects.acreate(user=user, message=bot_message, is_user=False)
+    except Exception as e:
+        print(f"[Chat Service] 채팅 처리 중 오류 발생: {e}")
+        return {'bot_message_id': None, 'bot_message': str(e)}
+
+    # 큐가 꽉 차면 그 자리에서 실행되므로(DB/API 호출) 이벤트 루프 밖에서 넘깁니다.
+    await sync_to_async(defer_post_turn)(user_msg, ai_msg)
+    return {
+        'user_message_id': user_msg.id,
+        'user_message': user_msg,
+        'bot_message_id': ai_msg.id,
+        'bot_message': bot_message,
+        'ai_message': ai_msg,
+    }
@@ -0,0 +1,87 @@
+"""
+OpenAI 클라이언트를 처음 사용할 때 만드는 지연 초기화 모듈
+
+openai SDK import와 클라이언트 생성은 무겁고, API 키가 없으면 예외가 나므로
+모듈 import 시점(= 모든 gunicorn 워커 부팅, manage.py migrate 등)이 아니라 실제 호출 시점에 수행합니다.
+
+비동기 클라이언트는 이벤트 루프마다 따로 만듭니다.
+WSGI에서 비동기 뷰는 요청마다 새 이벤트 루프에서 실행되는데, 하나의 AsyncOpenAI(httpx 연결 풀)를
+여러 루프가 공유하면 연결 오류와 재시도, 때로는 무한 대기가 생깁니다.
+- ASGI: 루프가 프로세스 내내 살아 있으므로 루프별 클라이언트(연결 풀)를 계속 재사용합니다.
+- WSGI: 루프가 요청 하나로 끝나므로 closes_async_openai_client로 감싼 뷰가 끝날 때 그 루프의
+  클라이언트를 닫습니다. (닫지 않으면 httpx 전송 계층이 GC 전까지 남습니다.)
+"""
+import asyncio
+import functools
+import threading
+import weakref
+from typing import Dict
+
+from django.core.handlers.wsgi import WSGIRequest
+
+_lock = threading.Lock()
+_client_kwargs: Dict = {}
+_client = None
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def configure_openai(**kwargs):
+    """
+    이후 만들어질 클라이언트의 생성 인자(base_url, api_key, timeout 등)를 바꿉니다.
+    (벤치마크에서 로컬 가짜 서버를 가리킬 때 사용하며, 인자 없이 호출하면 기본값으로 돌아갑니다.)
+    """
+    global _client, _client_kwargs
+    with _lock:
+        _client_kwargs = dict(kwargs)
+        _client = None
+        _async_clients.clear()
+
+
+def get_openai_client():
+    """프로세스 전역에서 공유하는 동기 OpenAI 클라이언트를 반환합니다."""
+    global _client
+    client = _client
+    if client is not None:
+        return client
+
+    with _lock:
+        if _client is None:
+            from openai import OpenAI
+            _client = OpenAI(**_client_kwargs)
+        return _client
+
+
+def get_async_openai_client():
+    """현재 실행 중인 이벤트 루프 전용 AsyncOpenAI 클라이언트를 반환합니다."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = _async_clients[loop] = AsyncOpenAI(**_client_kwargs)
+        return client
+
+
+async def aclose_async_openai_client():
+    """현재 이벤트 루프의 AsyncOpenAI 클라이언트가 있으면 닫고 버립니다."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.close()
+
+
+def closes_async_openai_client(view):
+    """
+    비동기 뷰용 데코레이터입니다.
+    WSGI(요청마다 새 이벤트 루프)에서 실행되면 응답을 만든 뒤 그 루프의 AsyncOpenAI를 닫습니다.
+    ASGI에서는 루프가 계속 살아 있으므로 아무것도 하지 않습니다.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        finally:
+            if isinstance(request, WSGIRequest):
+                await aclose_async_openai_client()
+    return wrapper
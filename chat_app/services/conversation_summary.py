@@ -0,0 +1,156 @@
+"""
+오래된 대화를 사용자별 롤링 요약으로 접어 넣는 압축(compaction) 작업
+
+- 최근 CONVERSATION_KEEP_TURNS턴은 건드리지 않습니다. (프롬프트의 최근 대화와 화면의 최신 기록)
+- 그보다 오래되고 아직 요약되지 않은 메시지를 오래된 순으로 CONVERSATION_COMPACT_BATCH_MESSAGES개씩 묶어
+  "이전 요약 + 새 메시지 → 새 요약"으로 LLM에 요청하고 ConversationSummary에 저장합니다.
+- archive=True이면 요약에 반영된 메시지를 같은 트랜잭션에서 ArchivedChatMessage로 옮깁니다.
+
+사용자 메시지와 그 답변이 서로 다른 묶음(또는 핫/보관 테이블)으로 나뉘지 않도록,
+묶음은 항상 AI 메시지로 끝나게 자릅니다.
+"""
+import uuid
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import ArchivedChatMessage, ChatMessage, ConversationSummary
+from . import metrics
+from .clients import get_openai_client
+from .locks import lock_cache
+
+# 같은 사용자를 두 프로세스가 동시에 압축하지 않도록 잡는 잠금의 최대 유지 시간(초)
+# (잠금은 add가 원자적인 잠금 전용 캐시 locks.lock_cache()에 둡니다.)
+LOCK_TIMEOUT = 10 * 60
+
+SUMMARY_SYSTEM_PROMPT = (
+    "당신은 사용자와 AI 챗봇의 대화 기록을 요약하는 도우미입니다. "
+    "이전 요약과 새 대화를 합쳐 하나의 요약으로 다시 작성하세요. "
+    "사용자에 대한 사실, 약속, 진행 중인 주제, 사용자의 감정 변화처럼 이후 대화에 필요한 내용만 남기고 "
+    "인사말이나 반복되는 내용은 버리세요. 한국어 문장 목록으로 간결하게 작성하세요."
+)
+
+
+def _lock_key(user_id: int) -> str:
+    return f"conversation_compaction:{user_id}"
+
+
+def summarize(previous_summary: str, messages: List[ChatMessage]) -> str:
+    """이전 요약과 새 메시지를 합친 새 요약을 LLM으로 만듭니다."""
+    transcript = "\n".join(
+        f"{'사용자' if msg.is_user else 'AI'}: {msg.message}" for msg in messages
+    )
+    prompt = (
+        f"--- 이전 요약 ---\n{previous_summary or '(없음)'}\n\n"
+        f"--- 새 대화 ---\n{transcript}"
+    )
+    with metrics.timed('summary_llm'):
+        response = get_openai_client().chat.completions.create(
+            model=settings.CONVERSATION_SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.2,
+            max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS,
+        )
+    metrics.record_llm_usage(settings.CONVERSATION_SUMMARY_MODEL, response.usage)
+    return response.choices[0].message.content.strip()
+
+
+def _pair_aligned_batches(messages: List[ChatMessage], batch_size: int) -> List[List[ChatMessage]]:
+    """batch_size개 안팎으로 자르되, 각 묶음이 AI 메시지로 끝나게 합니다. (끝에 남는 사용자 메시지는 다음 실행으로 미룸)"""
+    batches = []
+    current: List[ChatMessage] = []
+    for msg in messages:
+        current.append(msg)
+        if len(current) >= batch_size and not msg.is_user:
+            batches.append(current)
+            current = []
+
+    while current and current[-1].is_user:
+        current.pop()
+    if current:
+        batches.append(current)
+    return batches
+
+
+def compaction_candidates(user_id: int, after_id: int, keep_messages: int) -> List[ChatMessage]:
+    """최근 keep_messages개를 제외하고 after_id 이후의 (아직 요약되지 않은) 메시지를 오래된 순으로 반환합니다."""
+    boundary = (
+        ChatMessage.objects.filter(user_id=user_id)
+        .order_by('-id')
+        .values_list('id', flat=True)[keep_messages - 1:keep_messages]
+    )
+    boundary = list(boundary)
+    if not boundary:
+        return []
+
+    return list(
+        ChatMessage.objects.filter(user_id=user_id, id__gt=after_id, id__lt=boundary[0])
+        .order_by('id')
+        .only('id', 'user_id', 'message', 'is_user', 'timestamp')
+    )
+
+
+def compact_user(
+    user_id: int,
+    archive: Optional[bool] = None,
+    keep_turns: Optional[int] = None,
+    min_messages: Optional[int] = None,
+    batch_messages: Optional[int] = None,
+    ) -> Dict:
+    """
+    한 사용자의 오래된 대화를 요약에 접어 넣습니다.
+    반환값: {'folded': 요약에 반영한 메시지 수, 'archived': 보관 테이블로 옮긴 수, 'batches': LLM 호출 수, 'skipped': 사유}
+    """
+    archive = settings.CONVERSATION_ARCHIVE if archive is None else archive
+    keep_turns = settings.CONVERSATION_KEEP_TURNS if keep_turns is None else keep_turns
+    min_messages = settings.CONVERSATION_COMPACT_MIN_MESSAGES if min_messages is None else min_messages
+    batch_messages = settings.CONVERSATION_COMPACT_BATCH_MESSAGES if batch_messages is None else batch_messages
+    # 프롬프트에 들어가는 최근 대화는 항상 핫 테이블에 남아 있어야 합니다.
+    keep_messages = max(keep_turns, settings.CHAT_PROMPT_HISTORY_TURNS, 1) * 2
+
+    result = {'folded': 0, 'archived': 0, 'batches': 0, 'skipped': None}
+    token = uuid.uuid4().hex
+    if not lock_cache().add(_lock_key(user_id), token, timeout=LOCK_TIMEOUT):
+        result['skipped'] = 'locked'
+        return result
+
+    try:
+        summary, _ = ConversationSummary.objects.get_or_create(user_id=user_id)
+        candidates = compaction_candidates(user_id, summary.last_message_id, keep_messages)
+        if len(candidates) < min_messages:
+            result['skipped'] = 'too_few_messages'
+            return result
+
+        for batch in _pair_aligned_batches(candidates, batch_messages):
+            new_summary = summarize(summary.summary, batch)
+            with transaction.atomic():
+                summary.summary = new_summary
+                summary.last_message_id = batch[-1].id
+                summary.message_count += len(batch)
+                summary.save()
+
+                if archive:
+                    ArchivedChatMessage.objects.bulk_create(
+                        [
+                            ArchivedChatMessage(
+                                original_id=msg.id, user_id=user_id, message=msg.message,
+                                is_user=msg.is_user, timestamp=msg.timestamp,
+                            )
+                            for msg in batch
+                        ],
+                        ignore_conflicts=True,
+                    )
+                    ChatMessage.objects.filter(id__in=[msg.id for msg in batch]).delete()
+                    result['archived'] += len(batch)
+
+            result['folded'] += len(batch)
+            result['batches'] += 1
+    finally:
+        # 시간이 지나 만료된 뒤 다른 프로세스가 잡은 잠금은 지우지 않습니다.
+        if lock_cache().get(_lock_key(user_id)) == token:
+            lock_cache().delete(_lock_key(user_id))
+    return result
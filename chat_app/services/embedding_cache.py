@@ -0,0 +1,162 @@
+"""
+쿼리 임베딩 2단계 캐시
+
+- 1단계(L1): 프로세스 내 LRU. 바이트 크기 기준으로 오래된 항목부터 제거합니다.
+- 2단계(L2): DB(EmbeddingCacheEntry) 기반. 워커 재시작 후에도 남아 있고 gunicorn 워커끼리 공유됩니다.
+
+키는 정규화한 텍스트 + 모델 + 차원으로 만들기 때문에
+"안녕",  " 안녕 " 처럼 공백/대소문자만 다른 질문은 같은 임베딩을 재사용합니다.
+저장되는 값도 정규화한 텍스트의 임베딩이어야 하므로 호출하는 쪽은 normalize_query() 결과를 임베딩합니다.
+(먼저 들어온 원문 표기의 임베딩이 키를 대표하지 않도록)
+"""
+import hashlib
+import re
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(text: str) -> str:
+    """캐시 키용으로 텍스트를 정규화합니다. (NFKC, 공백 정리, 소문자화)"""
+    text = unicodedata.normalize('NFKC', text)
+    return _WHITESPACE_RE.sub(' ', text).strip().casefold()
+
+
+def make_cache_key(text: str, model: str, dimensions: int) -> str:
+    raw = f"{model}:{dimensions}:{normalize_query(text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """L1(프로세스 LRU) + L2(DB) 임베딩 캐시"""
+
+    def __init__(self, max_bytes: int):
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, array]" = OrderedDict()
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._writes = 0
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.l1_hits += 1
+                return vector.tolist()
+
+        vector = self._load_l2(key)
+        if vector is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.l2_hits += 1
+            self._put_l1(key, vector)
+        return vector.tolist()
+
+    def set(self, key: str, embedding: List[float], model: str, dimensions: int):
+        vector = array('f', embedding)
+        with self._lock:
+            self._put_l1(key, vector)
+        self._store_l2(key, vector, model, dimensions)
+
+    def clear(self):
+        """L1만 비웁니다. (L2는 prune_l2로 정리)"""
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.l1_hits + self.l2_hits + self.misses
+            return {
+                'l1_hits': self.l1_hits,
+                'l2_hits': self.l2_hits,
+                'misses': self.misses,
+                'hit_rate': (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+                'l1_entries': len(self._lru),
+                'l1_bytes': self._bytes,
+                'l1_max_bytes': self._max_bytes,
+                'l1_evictions': self.evictions,
+            }
+
+    def _put_l1(self, key: str, vector: array):
+        # 호출하는 쪽에서 self._lock을 잡고 있어야 합니다.
+        size = vector.itemsize * len(vector)
+        if size > self._max_bytes:
+            return
+
+        old = self._lru.pop(key, None)
+        if old is not None:
+            self._bytes -= old.itemsize * len(old)
+
+        self._lru[key] = vector
+        self._bytes += size
+
+        while self._bytes > self._max_bytes:
+            _, evicted = self._lru.popitem(last=False)
+            self._bytes -= evicted.itemsize * len(evicted)
+            self.evictions += 1
+
+    def _load_l2(self, key: str) -> Optional[array]:
+        from ..models import EmbeddingCacheEntry
+
+        try:
+            row = EmbeddingCacheEntry.objects.filter(key=key).values_list('vector', flat=True).first()
+        except Exception as e:
+            print(f"[Embedding Cache] L2 조회 실패: {e}")
+            return None
+
+        if row is None:
+            return None
+
+        vector = array('f')
+        vector.frombytes(bytes(row))
+        return vector
+
+    def _store_l2(self, key: str, vector: array, model: str, dimensions: int):
+        from ..models import EmbeddingCacheEntry
+
+        try:
+            # 여러 워커가 같은 키를 동시에 저장해도 충돌하지 않도록 ignore_conflicts를 사용합니다.
+            EmbeddingCacheEntry.objects.bulk_create(
+                [EmbeddingCacheEntry(key=key, model=model, dimensions=dimensions, vector=vector.tobytes())],
+                ignore_conflicts=True,
+            )
+        except Exception as e:
+            print(f"[Embedding Cache] L2 저장 실패: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_prune = self._writes % settings.EMBEDDING_CACHE_PRUNE_EVERY == 0
+        if should_prune:
+            prune_l2()
+
+
+def prune_l2(max_age_days: Optional[int] = None) -> int:
+    """L2에서 오래된 임베딩을 삭제하고 삭제한 행 수를 반환합니다."""
+    from ..models import EmbeddingCacheEntry
+
+    if max_age_days is None:
+        max_age_days = settings.EMBEDDING_CACHE_L2_MAX_AGE_DAYS
+    cutoff = timezone.now() - timedelta(days=max_age_days)
+    deleted, _ = EmbeddingCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+embedding_cache = EmbeddingCache(max_bytes=settings.EMBEDDING_CACHE_L1_MAX_BYTES)
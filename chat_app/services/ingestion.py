@@ -0,0 +1,280 @@
+"""
+채팅/일기/인간관계 데이터를 벡터 저장소(Pinecone 또는 로컬)에 적재하는 파이프라인
+
+- 소스별로 IngestionCursor.last_id보다 큰 행만 id 순서대로 가져옵니다.
+- 텍스트를 EMBEDDING_BATCH_SIZE개씩 묶어 embeddings.create를 병렬로 호출하고,
+  UPSERT_BATCH_SIZE개씩 user_id/text 메타데이터와 함께 업서트합니다.
+- 한 청크의 업서트가 끝날 때마다 커서를 전진시키므로, 중단되더라도 다음 실행에서
+  마지막 완료 지점부터 이어서 처리합니다. (벡터 id가 고정이라 재처리해도 중복되지 않습니다.)
+- 채팅 턴 직후 백그라운드에서 업서트한 행(upsert_rows(live=True))은 IngestedRow에 기록해 두고,
+  커서가 지나갈 때 다시 임베딩하지 않습니다.
+- id는 커밋 순서가 아니라 INSERT 순서로 매겨지므로(PostgreSQL 시퀀스), 커서가 지나간 뒤에 더 작은 id의 행이
+  커밋될 수 있습니다. 그래서 매 실행마다 커서 뒤 INGESTION_CURSOR_LAG개 id 범위를 다시 훑어, 그 안에서
+  IngestedRow에 기록되지 않은 행(늦게 커밋된 행)을 적재합니다. 적재한 행은 이 범위를 벗어날 때까지 기록해 둡니다.
+- 임베딩 모델의 입력 한도(INGESTION_MAX_TOKENS)를 넘는 텍스트는 잘라서 보냅니다.
+  그래도 배치가 400으로 거절되면 한 행씩 다시 보내고, 끝내 실패하는 행만 로그를 남기고 건너뜁니다.
+  (일시적인 오류는 그대로 올려 커서가 전진하지 않게 합니다.)
+- 활동 기록/인간관계의 수정·삭제는 signal이 커밋 뒤 백그라운드에서 sync_row/delete_rows로 반영합니다.
+  bulk_update처럼 signal을 보내지 않는 일괄 변경은 반영되지 않으므로 수정은 ingest_vectors --reset으로
+  다시 맞출 수 있지만, 그렇게 삭제된 행의 벡터는 남습니다.
+  채팅 메시지는 수정되지 않고, 삭제는 대화 요약의 보관(ArchivedChatMessage로 이동)이므로 벡터를 그대로 둡니다.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from ..models import ChatMessage, IngestedRow, IngestionCursor, UserActivity, UserRelationship
+from . import vector_store
+from .clients import get_openai_client
+
+
+def chat_message_text(msg: ChatMessage) -> str:
+    speaker = "사용자" if msg.is_user else "아이"
+    return f"[{msg.timestamp:%Y-%m-%d %H:%M}] {speaker}: {msg.message}"
+
+
+def user_activity_text(activity: UserActivity) -> str:
+    parts = []
+    if activity.place:
+        parts.append(f"장소: {activity.place}")
+    if activity.companion:
+        parts.append(f"동행: {activity.companion}")
+    if activity.memo:
+        parts.append(f"메모: {activity.memo}")
+    if not parts:
+        return ""
+
+    when = " ".join(str(v) for v in (activity.activity_date, activity.activity_time) if v)
+    prefix = f"[{when}] " if when else ""
+    return f"{prefix}활동 기록 - " + ", ".join(parts)
+
+
+def user_relationship_text(rel: UserRelationship) -> str:
+    name = f"{rel.name}({rel.disambiguator})" if rel.disambiguator else rel.name
+    role = "/".join(v for v in (rel.relationship_type, rel.position) if v)
+    text = f"인간관계 - {name}: {role}"
+    if rel.traits:
+        text += f", 특징: {rel.traits}"
+    return text
+
+
+# source 이름 -> (모델, 텍스트 변환 함수, 벡터 id 접두사)
+SOURCES: Dict[str, Tuple] = {
+    'chat': (ChatMessage, chat_message_text, 'chat'),
+    'activity': (UserActivity, user_activity_text, 'activity'),
+    'relationship': (UserRelationship, user_relationship_text, 'relationship'),
+}
+
+
+def truncate_for_embedding(text: str, max_tokens: Optional[int] = None) -> str:
+    """
+    text를 임베딩 모델 입력 한도 안으로 자릅니다.
+    토크나이저 없이 user_context.estimate_tokens와 같은 보수적인 기준(비ASCII 글자당 1토큰, ASCII 4글자당 1토큰)으로 셉니다.
+    """
+    from .user_context import estimate_tokens
+
+    max_tokens = max_tokens or settings.INGESTION_MAX_TOKENS
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens * 4 # ASCII 한 글자 = 1/4토큰 단위로 셉니다.
+    for end, ch in enumerate(text):
+        budget -= 4 if ord(ch) > 127 else 1
+        if budget < 0:
+            return text[:end]
+    return text
+
+
+def _chunks(items: List, size: int) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def embed_texts(texts: List[str], batch_size: int, workers: int) -> List[Optional[List[float]]]:
+    """
+    texts를 batch_size개씩 묶어 병렬로 임베딩하고, 입력 순서대로 벡터를 반환합니다.
+    요청이 거절되는(400) 텍스트의 자리에는 None을 넣습니다.
+    """
+    from openai import BadRequestError
+
+    from ..views import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+
+    def create(batch: List[str]) -> List[List[float]]:
+        response = get_openai_client().embeddings.create(
+            input=[truncate_for_embedding(text) for text in batch],
+            model=EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS
+        )
+        # 응답 순서가 입력 순서와 같다는 보장을 위해 index로 정렬합니다.
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed_batch(batch: List[str]) -> List[Optional[List[float]]]:
+        try:
+            return create(batch)
+        except BadRequestError as e:
+            if len(batch) == 1:
+                print(f"[Ingestion] 임베딩 요청이 거절되어 건너뜁니다: {e}")
+                return [None]
+        # 배치 안의 한 행 때문에 나머지까지 막히지 않도록 한 행씩 다시 보냅니다.
+        return [vector for text in batch for vector in embed_batch([text])]
+
+    batches = list(_chunks(texts, batch_size))
+    if workers <= 1 or len(batches) <= 1:
+        results = [embed_batch(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(embed_batch, batches))
+    return [vector for batch in results for vector in batch]
+
+
+def upsert_vectors(vectors: List[Dict], batch_size: int, invalidate_cache: bool = True):
+    for batch in _chunks(vectors, batch_size):
+        vector_store.upsert_vectors(batch, invalidate_cache=invalidate_cache)
+
+
+def upsert_rows(
+    source: str,
+    rows: List,
+    embedding_batch_size: Optional[int] = None,
+    upsert_batch_size: Optional[int] = None,
+    workers: int = 1,
+    live: bool = False,
+    ) -> int:
+    """
+    이미 읽어 둔 행들을 임베딩해서 업서트하고 업서트한 벡터 수를 반환합니다.
+    (ingest_source와 같은 벡터 id를 쓰므로 나중에 ingest_vectors가 같은 행을 다시 처리해도 중복되지 않습니다.)
+    live=True는 방금 끝난 채팅 턴의 메시지입니다. 검색 결과 캐시를 비우지 않고(upsert_vectors 참고),
+    업서트한 행을 기록해 ingest_vectors가 다시 임베딩하지 않게 합니다.
+    """
+    _, to_text, id_prefix = SOURCES[source]
+    documents = [(row, to_text(row)) for row in rows]
+    documents = [(row, text) for row, text in documents if text]
+    if not documents:
+        return 0
+
+    embeddings = embed_texts(
+        [text for _, text in documents], embedding_batch_size or settings.INGESTION_EMBEDDING_BATCH_SIZE, workers
+    )
+    vectors = []
+    for (row, text), embedding in zip(documents, embeddings):
+        if embedding is None:
+            print(f"[Ingestion] {source}:{row.id} 행을 임베딩하지 못해 건너뜁니다.")
+            continue
+        vectors.append({
+            'id': f"{id_prefix}-{row.id}",
+            'values': embedding,
+            'metadata': {'user_id': row.user_id, 'text': text, 'source': source},
+        })
+    if not vectors:
+        return 0
+    upsert_vectors(vectors, upsert_batch_size or settings.INGESTION_UPSERT_BATCH_SIZE, invalidate_cache=not live)
+    if live:
+        upserted = {vector['id'] for vector in vectors}
+        IngestedRow.objects.bulk_create(
+            [IngestedRow(source=source, row_id=row.id) for row, _ in documents if f"{id_prefix}-{row.id}" in upserted],
+            ignore_conflicts=True,
+        )
+    return len(vectors)
+
+
+def _ingest_chunk(
+    source: str, rows: List, embedding_batch_size: int, upsert_batch_size: int, workers: int
+    ):
+    """rows 중 아직 적재되지 않은 행을 업서트하고, 모두 적재한 것으로 기록합니다."""
+    # 채팅 턴 직후 이미 업서트된 행은 건너뜁니다.
+    done = set(
+        IngestedRow.objects.filter(source=source, row_id__in=[row.id for row in rows])
+        .values_list('row_id', flat=True)
+    )
+    pending = [row for row in rows if row.id not in done]
+    upsert_rows(source, pending, embedding_batch_size, upsert_batch_size, workers)
+    IngestedRow.objects.bulk_create(
+        [IngestedRow(source=source, row_id=row.id) for row in pending], ignore_conflicts=True
+    )
+
+
+def ingest_source(
+    source: str,
+    chunk_size: Optional[int] = None,
+    embedding_batch_size: Optional[int] = None,
+    upsert_batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    progress: Optional[Callable[[str, int, int], None]] = None,
+    ) -> int:
+    """
+    source의 새 행(과 커서 뒤 INGESTION_CURSOR_LAG 범위에서 늦게 커밋된 행)을 적재하고 처리한 행 수를 반환합니다.
+    progress(source, 처리한 행 수, 현재 커서)는 청크마다 호출됩니다.
+    """
+    model, _, _ = SOURCES[source]
+    chunk_size = chunk_size or settings.INGESTION_CHUNK_SIZE
+    embedding_batch_size = embedding_batch_size or settings.INGESTION_EMBEDDING_BATCH_SIZE
+    upsert_batch_size = upsert_batch_size or settings.INGESTION_UPSERT_BATCH_SIZE
+    workers = workers or settings.INGESTION_WORKERS
+    lag = settings.INGESTION_CURSOR_LAG
+
+    cursor, _ = IngestionCursor.objects.get_or_create(source=source)
+    # 다시 훑을 범위(커서 뒤 lag개)보다 오래된 기록은 더 필요 없습니다.
+    IngestedRow.objects.filter(source=source, row_id__lte=cursor.last_id - lag).delete()
+    processed = 0
+
+    # 1. 커서 뒤 범위: 지난 실행 때 아직 커밋되지 않아 커서가 건너뛴 행
+    recorded = IngestedRow.objects.filter(source=source).values('row_id')
+    while True:
+        rows = list(
+            model.objects.filter(id__gt=cursor.last_id - lag, id__lte=cursor.last_id)
+            .exclude(id__in=recorded).order_by('id')[:chunk_size]
+        )
+        if not rows:
+            break
+        _ingest_chunk(source, rows, embedding_batch_size, upsert_batch_size, workers)
+        processed += len(rows)
+
+    # 2. 커서 이후의 새 행
+    while True:
+        rows = list(model.objects.filter(id__gt=cursor.last_id).order_by('id')[:chunk_size])
+        if not rows:
+            break
+        _ingest_chunk(source, rows, embedding_batch_size, upsert_batch_size, workers)
+
+        # 업서트까지 끝난 뒤에만 커서를 전진시킵니다. (중단 시 이 청크부터 다시 처리)
+        cursor.last_id = rows[-1].id
+        cursor.save(update_fields=['last_id', 'updated_at'])
+        IngestedRow.objects.filter(source=source, row_id__lte=cursor.last_id - lag).delete()
+        processed += len(rows)
+
+        if progress:
+            progress(source, processed, cursor.last_id)
+
+    return processed
+
+
+def sync_row(source: str, row):
+    """수정된 행의 벡터를 다시 만듭니다. 텍스트가 비게 된 행은 벡터를 지웁니다."""
+    _, to_text, _ = SOURCES[source]
+    if to_text(row):
+        upsert_rows(source, [row])
+    else:
+        delete_rows(source, [(row.user_id, row.id)])
+
+
+def delete_rows(source: str, rows: List[Tuple[int, int]]):
+    """삭제된 행들 [(user_id, 행 id)]의 벡터를 벡터 저장소에서 지웁니다."""
+    _, _, id_prefix = SOURCES[source]
+    by_user: Dict[int, List[str]] = {}
+    for user_id, row_id in rows:
+        by_user.setdefault(user_id, []).append(f"{id_prefix}-{row_id}")
+    for user_id, ids in by_user.items():
+        vector_store.delete_vectors(user_id, ids)
+
+
+def reset_cursor(source: str):
+    """
+    커서를 0으로 되돌립니다. (전체 백필은 모든 행을 다시 임베딩합니다)
+
+    커서는 id 순서로 전진하지만 id는 커밋 순서와 다를 수 있습니다. (PostgreSQL에서 먼저 id를 받은 트랜잭션이
+    나중에 커밋되는 경우) 이렇게 커서 뒤에 늦게 나타나는 행은 ingest_source가 INGESTION_CURSOR_LAG 범위를
+    다시 훑어 처리하므로, 그 범위보다 더 늦게 커밋된 행이 의심될 때만 리셋이 필요합니다.
+    """
+    IngestionCursor.objects.filter(source=source).update(last_id=0)
+    IngestedRow.objects.filter(source=source).delete()
@@ -0,0 +1,258 @@
+"""
+사용자별 로컬 키워드 역색인 (문자 n-gram + BM25)
+
+벡터 검색만으로는 활동 기록의 장소/동행인/메모나 대화 속 이름·날짜처럼
+철자가 그대로 맞아야 하는 질문을 자주 놓칩니다. 그래서 ChatMessage와 UserActivity를
+벡터 적재와 같은 텍스트(ingestion.chat_message_text / user_activity_text)로 역색인해 두고,
+검색 때 벡터 결과와 RRF(Reciprocal Rank Fusion)로 합칩니다.
+
+- 토큰: 한국어는 띄어쓰기 단위에 조사가 붙으므로 형태소 분석 대신 문자 2-gram을 씁니다.
+  ("카페에서" → 카페, 페에, 에서 / 한 글자 단어는 그대로)
+- 색인: 행이 저장되면 커밋 뒤 백그라운드 작업자가 해당 문서만 다시 색인하고(index_row), 삭제되면 바로 뺍니다.
+  (bulk_create 등으로 들어온 기존 데이터는 `python manage.py rebuild_keyword_index`로 채웁니다.)
+- 벡터 생략: 가장 점수가 높은 활동 기록 문서가 질문 n-gram의 IDF 가중치를 KEYWORD_SKIP_VECTOR_COVERAGE 이상
+  덮으면 임베딩/벡터 조회를 하지 않고 키워드 결과만 씁니다. 채팅 문서는 판단에 쓰지 않습니다.
+  (예전에 같은 질문을 했다면 그 질문 메시지가 질문을 거의 그대로 덮으므로, 관련 기억이 없어도 벡터 조회를 건너뛰게 됩니다.)
+"""
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from ..models import ArchivedChatMessage, ChatMessage, KeywordDocument, KeywordPosting, UserActivity
+from . import metrics
+from .ingestion import chat_message_text, user_activity_text
+
+# BM25 파라미터 (일반적인 기본값)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# RRF 상수 (순위가 낮은 결과의 영향이 너무 작아지지 않게 하는 값, 보통 60)
+RRF_K = 60
+
+_WORD_RE = re.compile(r'[^\W_]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """텍스트를 문자 2-gram 목록으로 바꿉니다. (대소문자/전각·반각 정규화, 구두점 제거)"""
+    terms = []
+    for word in _WORD_RE.findall(unicodedata.normalize('NFKC', text or '').lower()):
+        if len(word) == 1:
+            terms.append(word)
+        else:
+            terms.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return terms
+
+
+# ----------------------------------------------------
+# 색인
+# ----------------------------------------------------
+def _document_fields(source: str, instance) -> Dict:
+    if source == 'chat':
+        return {'user_id': instance.user_id, 'text': chat_message_text(instance), 'timestamp': instance.timestamp}
+    if source == 'activity':
+        return {'user_id': instance.user_id, 'text': user_activity_text(instance), 'timestamp': instance.created_at}
+    raise ValueError(f"알 수 없는 source: {source}")
+
+
+def index_document(source: str, instance):
+    """행 하나를 (다시) 색인합니다. 텍스트가 비어 있으면 색인에서 뺍니다."""
+    fields = _document_fields(source, instance)
+    terms = Counter(tokenize(fields['text']))
+    with transaction.atomic():
+        if not terms:
+            KeywordDocument.objects.filter(source=source, source_id=instance.pk).delete()
+            return
+        document, created = KeywordDocument.objects.update_or_create(
+            source=source, source_id=instance.pk,
+            defaults={**fields, 'length': sum(terms.values())},
+        )
+        if not created:
+            KeywordPosting.objects.filter(document=document).delete()
+        KeywordPosting.objects.bulk_create(
+            [KeywordPosting(document=document, user_id=fields['user_id'], term=term, tf=tf) for term, tf in terms.items()]
+        )
+
+
+def index_row(source: str, source_id: int):
+    """
+    (백그라운드) 지금 DB에 있는 행으로 문서를 다시 색인합니다.
+    작업이 실행되기 전에 행이 지워졌으면 색인에서 뺍니다. (보관 테이블로 옮겨진 채팅 메시지는 남겨 둠)
+    """
+    model = ChatMessage if source == 'chat' else UserActivity
+    row = model.objects.filter(pk=source_id).first()
+    if row is not None:
+        index_document(source, row)
+    elif source != 'chat' or not ArchivedChatMessage.objects.filter(original_id=source_id).exists():
+        remove_document(source, source_id)
+
+
+def remove_document(source: str, source_id: int):
+    KeywordDocument.objects.filter(source=source, source_id=source_id).delete()
+
+
+def remove_chat_message(message: ChatMessage):
+    """
+    삭제된 채팅 메시지를 색인에서 뺍니다.
+    단, 대화 압축(compact_conversations --archive)으로 보관 테이블에 옮겨진 메시지는 기억으로 남겨 둡니다.
+    """
+    if ArchivedChatMessage.objects.filter(original_id=message.pk).exists():
+        return
+    remove_document('chat', message.pk)
+
+
+def _indexed_user_ids() -> List[int]:
+    """원본 행이나 색인 문서가 있는 모든 사용자 id"""
+    user_ids = set(KeywordDocument.objects.values_list('user_id', flat=True).distinct())
+    for model in (ChatMessage, ArchivedChatMessage, UserActivity):
+        user_ids.update(model.objects.values_list('user_id', flat=True).distinct())
+    return sorted(user_ids)
+
+
+def rebuild(user_ids: Optional[List[int]] = None, batch_size: int = 500) -> Dict[str, int]:
+    """
+    색인을 원본 테이블에서 다시 만듭니다. 반환값: source별 색인한 문서 수
+    사용자마다 한 트랜잭션에서 지우고 다시 채우므로, 재색인 중에도 검색은 그 사용자의 이전 색인이나
+    새 색인 중 하나를 봅니다. (중간에 실패해도 그 사용자의 이전 색인이 남습니다.)
+    """
+    counts = {'chat': 0, 'activity': 0}
+    for user_id in user_ids or _indexed_user_ids():
+        with transaction.atomic():
+            KeywordDocument.objects.filter(user_id=user_id).delete()
+            # 보관된 메시지는 원래 ChatMessage id로 색인합니다. (signal로 색인된 문서와 같은 키)
+            for source, model, id_field in (
+                ('chat', ChatMessage, 'id'),
+                ('chat', ArchivedChatMessage, 'original_id'),
+                ('activity', UserActivity, 'id'),
+            ):
+                batch = []
+                for row in model.objects.filter(user_id=user_id).order_by('id').iterator(chunk_size=batch_size):
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        counts[source] += _index_batch(source, batch, id_field)
+                        batch = []
+                if batch:
+                    counts[source] += _index_batch(source, batch, id_field)
+    return counts
+
+
+def _index_batch(source: str, rows: Iterable, id_field: str) -> int:
+    """새 문서 여러 개를 bulk_create로 한 번에 색인합니다. (rebuild 전용: 기존 문서가 없어야 함)"""
+    prepared = []
+    for row in rows:
+        fields = _document_fields(source, row)
+        terms = Counter(tokenize(fields['text']))
+        if terms:
+            document = KeywordDocument(
+                source=source, source_id=getattr(row, id_field), length=sum(terms.values()), **fields
+            )
+            prepared.append((document, terms))
+
+    with transaction.atomic():
+        documents = KeywordDocument.objects.bulk_create([document for document, _ in prepared])
+        KeywordPosting.objects.bulk_create(
+            [
+                KeywordPosting(document=document, user_id=document.user_id, term=term, tf=tf)
+                for document, terms in zip(documents, (terms for _, terms in prepared))
+                for term, tf in terms.items()
+            ],
+            batch_size=2000,
+        )
+    return len(prepared)
+
+
+# ----------------------------------------------------
+# 검색
+# ----------------------------------------------------
+@dataclass
+class KeywordResult:
+    texts: List[str] = field(default_factory=list)
+    scores: List[float] = field(default_factory=list)
+    coverage: float = 0.0 # 점수가 가장 높은 활동 기록 문서가 덮는 질문 n-gram의 IDF 가중치 비율 (0~1)
+    query_terms: int = 0
+
+    @property
+    def strong(self) -> bool:
+        """벡터 검색 없이 키워드 결과만으로 충분한지 여부"""
+        return (
+            self.query_terms >= settings.KEYWORD_SKIP_VECTOR_MIN_TERMS
+            and self.coverage >= settings.KEYWORD_SKIP_VECTOR_COVERAGE
+        )
+
+
+def _idf(n_docs: int, df: int) -> float:
+    return math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+
+
+def search(user_id: int, query: str, n_results: int = 5, before: Optional[datetime] = None) -> KeywordResult:
+    """
+    사용자의 문서를 BM25로 검색합니다.
+    before가 있으면 그 시각 이전에 만들어진 문서만 봅니다. (방금 저장한 현재 질문 자체가 검색되지 않도록)
+    """
+    query_terms = set(tokenize(query))
+    result = KeywordResult(query_terms=len(query_terms))
+    if not query_terms:
+        return result
+
+    with metrics.timed('keyword_query'):
+        stats = KeywordDocument.objects.filter(user_id=user_id).aggregate(n=Count('id'), total=Sum('length'))
+        n_docs = stats['n']
+        if not n_docs:
+            return result
+        avg_length = (stats['total'] or 0) / n_docs
+
+        df = dict(
+            KeywordPosting.objects.filter(user_id=user_id, term__in=query_terms)
+            .values_list('term')
+            .annotate(df=Count('id'))
+        )
+        idf = {term: _idf(n_docs, df.get(term, 0)) for term in query_terms}
+        # 거의 모든 문서에 나오는 n-gram(조사, 어미 등)은 점수에 거의 기여하지 않으면서 행만 많으므로 읽지 않습니다.
+        max_df = max(1, int(n_docs * settings.KEYWORD_MAX_DF_RATIO))
+        lookup_terms = [term for term, count in df.items() if count <= max_df]
+        if not lookup_terms:
+            return result
+
+        postings = KeywordPosting.objects.filter(user_id=user_id, term__in=lookup_terms)
+        if before is not None:
+            postings = postings.filter(document__timestamp__lt=before)
+
+        scores: Dict[int, float] = {}
+        matched: Dict[int, float] = {}
+        activities = set()
+        for document_id, term, tf, length, source in postings.values_list(
+            'document_id', 'term', 'tf', 'document__length', 'document__source'
+        ):
+            norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length))
+            scores[document_id] = scores.get(document_id, 0.0) + idf[term] * norm
+            matched[document_id] = matched.get(document_id, 0.0) + idf[term]
+            if source == 'activity':
+                activities.add(document_id)
+
+        top = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        if not top:
+            return result
+        texts = dict(KeywordDocument.objects.filter(id__in=top).values_list('id', 'text'))
+
+    result.texts = [texts[document_id] for document_id in top]
+    result.scores = [scores[document_id] for document_id in top]
+    if activities:
+        best_activity = max(activities, key=scores.get)
+        result.coverage = matched[best_activity] / sum(idf.values())
+    return result
+
+
+def fuse(vector_texts: List[str], keyword_texts: List[str], n_results: int) -> List[str]:
+    """두 검색 결과를 RRF로 합칩니다. 같은 문서(같은 텍스트)는 점수를 더합니다."""
+    scores: Dict[str, float] = {}
+    for ranked in (vector_texts, keyword_texts):
+        for rank, text in enumerate(ranked):
+            scores[text] = scores.get(text, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:n_results]
@@ -0,0 +1,51 @@
+"""
+락/슬롯 전용 캐시 (CACHES['locks'])
+
+single_flight의 요청 잠금, admission의 LLM 동시 실행 슬롯/대기 자리, conversation_summary의 압축 잠금은
+cache.add로 잡습니다. 이 키들은 두 가지가 보장되어야 합니다.
+- add가 원자적이어야 합니다. (여러 워커가 동시에 시도해도 하나만 성공)
+- 잡혀 있는 동안 만료 전에 임의로 지워지면 안 됩니다.
+
+기본 캐시(FileBasedCache)는 add가 "있는지 확인한 뒤 쓰기"라서 두 워커가 함께 성공할 수 있고,
+MAX_ENTRIES(300)를 넘으면 항목을 무작위로 버리므로 잡힌 잠금/슬롯이 사라질 수 있습니다.
+그래서 이 키들은 대용량 데이터(검색 결과, 응답 캐시 등)와 섞지 않고 Redis/Memcached로 설정한 별도 별칭에 둡니다.
+앱 시작 시 check_configuration()으로 확인하여, 잘못 설정되었으면 바로 ImproperlyConfigured로 실패합니다.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+ALIAS = 'locks'
+
+# add가 원자적인(서버에서 "없을 때만 쓰기"를 한 번에 처리하는) 공유 백엔드
+ATOMIC_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+# 프로세스 안에서만 원자적이므로 단일 프로세스(runserver, 테스트)에서 LOCK_CACHE_ALLOW_LOCAL로만 허용합니다.
+LOCAL_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+def lock_cache() -> BaseCache:
+    return caches[ALIAS]
+
+
+def check_configuration():
+    """CACHES['locks']가 원자적 add를 지원하는 공유 백엔드인지 확인합니다."""
+    config = settings.CACHES.get(ALIAS)
+    if config is None:
+        raise ImproperlyConfigured(
+            f"CACHES['{ALIAS}']가 없습니다. 잠금/슬롯용 Redis 또는 Memcached 캐시를 설정하세요. "
+            f"(LOCK_CACHE_BACKEND / LOCK_CACHE_LOCATION)"
+        )
+    backend = config.get('BACKEND')
+    if backend in ATOMIC_BACKENDS:
+        return
+    if backend == LOCAL_BACKEND and settings.LOCK_CACHE_ALLOW_LOCAL:
+        return
+    raise ImproperlyConfigured(
+        f"CACHES['{ALIAS}']의 백엔드 {backend}는 잠금/슬롯에 쓸 수 없습니다. "
+        f"add가 원자적인 공유 백엔드({', '.join(ATOMIC_BACKENDS)})를 설정하세요."
+    )
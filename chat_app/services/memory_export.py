@@ -0,0 +1,290 @@
+"""
+사용자 기억 전체의 NDJSON 내보내기 / 가져오기
+
+고객 지원·개인정보 열람 요청에 쓰는 형식입니다. 한 줄에 레코드 하나이며 'type'으로 종류를 구분합니다.
+  meta → profile → chat_message... → user_activity... → user_attribute... → user_relationship...
+  → room → furniture_item...
+
+- 내보내기: 테이블마다 id 순서로 values().iterator(chunk_size)로 읽어 한 줄씩 만들어 내므로,
+  대화 기록이 아무리 길어도 메모리에는 한 청크만 올라갑니다. gzip도 스트리밍으로 압축합니다.
+- 가져오기: 한 줄씩 읽어 종류별로 batch_size개까지 모았다가 bulk_create합니다.
+  원래 id는 쓰지 않고 대상 사용자의 새 행으로 만듭니다. (auto_now_add 시각은 bulk_update로 원래 값으로 되돌림)
+  bulk_create는 signal을 보내지 않으므로 끝난 뒤 키워드 색인/활동 통계/캐시를 한 번에 갱신합니다.
+  인간관계/속성은 이미 있으면 건너뛰지만, 대화/활동 기록은 같은 파일을 두 번 가져오면 중복됩니다.
+
+대화 압축으로 보관 테이블(ArchivedChatMessage)에 옮겨진 메시지도 원래 id 순서대로 chat_message로 내보냅니다.
+대화 요약(ConversationSummary)은 메시지에서 다시 만들 수 있으므로 포함하지 않습니다.
+"""
+import datetime
+import gzip
+import json
+import uuid
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+
+from ..models import (
+    ArchivedChatMessage,
+    ChatMessage,
+    FurnitureItem,
+    Room,
+    UserActivity,
+    UserAttribute,
+    UserProfile,
+    UserRelationship,
+)
+from . import analytics, keyword_index, mention_tagger, response_cache, user_context
+
+FORMAT_VERSION = 1
+
+# 레코드 종류 -> (모델, 내보낼 필드)
+RECORD_FIELDS: Dict[str, Tuple] = {
+    'chat_message': (ChatMessage, ('message', 'is_user', 'timestamp')),
+    'user_activity': (UserActivity, ('activity_date', 'activity_time', 'place', 'companion', 'memo', 'created_at')),
+    'user_attribute': (UserAttribute, ('fact_type', 'content', 'created_at')),
+    'user_relationship': (
+        UserRelationship,
+        ('serial_code', 'relationship_type', 'position', 'name', 'disambiguator', 'traits', 'created_at'),
+    ),
+    'furniture_item': (
+        FurnitureItem,
+        ('item_type', 'position_x', 'position_y', 'position_z', 'rotation', 'scale', 'custom_name', 'created_at'),
+    ),
+}
+
+# 문자열로 직렬화된 값을 모델 필드 값으로 되돌리는 함수
+_PARSERS = {
+    'timestamp': parse_datetime,
+    'created_at': parse_datetime,
+    'activity_date': parse_date,
+    'activity_time': parse_time,
+    'serial_code': uuid.UUID,
+}
+
+# bulk_create 때 auto_now_add로 덮어써지는 필드 (저장 후 원래 값으로 되돌림)
+_AUTO_NOW_ADD_FIELDS = ('timestamp', 'created_at')
+
+
+class _Encoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder는 시각을 밀리초까지만 쓰므로, 가져온 뒤에도 순서가 같도록 마이크로초까지 씁니다."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _line(record: Dict) -> str:
+    return json.dumps(record, cls=_Encoder, ensure_ascii=False) + "\n"
+
+
+# ----------------------------------------------------
+# 내보내기
+# ----------------------------------------------------
+def iter_export(user, chunk_size: Optional[int] = None) -> Iterator[str]:
+    """사용자의 기억 전체를 NDJSON 줄 단위로 만들어 냅니다."""
+    chunk_size = chunk_size or settings.MEMORY_EXPORT_CHUNK_SIZE
+
+    yield _line({
+        'type': 'meta', 'version': FORMAT_VERSION, 'username': user.username, 'exported_at': timezone.now(),
+    })
+
+    profile = UserProfile.objects.filter(user=user).values('affinity_score', 'memory', 'response_cache_enabled').first()
+    if profile:
+        yield _line({'type': 'profile', **profile})
+
+    # 보관된 메시지가 더 오래되었으므로 먼저 내보내면 전체가 시간 순서가 됩니다.
+    _, chat_fields = RECORD_FIELDS['chat_message']
+    for row in (
+        ArchivedChatMessage.objects.filter(user=user).order_by('original_id')
+        .values(*chat_fields).iterator(chunk_size=chunk_size)
+    ):
+        yield _line({'type': 'chat_message', **row})
+
+    for record_type in ('chat_message', 'user_activity', 'user_attribute', 'user_relationship'):
+        model, fields = RECORD_FIELDS[record_type]
+        for row in model.objects.filter(user=user).order_by('id').values(*fields).iterator(chunk_size=chunk_size):
+            yield _line({'type': record_type, **row})
+
+    room = Room.objects.filter(user=user).values('room_name', 'background_style').first()
+    if room:
+        yield _line({'type': 'room', **room})
+        _, fields = RECORD_FIELDS['furniture_item']
+        for row in (
+            FurnitureItem.objects.filter(room_id=user.pk).order_by('id')
+            .values(*fields).iterator(chunk_size=chunk_size)
+        ):
+            yield _line({'type': 'furniture_item', **row})
+
+
+def gzip_stream(lines: Iterable[str], flush_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    """줄 스트림을 gzip으로 압축하며 flush_bytes만큼 모일 때마다 압축된 조각을 내보냅니다."""
+    compressor = zlib.compressobj(wbits=31) # 31: gzip 헤더/트레일러 포함
+    pending = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        pending += len(data)
+        chunk = compressor.compress(data)
+        if pending >= flush_bytes:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+# ----------------------------------------------------
+# 가져오기
+# ----------------------------------------------------
+def open_export(path: str):
+    """내보낸 파일을 텍스트 모드로 엽니다. (gzip이면 매직 바이트로 알아보고 풀면서 읽음)"""
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def _parse(record: Dict) -> Dict:
+    values = {}
+    for key, value in record.items():
+        if key == 'type':
+            continue
+        parser = _PARSERS.get(key)
+        values[key] = parser(value) if parser and isinstance(value, str) else value
+    return values
+
+
+class _Importer:
+    def __init__(self, user, batch_size: int):
+        self.user = user
+        self.batch_size = batch_size
+        self.buffers: Dict[str, List] = {record_type: [] for record_type in RECORD_FIELDS}
+        self.counts: Dict[str, int] = {record_type: 0 for record_type in RECORD_FIELDS}
+        self.room: Optional[Room] = None
+
+    def add(self, record: Dict):
+        record_type = record.get('type')
+        values = _parse(record)
+        if record_type == 'meta':
+            if record.get('version') != FORMAT_VERSION:
+                raise ValueError(f"지원하지 않는 내보내기 형식 버전입니다: {record.get('version')}")
+            return
+        if record_type == 'profile':
+            UserProfile.objects.update_or_create(user=self.user, defaults=values)
+            return
+        if record_type == 'room':
+            self.room, _ = Room.objects.update_or_create(user=self.user, defaults=values)
+            return
+        if record_type not in RECORD_FIELDS:
+            raise ValueError(f"알 수 없는 레코드 종류입니다: {record_type}")
+
+        model, _ = RECORD_FIELDS[record_type]
+        if record_type == 'furniture_item':
+            if self.room is None:
+                self.room, _ = Room.objects.get_or_create(user=self.user)
+            obj = model(room=self.room, **values)
+        else:
+            obj = model(user=self.user, **values)
+
+        buffer = self.buffers[record_type]
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush(record_type)
+
+    def _skip_existing(self, record_type: str, objs: List) -> List:
+        """
+        같은 파일을 다시 가져와도 중복되지 않도록 이미 있는 인간관계/속성은 뺍니다.
+        다른 사용자가 같은 serial_code를 쓰고 있으면 새 serial_code를 붙입니다.
+        """
+        if record_type == 'user_relationship':
+            owners = dict(
+                UserRelationship.objects.filter(serial_code__in=[obj.serial_code for obj in objs])
+                .values_list('serial_code', 'user_id')
+            )
+            # serial_code를 새로 받은 인물은 (이름, 구분자, 관계 유형)으로 이미 가져왔는지 확인합니다.
+            existing = set(
+                UserRelationship.objects.filter(user=self.user, name__in=[obj.name for obj in objs])
+                .values_list('name', 'disambiguator', 'relationship_type')
+            )
+            kept, seen = [], set()
+            for obj in objs:
+                key = (obj.name, obj.disambiguator, obj.relationship_type)
+                owner = owners.get(obj.serial_code)
+                if owner == self.user.pk or obj.serial_code in seen or key in existing:
+                    continue
+                if owner is not None:
+                    obj.serial_code = uuid.uuid4()
+                seen.add(obj.serial_code)
+                existing.add(key)
+                kept.append(obj)
+            return kept
+
+        if record_type == 'user_attribute':
+            existing = set(
+                UserAttribute.objects.filter(user=self.user, content__in=[obj.content for obj in objs])
+                .values_list('fact_type', 'content')
+            )
+            kept = []
+            for obj in objs:
+                key = (obj.fact_type, obj.content)
+                if key not in existing:
+                    existing.add(key)
+                    kept.append(obj)
+            return kept
+
+        return objs
+
+    def flush(self, record_type: str):
+        objs = self.buffers[record_type]
+        if not objs:
+            return
+        self.buffers[record_type] = []
+        model, fields = RECORD_FIELDS[record_type]
+
+        with transaction.atomic():
+            objs = self._skip_existing(record_type, objs)
+            # bulk_create는 auto_now_add 필드를 현재 시각으로 덮어쓰므로 원래 시각을 기억해 두었다가 되돌립니다.
+            restore = [name for name in _AUTO_NOW_ADD_FIELDS if name in fields]
+            original = [[getattr(obj, name) for name in restore] for obj in objs]
+            model.objects.bulk_create(objs)
+            for obj, values in zip(objs, original):
+                for name, value in zip(restore, values):
+                    if value is not None:
+                        setattr(obj, name, value)
+            if restore and objs:
+                model.objects.bulk_update(objs, restore)
+
+        self.counts[record_type] += len(objs)
+
+    def finish(self):
+        for record_type in RECORD_FIELDS:
+            self.flush(record_type)
+
+
+def import_lines(lines: Iterable[str], user, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """NDJSON 줄을 읽어 user의 기억으로 저장합니다. 반환값: 레코드 종류별 새로 저장한 수"""
+    importer = _Importer(user, batch_size or settings.MEMORY_IMPORT_BATCH_SIZE)
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            importer.add(json.loads(line))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"{number}번째 줄을 가져오지 못했습니다: {e}") from e
+    importer.finish()
+
+    # bulk_create는 signal을 보내지 않으므로 파생 데이터와 캐시를 한 번에 갱신합니다.
+    if settings.KEYWORD_INDEX_ENABLED:
+        keyword_index.rebuild([user.pk])
+    analytics.rebuild_rollups([user.pk])
+    user_context.invalidate(user.pk)
+    mention_tagger.invalidate(user.pk)
+    response_cache.invalidate(user.pk)
+    return importer.counts
@@ -0,0 +1,229 @@
+"""
+메시지에서 사용자의 인간관계(UserRelationship) 언급을 찾는 다중 패턴 매처 (Aho-Corasick)
+
+사용자별로 이름, "이름 + 포지션"(민수 오빠), "구분자 + 이름"(개발팀 민수), "이름(구분자)" 패턴으로
+오토마톤을 만들고, 메시지를 한 번 훑어(선형 시간) 일치하는 serial_code를 찾습니다.
+동명이인이 있을 때는 구분자/포지션까지 일치한 더 긴 패턴을 우선합니다.
+일치한 부분의 앞은 단어 경계여야 하고, 뒤는 단어 경계이거나 조사(은/는/이랑/한테 등)만 붙어 있어야 합니다.
+("민"이라는 이름이 "민수", "시민"에 걸리지 않도록)
+
+오토마톤은 프로세스 안에 사용자별로 캐시하고, 인간관계 버전 번호(UserProfile.relationships_version)가
+바뀌었을 때만 (= 그 사용자의 인간관계가 바뀌었을 때, signals.py) 다시 만듭니다.
+버전 번호는 DB에 있고 공유 캐시는 그 값을 읽어 둔 사본이므로, 캐시 항목이 지워져도 버전이 되돌아가지 않습니다.
+"""
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from ..models import UserProfile, UserRelationship
+
+# 이름 뒤에 붙어도 언급으로 보는 조사/호칭/서술격 어미 (여러 개가 이어 붙을 수 있음: "민수한테서는")
+PARTICLES = (
+    '은', '는', '이', '가', '을', '를', '의', '도', '만', '와', '과', '랑', '이랑', '하고',
+    '에', '에게', '에게서', '한테', '한테서', '께', '께서', '에서', '으로', '로', '처럼', '보다', '까지', '부터',
+    '아', '야', '이야', '이나', '나', '님', '씨', '이다', '다', '이에요', '예요', '이었', '였', '이라고', '라고',
+)
+_PARTICLE_RE = re.compile(
+    "(?:" + "|".join(re.escape(p) for p in sorted(PARTICLES, key=len, reverse=True)) + ")+"
+)
+
+
+class AhoCorasick:
+    """패턴 -> 값 집합을 찾는 간단한 Aho-Corasick 오토마톤"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        # 노드별 전이, 실패 링크, 출력 (패턴 길이, 값)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+
+        for pattern, value in patterns:
+            self._add(pattern, value)
+        self._build()
+
+    def _add(self, pattern: str, value: str):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append((len(pattern), value))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def search(self, text: str) -> List[Tuple[int, int, str]]:
+        """(시작 위치, 끝 위치, 값) 목록을 반환합니다."""
+        matches = []
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, value in self._output[node]:
+                matches.append((i - length + 1, i + 1, value))
+        return matches
+
+
+def _normalize(text: str) -> str:
+    """공백을 모두 제거하고 소문자로 바꿉니다. ("민수 오빠" == "민수오빠")"""
+    return "".join(text.split()).casefold()
+
+
+def _normalize_with_positions(text: str) -> Tuple[str, List[int]]:
+    """_normalize와 같은 문자열과, 각 글자가 원문의 몇 번째 글자에서 왔는지를 반환합니다."""
+    chars, positions = [], []
+    for i, ch in enumerate(text):
+        if ch.isspace():
+            continue
+        for folded in ch.casefold():
+            chars.append(folded)
+            positions.append(i)
+    return "".join(chars), positions
+
+
+def _is_whole_mention(text: str, start: int, end: int) -> bool:
+    """원문 text[start:end]가 다른 단어의 일부가 아니면 True (뒤에는 조사만 붙을 수 있음)"""
+    if start > 0 and text[start - 1].isalnum():
+        return False
+    word_end = end
+    while word_end < len(text) and text[word_end].isalnum():
+        word_end += 1
+    suffix = text[end:word_end]
+    return not suffix or _PARTICLE_RE.fullmatch(suffix) is not None
+
+
+def relationship_patterns(relationships: Iterable[Tuple[str, str, str, str]]) -> List[Tuple[str, str]]:
+    """(serial_code, name, position, disambiguator) 목록에서 (패턴, serial_code) 목록을 만듭니다."""
+    patterns = []
+    for serial_code, name, position, disambiguator in relationships:
+        name = _normalize(name or '')
+        if not name:
+            continue
+        patterns.append((name, serial_code))
+        for extra in (position, disambiguator):
+            extra = _normalize(extra or '')
+            if extra:
+                patterns.append((name + extra, serial_code))       # 민수오빠, 민수개발팀
+                patterns.append((extra + name, serial_code))       # 개발팀민수
+                patterns.append((f"{name}({extra})", serial_code))  # 민수(개발팀)
+    return patterns
+
+
+class MentionTagger:
+    def __init__(self, relationships: Iterable[Tuple[str, str, str, str]]):
+        self._automaton = AhoCorasick(relationship_patterns(relationships))
+
+    def tag(self, message: str) -> List[str]:
+        """
+        메시지에서 언급된 사람의 serial_code 목록을 (처음 언급된 순서로) 반환합니다.
+        겹치는 일치 중에서는 가장 긴 패턴만 남겨, 구분자로 특정된 동명이인을 고릅니다.
+        """
+        normalized, positions = _normalize_with_positions(message)
+        matches = [
+            (start, end, serial_code)
+            for start, end, serial_code in self._automaton.search(normalized)
+            if _is_whole_mention(message, positions[start], positions[end - 1] + 1)
+        ]
+        if not matches:
+            return []
+
+        # 시작 위치 순, 같은 위치에서는 긴 패턴 우선으로 정렬한 뒤 겹치는 짧은 일치를 버립니다.
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        spans: List[Tuple[int, int, Set[str]]] = []
+        for start, end, serial_code in matches:
+            if spans and start < spans[-1][1]:
+                last_start, last_end, codes = spans[-1]
+                if (start, end) == (last_start, last_end):
+                    codes.add(serial_code)  # 같은 패턴을 공유하는 동명이인
+                elif end - start > last_end - last_start:
+                    spans[-1] = (start, end, {serial_code})
+                continue
+            spans.append((start, end, {serial_code}))
+
+        result: List[str] = []
+        for _, _, codes in spans:
+            for serial_code in sorted(codes):
+                if serial_code not in result:
+                    result.append(serial_code)
+        return result
+
+
+# ----------------------------------------------------
+# 사용자별 캐시
+# ----------------------------------------------------
+_lock = threading.Lock()
+_taggers: "OrderedDict[int, Tuple[int, MentionTagger]]" = OrderedDict()
+
+
+def _version_key(user_id: int) -> str:
+    return f"mention_tagger_version:{user_id}"
+
+
+def _load_version(user_id: int) -> int:
+    return (
+        UserProfile.objects.filter(user_id=user_id).values_list('relationships_version', flat=True).first() or 0
+    )
+
+
+def invalidate(user_id: int):
+    """
+    사용자의 인간관계가 바뀌었음을 모든 워커에 알립니다. (DB의 버전 증가)
+    커밋 뒤 새 버전을 공유 캐시에 덮어씁니다. 캐시를 채우는 쪽(get_tagger)은 add만 하므로
+    커밋 전에 읽은 옛 버전이 새 버전을 덮어쓰지 못합니다.
+    """
+    UserProfile.objects.filter(user_id=user_id).update(relationships_version=F('relationships_version') + 1)
+    transaction.on_commit(lambda: cache.set(_version_key(user_id), _load_version(user_id), timeout=None))
+
+
+def get_tagger(user_id: int) -> MentionTagger:
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = _load_version(user_id)
+        cache.add(key, version, timeout=None)
+    with _lock:
+        cached = _taggers.get(user_id)
+        if cached and cached[0] == version:
+            _taggers.move_to_end(user_id)
+            return cached[1]
+
+    relationships = [
+        (str(serial_code), name, position, disambiguator)
+        for serial_code, name, position, disambiguator in UserRelationship.objects.filter(user_id=user_id)
+        .values_list('serial_code', 'name', 'position', 'disambiguator')
+    ]
+    tagger = MentionTagger(relationships)
+
+    with _lock:
+        _taggers[user_id] = (version, tagger)
+        _taggers.move_to_end(user_id)
+        while len(_taggers) > settings.MENTION_TAGGER_CACHE_USERS:
+            _taggers.popitem(last=False)
+    return tagger
+
+
+def tag_mentions(user_id: int, message: str) -> List[str]:
+    """메시지에서 언급된 인간관계의 serial_code 목록을 반환합니다."""
+    return get_tagger(user_id).tag(message)
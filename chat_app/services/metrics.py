@@ -0,0 +1,261 @@
+"""
+채팅 파이프라인 단계별 지연 시간 / 토큰 사용량 지표
+
+- timed(stage): 임베딩, Pinecone 검색, LLM 호출, DB 읽기/쓰기 등 한 단계의 소요 시간을
+  히스토그램(chat_stage_duration_seconds)에 기록하고, 현재 요청의 Server-Timing 헤더에도 넣습니다.
+  (헤더는 chat_app.middleware.server_timing_middleware가 붙입니다.)
+- inc(name, ...): 카운터 (예: LLM 응답의 토큰 사용량 llm_tokens_total)
+- set_gauge(name, value, ...): 현재 값 (예: 입장 제어 대기열 길이 admission_queue_depth, 워커 합계로 집계)
+- render_prometheus(): Prometheus 텍스트 형식으로 내보냅니다. (/metrics/)
+
+지표는 프로세스 안에 누적하고 METRICS_FLUSH_INTERVAL마다 공유 캐시에 스냅샷을 올립니다.
+/metrics/는 살아 있는 모든 워커의 스냅샷을 합쳐서 보여주므로, 어느 gunicorn 워커가 요청을 받아도 같은 값을 봅니다.
+스냅샷은 워커마다 자기 키(metrics:process:<pid>, TTL)에만 쓰고, 워커 목록 키(metrics:processes)는
+자기 pid가 빠져 있을 때만 고칩니다. 동시에 시작한 워커끼리 목록을 덮어써 pid가 빠지더라도
+다음 flush에서 다시 넣으므로, 목록은 늦어도 METRICS_FLUSH_INTERVAL 안에 맞춰집니다.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 히스토그램 버킷 경계 (초)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_HELP = {
+    'chat_stage_duration_seconds': ('histogram', "채팅 파이프라인 단계별 소요 시간"),
+    'http_request_duration_seconds': ('histogram', "뷰별 전체 요청 처리 시간"),
+    'http_requests_total': ('counter', "뷰/상태 코드별 요청 수"),
+    'llm_tokens_total': ('counter', "LLM 응답이 보고한 토큰 사용량"),
+    'admission_inflight': ('gauge', "입장 제어를 통과해 실행 중인 채팅 요청 수"),
+    'admission_queue_depth': ('gauge', "입장 제어 대기열에서 기다리는 채팅 요청 수"),
+    'admission_queue_wait_seconds': ('histogram', "입장 제어 대기열에서 기다린 시간"),
+    'admission_rejected_total': ('counter', "입장 제어에서 거절된 요청 수 (사유별)"),
+    'retrieval_vector_skipped_total': ('counter', "키워드 검색 결과만으로 충분해 벡터 조회를 생략한 횟수"),
+    'retrieval_cache_lookups_total': ('counter', "벡터 검색 결과 캐시 조회 수 (hit/miss)"),
+    'retrieval_cache_stored_bytes_total': ('counter', "벡터 검색 결과 캐시에 저장한 문서 텍스트 바이트 수"),
+    'retrieval_cache_invalidations_total': ('counter', "벡터 업서트로 검색 결과 캐시를 무효화한 사용자 수"),
+    'background_tasks_total': ('counter', "백그라운드 작업 실행 결과 수 (ok/retry/failed/inline)"),
+    'background_queue_depth': ('gauge', "백그라운드 작업자 큐에서 기다리는 작업 수"),
+}
+
+_PROCESSES_KEY = 'metrics:processes'
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, LabelKey], float] = {}
+_gauges: Dict[Tuple[str, LabelKey], float] = {}
+# (name, labels) -> [버킷별 개수(비누적)..., +Inf 개수, 합계]
+_histograms: Dict[Tuple[str, LabelKey], List[float]] = {}
+_last_flush = 0.0
+
+# 현재 요청에서 기록된 단계별 시간 [(stage, seconds)] (Server-Timing 헤더용)
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    'request_timings', default=None
+)
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, amount: float = 1, **labels):
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+    _maybe_flush()
+
+
+def set_gauge(name: str, value: float, **labels):
+    key = (name, _label_key(labels))
+    with _lock:
+        _gauges[key] = value
+    _maybe_flush()
+
+
+def observe(name: str, value: float, **labels):
+    key = (name, _label_key(labels))
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                values[i] += 1
+                break
+        else:
+            values[len(BUCKETS)] += 1
+        values[-1] += value
+    _maybe_flush()
+
+
+def record_stage(stage: str, seconds: float):
+    """단계 소요 시간을 히스토그램과 현재 요청의 Server-Timing 목록에 기록합니다."""
+    observe('chat_stage_duration_seconds', seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+async def atimed(stage: str, awaitable):
+    """awaitable을 기다리는 시간을 stage로 기록합니다. (asyncio.gather 안에서 쓰기 위함)"""
+    with timed(stage):
+        return await awaitable
+
+
+def record_llm_usage(model: str, usage):
+    """OpenAI 응답의 usage(prompt/completion 토큰 수)를 카운터에 더합니다."""
+    if usage is None:
+        return
+    inc('llm_tokens_total', usage.prompt_tokens or 0, model=model, type='prompt')
+    inc('llm_tokens_total', usage.completion_tokens or 0, model=model, type='completion')
+
+
+# ----------------------------------------------------
+# 요청 단위 (Server-Timing)
+# ----------------------------------------------------
+def start_request() -> contextvars.Token:
+    return _request_timings.set([])
+
+
+def finish_request(token: contextvars.Token) -> List[Tuple[str, float]]:
+    """현재 요청에서 기록된 단계별 시간을 단계 이름 기준으로 합쳐 반환합니다."""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+
+    merged: Dict[str, float] = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    return list(merged.items())
+
+
+def server_timing_header(timings: List[Tuple[str, float]]) -> str:
+    return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+# ----------------------------------------------------
+# 워커 간 공유 (공유 캐시 스냅샷)
+# ----------------------------------------------------
+def _process_key(pid: int) -> str:
+    return f"metrics:process:{pid}"
+
+
+def _snapshot() -> Dict:
+    with _lock:
+        return {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': {key: list(values) for key, values in _histograms.items()},
+        }
+
+
+def flush():
+    """현재 프로세스의 누적 지표를 공유 캐시에 올립니다."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    pid = os.getpid()
+    ttl = settings.METRICS_PROCESS_TTL
+    try:
+        cache.set(_process_key(pid), _snapshot(), timeout=ttl)
+        pids = cache.get(_PROCESSES_KEY) or []
+        if pid not in pids:
+            _register(pid, pids)
+    except Exception as e:
+        print(f"[Metrics] 지표 스냅샷 저장 실패: {e}")
+
+
+def _register(pid: int, pids: List[int]):
+    """워커 목록에 pid를 넣고, 스냅샷이 만료된(종료된) 워커는 뺍니다."""
+    alive = cache.get_many([_process_key(p) for p in pids])
+    pids = [p for p in pids if _process_key(p) in alive] + [pid]
+    cache.set(_PROCESSES_KEY, pids, timeout=None)
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def collect() -> Dict:
+    """살아 있는 모든 워커의 스냅샷을 합칩니다."""
+    flush()
+    pids = cache.get(_PROCESSES_KEY) or []
+    snapshots = cache.get_many([_process_key(pid) for pid in pids]).values()
+
+    counters: Dict[Tuple[str, LabelKey], float] = {}
+    gauges: Dict[Tuple[str, LabelKey], float] = {}
+    histograms: Dict[Tuple[str, LabelKey], List[float]] = {}
+    for snapshot in snapshots:
+        for key, value in snapshot['counters'].items():
+            counters[key] = counters.get(key, 0) + value
+        for key, value in snapshot.get('gauges', {}).items():
+            gauges[key] = gauges.get(key, 0) + value
+        for key, values in snapshot['histograms'].items():
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+    return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+
+# ----------------------------------------------------
+# Prometheus 텍스트 형식
+# ----------------------------------------------------
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus() -> str:
+    data = collect()
+    lines = []
+    names = sorted(
+        {name for name, _ in data['counters']}
+        | {name for name, _ in data['gauges']}
+        | {name for name, _ in data['histograms']}
+    )
+    for name in names:
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        for (metric, labels), value in sorted([*data['counters'].items(), *data['gauges'].items()]):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+
+        for (metric, labels), values in sorted(data['histograms'].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', repr(bound)),))} {_format_number(cumulative)}")
+            cumulative += values[len(BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {_format_number(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(values[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_format_number(cumulative)}")
+    return '\n'.join(lines) + '\n'
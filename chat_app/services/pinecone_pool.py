@@ -0,0 +1,163 @@
+"""
+워커 프로세스당 하나의 Pinecone 인덱스 핸들을 재사용하기 위한 풀
+
+- 첫 사용(또는 워커 시작 시 warm_up) 때 클라이언트와 인덱스 핸들을 한 번만 만들고,
+  이후 요청은 같은 핸들(= 같은 keep-alive HTTP 커넥션 풀)을 공유합니다.
+- 호출이 실패하면 핸들을 버리고 다음 호출에서 다시 연결합니다.
+  (실패 직후 RECONNECT_BACKOFF 동안은 곧바로 실패시켜 장애 시 요청이 쌓이지 않게 합니다.)
+- status()로 connected/degraded 상태와 마지막 오류 시각을 뷰에 제공합니다.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+
+STATE_DISCONNECTED = 'disconnected'
+STATE_CONNECTED = 'connected'
+STATE_DEGRADED = 'degraded'
+
+
+def create_pinecone_index():
+    """환경 변수로 Pinecone 클라이언트를 초기화하고 인덱스 핸들을 반환합니다."""
+    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+    PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
+    PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+    PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "")
+
+    # 환경 변수 체크
+    if not PINECONE_API_KEY or not PINECONE_ENVIRONMENT or not PINECONE_INDEX_NAME:
+        # Django runserver 체크 단계에서 에러가 나지 않도록 일반적인 Exception 처리
+        raise EnvironmentError("필수 Pinecone 환경 변수(KEY, ENV, NAME)가 설정되지 않았습니다.")
+
+    # SDK import가 무거우므로 처음 연결할 때 불러옵니다.
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
+
+    # host를 알고 있으면 describe_index(컨트롤 플레인) 호출을 건너뜁니다.
+    return pc.Index(
+        PINECONE_INDEX_NAME,
+        host=PINECONE_INDEX_HOST,
+        pool_threads=settings.PINECONE_POOL_THREADS,
+        connection_pool_maxsize=settings.PINECONE_CONNECTION_POOL_MAXSIZE,
+    )
+
+
+class PineconeIndexPool:
+    """프로세스 전역에서 공유하는 Pinecone 인덱스 핸들과 그 상태를 관리합니다."""
+
+    def __init__(self, index_factory: Optional[Callable] = None):
+        self._lock = threading.Lock()
+        self._index_factory = index_factory or create_pinecone_index
+        self._index = None
+        self._pid = None
+        self.state = STATE_DISCONNECTED
+        self.connected_at = None
+        self.last_error = None
+        self.last_error_at = None
+        self.consecutive_failures = 0
+
+    def configure(self, index_factory: Callable):
+        """인덱스 생성 함수를 교체합니다. (테스트에서 로컬 가짜 인덱스를 주입할 때 사용)"""
+        with self._lock:
+            self._index_factory = index_factory
+            self._index = None
+            self.state = STATE_DISCONNECTED
+            self.consecutive_failures = 0
+            self.last_error = None
+            self.last_error_at = None
+
+    def get_index(self):
+        """공유 인덱스 핸들을 반환합니다. 없으면 (재)연결합니다."""
+        index = self._index
+        # fork 이전(gunicorn --preload)에 만든 핸들은 커넥션을 공유하므로 재사용하지 않습니다.
+        if index is not None and self._pid == os.getpid():
+            return index
+
+        with self._lock:
+            if self._index is not None and self._pid == os.getpid():
+                return self._index
+
+            if self.last_error_at and self.consecutive_failures:
+                elapsed = time.time() - self.last_error_at
+                if elapsed < settings.PINECONE_RECONNECT_BACKOFF:
+                    raise ConnectionError(f"Pinecone 재연결 대기 중입니다. (마지막 오류: {self.last_error})")
+
+            try:
+                self._index = self._index_factory()
+            except Exception as e:
+                self._record_failure(e)
+                raise
+
+            self._pid = os.getpid()
+            self.state = STATE_CONNECTED
+            self.connected_at = time.time()
+            return self._index
+
+    def warm_up(self):
+        """
+        워커 시작 시 호출하여 인덱스 핸들을 만들고 keep-alive 커넥션을 미리 엽니다.
+        실패해도 예외를 올리지 않고 상태만 기록합니다.
+        """
+        try:
+            self.get_index().describe_index_stats()
+            self.report_success()
+            print("[Pinecone] 인덱스 연결을 미리 열었습니다.")
+        except Exception as e:
+            self.report_failure(e)
+            print(f"[Pinecone] 워밍업 실패: {e}")
+
+    def query(self, **kwargs):
+        return self._call('query', **kwargs)
+
+    def upsert(self, **kwargs):
+        return self._call('upsert', **kwargs)
+
+    def delete(self, **kwargs):
+        return self._call('delete', **kwargs)
+
+    def fetch(self, **kwargs):
+        return self._call('fetch', **kwargs)
+
+    def _call(self, method: str, **kwargs):
+        """공유 핸들로 method(query/upsert/delete/fetch)를 실행하고 결과에 따라 상태를 갱신합니다."""
+        index = self.get_index()
+        try:
+            result = getattr(index, method)(**kwargs)
+        except Exception as e:
+            self.report_failure(e)
+            raise
+        self.report_success()
+        return result
+
+    def report_success(self):
+        if self.state != STATE_CONNECTED or self.consecutive_failures:
+            with self._lock:
+                self.state = STATE_CONNECTED
+                self.consecutive_failures = 0
+
+    def report_failure(self, error: Exception):
+        """호출 실패를 기록하고, 다음 호출에서 새로 연결하도록 핸들을 버립니다."""
+        with self._lock:
+            self._index = None
+            self._record_failure(error)
+
+    def _record_failure(self, error: Exception):
+        self.state = STATE_DEGRADED
+        self.last_error = str(error)
+        self.last_error_at = time.time()
+        self.consecutive_failures += 1
+
+    def status(self) -> Dict:
+        return {
+            'state': self.state,
+            'connected_at': self.connected_at,
+            'last_error': self.last_error,
+            'last_error_at': self.last_error_at,
+            'consecutive_failures': self.consecutive_failures,
+        }
+
+
+pinecone_pool = PineconeIndexPool()
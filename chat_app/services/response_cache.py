@@ -0,0 +1,136 @@
+"""
+사용자별 시맨틱 응답 캐시 (opt-in)
+
+짧은 시간 안에 거의 같은 질문이 반복되면 LLM을 다시 호출하지 않고 이전 답변을 돌려줍니다.
+- 새 쿼리 임베딩과 캐시된 쿼리 임베딩의 코사인 유사도가 RESPONSE_CACHE_SIMILARITY 이상이고
+- 이전 대화 요약과 사용자 컨텍스트가 그대로이고(context_fingerprint 비교)
+- 검색된 문서 집합이 그대로일 때(docs_fingerprint 비교)만 적중으로 봅니다.
+  최근 대화는 키에 넣지 않습니다. 넣으면 답변을 받은 뒤 같은 질문을 다시 할 때 최근 대화에
+  직전 질문/답변이 들어가 있어 절대 적중하지 않기 때문입니다.
+  같은 이유로 검색 문서에서도 캐시된 질문/답변 자신(과 지금 질문)의 대화 줄은 빼고 비교합니다.
+  그 턴이 적재된 뒤 다시 검색되더라도 "새 문서"로 보지 않기 위함입니다.
+- 항목은 RESPONSE_CACHE_TTL 뒤 만료되며, 사용자 기억 데이터가 바뀌면 signals에서 invalidate합니다.
+
+여러 gunicorn 워커가 같은 캐시를 보도록 Django 기본 캐시(CACHES['default'])에 저장합니다.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+
+def _cache_key(user_id: int) -> str:
+    return f"response_cache:{user_id}"
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _digest(payload) -> str:
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def context_fingerprint(context: Optional[Dict]) -> str:
+    """질문과 검색 문서를 뺀 프롬프트 입력(이전 대화 요약, 사용자 컨텍스트)의 지문을 만듭니다."""
+    context = context or {}
+    return _digest([
+        context.get('conversation_summary', ''),
+        context.get('affinity_score'),
+        [item['text'] for item in context.get('items', [])],
+    ])
+
+
+def docs_fingerprint(retrieved_docs: List[str], own_turn: Iterable[str]) -> str:
+    """
+    검색된 문서 집합의 지문을 만듭니다. (순서 무관)
+    own_turn의 메시지로 끝나는 대화 줄("[시각] 사용자: <메시지>")은 제외합니다.
+    """
+    suffixes = tuple(f": {text.strip()}" for text in own_turn if text and text.strip())
+    docs = [doc.rstrip() for doc in retrieved_docs]
+    return _digest(sorted(doc for doc in docs if not (suffixes and doc.endswith(suffixes))))
+
+
+def _best_match(query_embedding: List[float], entries: List[Dict]) -> Optional[Dict]:
+    """코사인 유사도가 RESPONSE_CACHE_SIMILARITY 이상인 항목 중 가장 가까운 것을 반환합니다."""
+    import numpy as np
+
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = float(np.linalg.norm(query))
+    entries = [entry for entry in entries if entry['norm'] and len(entry['embedding']) == query.nbytes]
+    if not query_norm or not entries:
+        return None
+
+    matrix = np.frombuffer(b''.join(entry['embedding'] for entry in entries), dtype=np.float32)
+    matrix = matrix.reshape(len(entries), query.shape[0])
+    norms = np.array([entry['norm'] for entry in entries], dtype=np.float32)
+    scores = matrix @ query / (norms * query_norm)
+
+    best = int(np.argmax(scores))
+    return entries[best] if scores[best] >= settings.RESPONSE_CACHE_SIMILARITY else None
+
+
+def is_enabled(opted_in: bool) -> bool:
+    """전역 설정과 사용자별 opt-in 설정(UserProfile.response_cache_enabled)이 모두 켜져 있을 때만 캐시를 사용합니다."""
+    return bool(settings.RESPONSE_CACHE_ENABLED and opted_in)
+
+
+def lookup(
+    user_id: int, query_embedding: List[float], query: str, retrieved_docs: List[str], context_fp: str
+    ) -> Optional[str]:
+    """조건에 맞는 캐시된 답변이 있으면 반환하고, 없으면 None을 반환합니다."""
+    entries = cache.get(_cache_key(user_id)) or []
+    now = time.time()
+    candidates = [
+        entry for entry in entries
+        if now - entry['created_at'] <= settings.RESPONSE_CACHE_TTL
+        and entry.get('context') == context_fp
+        and entry.get('docs') == docs_fingerprint(retrieved_docs, (entry['query'], entry['answer'], query))
+    ]
+    match = _best_match(query_embedding, candidates) if candidates else None
+
+    _count('hits' if match is not None else 'misses')
+    return match['answer'] if match is not None else None
+
+
+def store(
+    user_id: int, query_embedding: List[float], query: str, retrieved_docs: List[str], context_fp: str, answer: str
+    ):
+    import numpy as np
+
+    key = _cache_key(user_id)
+    now = time.time()
+    entries = [
+        entry for entry in (cache.get(key) or [])
+        if now - entry['created_at'] <= settings.RESPONSE_CACHE_TTL
+    ]
+    embedding = np.asarray(query_embedding, dtype=np.float32)
+    entries.append({
+        'embedding': embedding.tobytes(),
+        'norm': float(np.linalg.norm(embedding)),
+        'query': query,
+        'context': context_fp,
+        'docs': docs_fingerprint(retrieved_docs, (query, answer)),
+        'answer': answer,
+        'created_at': now,
+    })
+    cache.set(key, entries[-settings.RESPONSE_CACHE_MAX_ENTRIES:], timeout=settings.RESPONSE_CACHE_TTL)
+    _count('stores')
+
+
+def invalidate(user_id: int):
+    cache.delete(_cache_key(user_id))
+    _count('invalidations')
+
+
+def stats() -> Dict:
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,66 @@
+"""
+사용자별 벡터 검색 결과 캐시
+
+같은 사용자가 몇 초 안에 관련 메시지를 여러 번 보내면 search_documents가 같은 필터의
+Pinecone query를 반복합니다. 쿼리 임베딩(+ top_k)을 키로 top-k 결과 텍스트를 RETRIEVAL_CACHE_TTL초 동안 보관합니다.
+
+무효화는 사용자별 세대(generation) 번호로 합니다.
+- vector_store.upsert_vectors가 그 사용자의 벡터를 저장할 때마다 세대를 올립니다.
+- 항목에는 조회 직전에 읽은 세대를 함께 저장하고, 조회 때 현재 세대와 다르면 버립니다.
+  (조회 도중 업서트가 끝나도 그 결과는 이전 세대로 저장되므로 다시 쓰이지 않습니다.)
+
+세대 번호와 항목 모두 Django 기본 캐시(CACHES['default'])에 두므로 gunicorn 워커끼리 공유됩니다.
+적중/미스/저장 바이트 수는 metrics로 /metrics/에 노출됩니다.
+"""
+import hashlib
+from array import array
+from typing import Callable, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+
+def _generation_key(user_id: int) -> str:
+    return f"retrieval_cache:gen:{user_id}"
+
+
+def _entry_key(user_id: int, query_embedding: List[float], top_k: int) -> str:
+    digest = hashlib.sha1(array('f', query_embedding).tobytes())
+    digest.update(str(top_k).encode())
+    return f"retrieval_cache:{user_id}:{digest.hexdigest()}"
+
+
+def get_or_query(
+    user_id: int, query_embedding: List[float], top_k: int, query: Callable[[], List[str]]
+    ) -> List[str]:
+    """캐시된 결과가 현재 세대이면 그대로, 아니면 query()를 실행해 저장한 뒤 반환합니다."""
+    if settings.RETRIEVAL_CACHE_TTL <= 0:
+        return query()
+
+    generation_key = _generation_key(user_id)
+    entry_key = _entry_key(user_id, query_embedding, top_k)
+    found = cache.get_many([generation_key, entry_key])
+    generation = found.get(generation_key, 0)
+    entry = found.get(entry_key)
+    if entry is not None and entry[0] == generation:
+        metrics.inc('retrieval_cache_lookups_total', result='hit')
+        return list(entry[1])
+
+    metrics.inc('retrieval_cache_lookups_total', result='miss')
+    texts = query()
+    cache.set(entry_key, (generation, texts), timeout=settings.RETRIEVAL_CACHE_TTL)
+    metrics.inc('retrieval_cache_stored_bytes_total', sum(len(text.encode('utf-8')) for text in texts))
+    return texts
+
+
+def invalidate(user_ids: Iterable[int]):
+    """사용자들의 캐시된 검색 결과를 모든 워커에서 무효화합니다. (세대 증가)"""
+    for user_id in set(user_ids):
+        key = _generation_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+        metrics.inc('retrieval_cache_invalidations_total')
@@ -0,0 +1,142 @@
+"""
+채팅 전송 요청의 single-flight 중복 제거
+
+네트워크가 불안정한 클라이언트의 재시도/연타로 같은 메시지가 여러 번 들어와도
+임베딩 → 검색 → LLM → 저장 과정을 한 번만 실행합니다.
+
+- 키: 사용자 + 정규화한 메시지 내용 + (선택) 클라이언트가 보낸 Idempotency-Key
+- 처음 들어온 요청(리더)만 cache.add로 잠금을 잡고 실제 처리를 합니다. 잠금 값은 이번 처리(flight)의 토큰입니다.
+- 처리 중에 들어온 같은 요청은 공유 캐시를 짧게 폴링하며 그 토큰의 결과(리더의 결과)를 기다립니다.
+  리더의 결과는 기다리던 요청이 가져갈 동안(CHAT_SEND_DEDUP_WINDOW)만 토큰별 키에 남습니다.
+- 처리가 끝난 뒤에 들어온 같은 메시지는 새로 처리합니다. ("응", "ㅋㅋ" 같은 짧은 메시지를 다시 보내도
+  예전 답이 재생되지 않도록) 끝난 결과를 재사용하는 것은 Idempotency-Key를 보낸 요청뿐이며,
+  그 결과는 CHAT_SEND_IDEMPOTENCY_TTL 동안 저장됩니다.
+
+잠금은 원자적 add가 보장되는 잠금 전용 캐시(locks.lock_cache())에, 결과는 Django 기본 캐시에 두므로
+gunicorn 워커끼리도 동작합니다.
+실패한 결과는 저장하지 않으므로, 리더가 실패하면 기다리던 요청 중 하나가 새 리더가 되어 다시 처리합니다.
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .embedding_cache import normalize_query
+from .locks import lock_cache
+
+# 대기 중 폴링 간격 (초): 처음엔 짧게, 점점 늘려서 최대값까지
+POLL_INITIAL = 0.05
+POLL_MAX = 0.5
+
+Result = Tuple[Dict, int]  # (응답 본문, HTTP 상태 코드)
+
+
+class SingleFlightTimeout(Exception):
+    """같은 요청의 처리가 CHAT_SEND_INFLIGHT_TIMEOUT 안에 끝나지 않았습니다."""
+
+
+def make_key(user_id: int, message: str, idempotency_key: Optional[str] = None) -> str:
+    raw = f"{user_id}\0{normalize_query(message)}\0{idempotency_key or ''}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _lock_key(key: str) -> str:
+    return f"chat_send:lock:{key}"
+
+
+def _result_key(key: str) -> str:
+    """Idempotency-Key가 있는 요청의 완료된 결과"""
+    return f"chat_send:result:{key}"
+
+
+def _flight_result_key(key: str, token: str) -> str:
+    """한 번의 처리(flight)의 결과 (그 처리 중에 기다리던 요청용)"""
+    return f"chat_send:flight:{key}:{token}"
+
+
+def _results_to_store(key: str, token: str, idempotency_key: Optional[str], result: Result) -> List[Tuple[str, Result, int]]:
+    """리더가 저장할 [(캐시 키, 결과, TTL)]"""
+    entries = [(_flight_result_key(key, token), result, settings.CHAT_SEND_DEDUP_WINDOW)]
+    if idempotency_key:
+        entries.append((_result_key(key), result, settings.CHAT_SEND_IDEMPOTENCY_TTL))
+    return entries
+
+
+def _keys_to_check(key: str, idempotency_key: Optional[str], waiting_for: Optional[str]) -> List[str]:
+    """재사용할 수 있는 결과가 있을 캐시 키 목록 (앞쪽 우선)"""
+    keys = [_result_key(key)] if idempotency_key else []
+    if waiting_for:
+        keys.append(_flight_result_key(key, waiting_for))
+    return keys
+
+
+def _first_found(found: Dict, keys: List[str]) -> Optional[Result]:
+    return next((found[k] for k in keys if k in found), None)
+
+
+def run_once(key: str, idempotency_key: Optional[str], fn: Callable[[], Result]) -> Tuple[Result, bool]:
+    """
+    같은 key에 대해 동시에 들어온 요청 중 하나만 fn을 실행합니다.
+    (결과, 다른 요청의 결과를 재사용했는지 여부)를 반환합니다.
+    """
+    deadline = time.monotonic() + settings.CHAT_SEND_INFLIGHT_TIMEOUT
+    delay = POLL_INITIAL
+    waiting_for = None # 기다리고 있는 처리의 토큰
+    while True:
+        keys = _keys_to_check(key, idempotency_key, waiting_for)
+        stored = _first_found(cache.get_many(keys), keys) if keys else None
+        if stored is not None:
+            return stored, True
+
+        token = uuid.uuid4().hex
+        if lock_cache().add(_lock_key(key), token, timeout=settings.CHAT_SEND_INFLIGHT_TIMEOUT):
+            try:
+                result = fn()
+                if result[1] < 400:
+                    for result_key, value, ttl in _results_to_store(key, token, idempotency_key, result):
+                        cache.set(result_key, value, timeout=ttl)
+                return result, False
+            finally:
+                lock_cache().delete(_lock_key(key))
+
+        # 다른 요청이 처리 중입니다. 그 결과가 저장되거나(성공) 잠금이 풀릴 때(실패)까지 기다립니다.
+        waiting_for = lock_cache().get(_lock_key(key)) or waiting_for
+        if time.monotonic() >= deadline:
+            raise SingleFlightTimeout()
+        time.sleep(delay)
+        delay = min(delay * 2, POLL_MAX)
+
+
+async def arun_once(
+    key: str, idempotency_key: Optional[str], fn: Callable[[], Awaitable[Result]]
+    ) -> Tuple[Result, bool]:
+    """run_once의 비동기 버전입니다."""
+    deadline = time.monotonic() + settings.CHAT_SEND_INFLIGHT_TIMEOUT
+    delay = POLL_INITIAL
+    waiting_for = None
+    while True:
+        keys = _keys_to_check(key, idempotency_key, waiting_for)
+        stored = _first_found(await cache.aget_many(keys), keys) if keys else None
+        if stored is not None:
+            return stored, True
+
+        token = uuid.uuid4().hex
+        if await lock_cache().aadd(_lock_key(key), token, timeout=settings.CHAT_SEND_INFLIGHT_TIMEOUT):
+            try:
+                result = await fn()
+                if result[1] < 400:
+                    for result_key, value, ttl in _results_to_store(key, token, idempotency_key, result):
+                        await cache.aset(result_key, value, timeout=ttl)
+                return result, False
+            finally:
+                await lock_cache().adelete(_lock_key(key))
+
+        waiting_for = await lock_cache().aget(_lock_key(key)) or waiting_for
+        if time.monotonic() >= deadline:
+            raise SingleFlightTimeout()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, POLL_MAX)
@@ -0,0 +1,132 @@
+"""
+시스템 프롬프트용 사용자 컨텍스트 빌더
+
+UserProfile(호감도, memory), UserAttribute, UserRelationship을 항목 목록으로 만들어
+공유 캐시에 보관하고(모델 signal로 무효화), 매 턴에는 캐시된 항목을 쿼리와의 관련도 순으로
+골라 토큰 예산(USER_CONTEXT_TOKEN_BUDGET) 안에 들어가는 만큼만 블록으로 만듭니다.
+캐시가 살아 있는 동안에는 프로필 컨텍스트를 위한 DB 쿼리가 발생하지 않습니다.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ..models import ConversationSummary, UserAttribute, UserProfile, UserRelationship
+from .ingestion import user_relationship_text
+
+# 항목 종류별 기본 우선순위 (관련도가 같으면 높은 쪽을 먼저 넣습니다)
+PRIORITY = {
+    'memory': 3.0,
+    'attribute': 2.0,
+    'relationship': 1.0,
+}
+
+
+def _cache_key(user_id: int) -> str:
+    return f"user_context:{user_id}"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    토크나이저 없이 토큰 수를 보수적으로 추정합니다.
+    한글/한자 등 비ASCII 문자는 글자당 1토큰, ASCII는 4글자당 1토큰으로 셉니다.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_chars = len(text) - non_ascii
+    return non_ascii + (ascii_chars + 3) // 4
+
+
+def _bigrams(text: str) -> Set[str]:
+    """관련도 계산용 글자 bigram 집합 (띄어쓰기가 불규칙한 한국어에 맞춰 공백을 제거)"""
+    compact = "".join(text.split()).casefold()
+    if len(compact) < 2:
+        return {compact} if compact else set()
+    return {compact[i:i + 2] for i in range(len(compact) - 1)}
+
+
+def load_user_context(user_id: int) -> Dict:
+    """DB에서 사용자 컨텍스트 항목을 읽어 캐시 가능한 dict로 만듭니다."""
+    profile = UserProfile.objects.filter(user_id=user_id).first()
+    items: List[Dict] = []
+
+    if profile is not None:
+        for key, value in (profile.memory or {}).items():
+            values = value if isinstance(value, list) else [value]
+            for v in values:
+                items.append({'kind': 'memory', 'text': f"{key}: {v}"})
+
+    for fact_type, content in UserAttribute.objects.filter(user_id=user_id).values_list('fact_type', 'content'):
+        if content:
+            items.append({'kind': 'attribute', 'text': f"{fact_type}: {content}" if fact_type else content})
+
+    for rel in UserRelationship.objects.filter(user_id=user_id):
+        items.append({'kind': 'relationship', 'text': user_relationship_text(rel), 'serial_code': str(rel.serial_code)})
+
+    conversation_summary = (
+        ConversationSummary.objects.filter(user_id=user_id).values_list('summary', flat=True).first() or ''
+    )
+
+    return {
+        'affinity_score': profile.affinity_score if profile else 0,
+        'response_cache_enabled': bool(profile and profile.response_cache_enabled),
+        'items': items,
+        # 오래된 대화의 롤링 요약 (build_user_context의 토큰 예산과 별도로 프롬프트에 들어갑니다)
+        'conversation_summary': conversation_summary,
+    }
+
+
+def get_user_context(user_id: int) -> Dict:
+    """캐시된 사용자 컨텍스트를 반환하고, 없으면 DB에서 읽어 캐시합니다."""
+    key = _cache_key(user_id)
+    context = cache.get(key)
+    if context is None:
+        context = load_user_context(user_id)
+        cache.set(key, context, timeout=settings.USER_CONTEXT_CACHE_TTL)
+    return context
+
+
+def invalidate(user_id: int):
+    cache.delete(_cache_key(user_id))
+
+
+def build_user_context(
+    context: Optional[Dict],
+    query: str,
+    budget_tokens: Optional[int] = None,
+    boost_serial_codes: Iterable[str] = (),
+    ) -> str:
+    """
+    쿼리와 관련도가 높은 항목부터 토큰 예산 안에서 골라 시스템 프롬프트용 블록을 만듭니다.
+    boost_serial_codes에 있는 인간관계(메시지에서 언급된 사람)는 항상 먼저 넣습니다.
+    """
+    if not context:
+        return ""
+    if budget_tokens is None:
+        budget_tokens = settings.USER_CONTEXT_TOKEN_BUDGET
+
+    query_grams = _bigrams(query)
+    boosted = set(boost_serial_codes)
+
+    def score(item: Dict) -> float:
+        if item.get('serial_code') in boosted:
+            return float('inf')
+        grams = _bigrams(item['text'])
+        overlap = len(query_grams & grams) / len(grams) if grams else 0.0
+        if not overlap and item['kind'] == 'relationship':
+            return 0.0  # 언급되지 않은 사람은 넣지 않습니다.
+        return overlap * 10 + PRIORITY.get(item['kind'], 0.0)
+
+    ranked = [(score(item), item) for item in context['items']]
+    ranked = [(s, item) for s, item in ranked if s > 0]
+    ranked.sort(key=lambda pair: pair[0], reverse=True)
+
+    header = f"호감도: {context['affinity_score']}"
+    lines = [header]
+    used = estimate_tokens(header)
+    for _, item in ranked:
+        cost = estimate_tokens(item['text']) + 1
+        if used + cost > budget_tokens:
+            continue
+        lines.append(f"- {item['text']}")
+        used += cost
+    return "\n".join(lines)
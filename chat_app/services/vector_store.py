@@ -0,0 +1,479 @@
+"""
+search_documents / ingest_vectors 뒤에 있는 벡터 저장소 인터페이스
+
+- PineconeVectorStore: 기존 Pinecone 인덱스 (user_id 메타데이터 필터)
+- LocalVectorStore: 사용자별 NumPy 행렬 파일을 메모리 맵으로 읽어 프로세스 안에서 top-k를 계산
+  (float32 / float16 / int8 저장 지원, 네트워크 왕복 없음)
+
+VECTOR_STORE_BACKEND 설정으로 배포별 백엔드를 고르고,
+'auto'이면 벡터 수가 VECTOR_STORE_LOCAL_MAX_VECTORS 이하인 사용자만 로컬에서 조회합니다.
+'auto'의 로컬 사본은 Pinecone에서 그 사용자의 벡터를 모두 받아 온 뒤(mirror_user)에만 완성 표시가 붙고,
+완성 표시가 있는 사용자만 로컬에서 조회합니다. 백필 중이거나 완성된 사본에는 새 벡터도 함께 씁니다.
+"""
+import abc
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import background, retrieval_cache
+from .pinecone_pool import pinecone_pool
+
+if TYPE_CHECKING:
+    import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 개발 환경
+    fcntl = None
+
+BACKEND_PINECONE = 'pinecone'
+BACKEND_LOCAL = 'local'
+BACKEND_AUTO = 'auto'
+
+# Pinecone query 한 번에 받을 수 있는 최대 결과 수 / fetch 한 번에 보낼 id 수
+PINECONE_MAX_TOP_K = 10000
+PINECONE_FETCH_BATCH = 100
+
+
+class VectorStore(abc.ABC):
+    """벡터 저장소 공통 인터페이스"""
+    name = ''
+
+    @abc.abstractmethod
+    def query(self, vector: List[float], user_id: int, top_k: int) -> List[Dict]:
+        """user_id의 벡터 중 vector와 가장 가까운 top_k개를 [{'id', 'score', 'text'}] 형태로 반환합니다."""
+
+    @abc.abstractmethod
+    def upsert(self, vectors: List[Dict]):
+        """[{'id', 'values', 'metadata': {'user_id', 'text', ...}}] 형태의 벡터를 저장합니다."""
+
+    @abc.abstractmethod
+    def delete(self, user_id: int, ids: List[str]):
+        """user_id의 벡터 중 ids를 지웁니다. (없는 id는 무시)"""
+
+
+class PineconeVectorStore(VectorStore):
+    name = BACKEND_PINECONE
+
+    def query(self, vector, user_id, top_k):
+        results = pinecone_pool.query(
+            vector=vector,
+            top_k=top_k,
+            filter={"user_id": user_id}, # 메타데이터 필터링
+            include_metadata=True
+        )
+        return [
+            {
+                'id': match.id,
+                'score': match.score,
+                # Pinecone 결과에서 문서 내용(metadata의 'text' 키 등)을 추출
+                'text': match.metadata.get('text', '문서 내용 없음'),
+            }
+            for match in results.matches
+        ]
+
+    def upsert(self, vectors):
+        pinecone_pool.upsert(vectors=vectors)
+
+    def delete(self, user_id, ids):
+        pinecone_pool.delete(ids=ids)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    사용자별로 다음 파일을 저장합니다.
+    - user_<id>.vectors.npy : (N, D) 정규화된 벡터 행렬 (dtype 설정에 따라 float32/float16/int8)
+    - user_<id>.scales.npy  : int8일 때 행별 역양자화 배율
+    - user_<id>.meta.json   : 행 순서대로의 벡터 id와 텍스트
+    - user_<id>.complete    : ('auto') Pinecone의 벡터를 모두 받아 온 사본이라는 표시
+    - user_<id>.backfill    : ('auto') Pinecone에서 받아 오는 중이라는 표시
+    """
+    name = BACKEND_LOCAL
+
+    def __init__(self, directory, dtype: str = 'float32', cache_users: int = 256):
+        if dtype not in ('float32', 'float16', 'int8'):
+            raise ValueError(f"지원하지 않는 로컬 벡터 dtype입니다: {dtype}")
+        self.directory = Path(directory)
+        self.dtype = dtype
+        self._cache_users = cache_users
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- 파일 경로 ---
+    def _path(self, user_id: int, suffix: str) -> Path:
+        return self.directory / f"user_{int(user_id)}.{suffix}"
+
+    def count(self, user_id: int) -> int:
+        loaded = self._load(user_id)
+        return 0 if loaded is None else len(loaded[2]['ids'])
+
+    def has_user(self, user_id: int) -> bool:
+        return self._path(user_id, 'meta.json').exists()
+
+    def is_complete(self, user_id: int) -> bool:
+        return self._path(user_id, 'complete').exists()
+
+    def _is_mirrored(self, user_id: int) -> bool:
+        return self.is_complete(user_id) or self._path(user_id, 'backfill').exists()
+
+    # --- 조회 ---
+    def _load(self, user_id: int) -> Optional[tuple]:
+        """(행렬, 배율, 메타) 를 반환합니다. 파일이 바뀌면 다시 메모리 맵을 엽니다."""
+        meta_path = self._path(user_id, 'meta.json')
+        try:
+            mtime = meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached and cached[0] == mtime:
+                self._cache.move_to_end(user_id)
+                return cached[1:]
+
+        import numpy as np
+
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        matrix = np.load(self._path(user_id, 'vectors.npy'), mmap_mode='r')
+        scales = None
+        if matrix.dtype == np.int8:
+            scales = np.load(self._path(user_id, 'scales.npy'), mmap_mode='r')
+
+        with self._lock:
+            self._cache[user_id] = (mtime, matrix, scales, meta)
+            self._cache.move_to_end(user_id)
+            while len(self._cache) > self._cache_users:
+                self._cache.popitem(last=False)
+        return matrix, scales, meta
+
+    def query(self, vector, user_id, top_k):
+        import numpy as np
+
+        loaded = self._load(user_id)
+        if loaded is None:
+            return []
+        matrix, scales, meta = loaded
+        # 쓰기 도중(행렬만 교체된 상태)에 읽어도 메타에 있는 행까지만 사용합니다.
+        n = min(len(meta['ids']), matrix.shape[0])
+        if not n:
+            return []
+        matrix = matrix[:n]
+        if scales is not None:
+            scales = scales[:n]
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        # 저장된 벡터가 정규화되어 있으므로 내적 = 코사인 유사도
+        scores = matrix.astype(np.float32, copy=False) @ query
+        if scales is not None:
+            scores = scores * scales
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {'id': meta['ids'][i], 'score': float(scores[i]), 'text': meta['texts'][i]}
+            for i in top
+        ]
+
+    # --- 저장 ---
+    def _encode(self, matrix: "np.ndarray"):
+        import numpy as np
+
+        if self.dtype == 'int8':
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return matrix.astype(self.dtype), None
+
+    def _decode(self, matrix: "np.ndarray", scales: Optional["np.ndarray"]) -> "np.ndarray":
+        import numpy as np
+
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if scales is not None:
+            matrix = matrix * np.asarray(scales)[:, None]
+        return matrix
+
+    def upsert(self, vectors):
+        by_user: Dict[int, List[Dict]] = {}
+        for vector in vectors:
+            by_user.setdefault(int(vector['metadata']['user_id']), []).append(vector)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for user_id, user_vectors in by_user.items():
+            with self._user_lock(user_id):
+                self._upsert_user(user_id, user_vectors)
+
+    def upsert_mirrored(self, user_id: int, vectors: List[Dict], max_vectors: int):
+        """
+        ('auto') 완성됐거나 백필 중인 사본에만 vectors를 씁니다.
+        사본이 max_vectors를 넘게 되면 사본과 완성 표시를 지워 Pinecone에서만 조회되도록 합니다.
+        """
+        with self._user_lock(user_id):
+            if not self._is_mirrored(user_id):
+                return
+            loaded = self._load(user_id)
+            existing = set() if loaded is None else set(loaded[2]['ids'])
+            new_ids = {vector['id'] for vector in vectors} - existing
+            if len(existing) + len(new_ids) > max_vectors:
+                self._remove_files(user_id)
+                return
+            self._upsert_user(user_id, vectors)
+
+    def begin_backfill(self, user_id: int):
+        """기존 사본을 지우고 백필 중 표시를 남깁니다. (이후 업서트는 사본에도 쓰입니다)"""
+        with self._user_lock(user_id):
+            self._remove_files(user_id)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._path(user_id, 'backfill').touch()
+
+    def finish_backfill(self, user_id: int, vectors: List[Dict]):
+        """Pinecone에서 받아 온 vectors를 사본에 넣고 완성 표시를 남깁니다."""
+        with self._user_lock(user_id):
+            if not self._path(user_id, 'backfill').exists():
+                return # 백필 도중 사본이 지워졌습니다. (기준 초과/delete_user)
+            loaded = self._load(user_id)
+            # 백필 도중 업서트된 벡터가 Pinecone에서 받아 온 것보다 새것입니다.
+            written = set() if loaded is None else set(loaded[2]['ids'])
+            vectors = [vector for vector in vectors if vector['id'] not in written]
+            if vectors:
+                self._upsert_user(user_id, vectors)
+            self._path(user_id, 'complete').touch()
+            self._path(user_id, 'backfill').unlink()
+
+    def _upsert_user(self, user_id: int, vectors: List[Dict]):
+        import numpy as np
+
+        loaded = self._load(user_id)
+        if loaded is None:
+            ids, texts, rows = [], [], []
+        else:
+            matrix, scales, meta = loaded
+            ids, texts = list(meta['ids']), list(meta['texts'])
+            rows = list(self._decode(matrix, scales))
+
+        position = {vector_id: i for i, vector_id in enumerate(ids)}
+        for vector in vectors:
+            values = np.asarray(vector['values'], dtype=np.float32)
+            norm = np.linalg.norm(values)
+            if norm:
+                values = values / norm
+            text = vector['metadata'].get('text', '')
+
+            if vector['id'] in position:
+                i = position[vector['id']]
+                rows[i], texts[i] = values, text
+            else:
+                position[vector['id']] = len(ids)
+                ids.append(vector['id'])
+                texts.append(text)
+                rows.append(values)
+
+        encoded, new_scales = self._encode(np.vstack(rows))
+        self._write_atomic(user_id, encoded, new_scales, {'ids': ids, 'texts': texts})
+
+    def _write_atomic(self, user_id: int, matrix: "np.ndarray", scales, meta: Dict):
+        import numpy as np
+
+        # 읽는 쪽이 항상 완성된 파일만 보도록 임시 파일에 쓴 뒤 교체합니다. (meta.json을 마지막에 교체)
+        vectors_path = self._path(user_id, 'vectors.npy')
+        tmp = vectors_path.with_suffix('.tmp.npy')
+        np.save(tmp, matrix)
+        os.replace(tmp, vectors_path)
+
+        if scales is not None:
+            scales_path = self._path(user_id, 'scales.npy')
+            tmp = scales_path.with_suffix('.tmp.npy')
+            np.save(tmp, scales)
+            os.replace(tmp, scales_path)
+
+        meta_path = self._path(user_id, 'meta.json')
+        tmp = meta_path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, meta_path)
+
+    def delete(self, user_id, ids):
+        import numpy as np
+
+        with self._user_lock(user_id):
+            loaded = self._load(user_id)
+            if loaded is None:
+                return
+            matrix, scales, meta = loaded
+            removed = set(ids)
+            keep = [i for i, vector_id in enumerate(meta['ids']) if vector_id not in removed]
+            if len(keep) == len(meta['ids']):
+                return
+            if not keep:
+                self._remove_files(user_id)
+                return
+
+            rows = self._decode(np.asarray(matrix)[keep], None if scales is None else np.asarray(scales)[keep])
+            encoded, new_scales = self._encode(rows)
+            self._write_atomic(user_id, encoded, new_scales, {
+                'ids': [meta['ids'][i] for i in keep],
+                'texts': [meta['texts'][i] for i in keep],
+            })
+
+    def delete_user(self, user_id: int):
+        with self._user_lock(user_id):
+            self._remove_files(user_id)
+
+    def _remove_files(self, user_id: int):
+        for suffix in ('meta.json', 'vectors.npy', 'scales.npy', 'complete', 'backfill'):
+            try:
+                self._path(user_id, suffix).unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def _user_lock(self, user_id: int):
+        return _FileLock(self._path(user_id, 'lock'))
+
+
+class _FileLock:
+    """여러 워커/프로세스가 같은 사용자 파일을 동시에 고쳐 쓰지 않도록 하는 파일 잠금"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+
+
+pinecone_store = PineconeVectorStore()
+local_store = LocalVectorStore(
+    settings.VECTOR_STORE_LOCAL_DIR,
+    dtype=settings.VECTOR_STORE_LOCAL_DTYPE,
+    cache_users=settings.VECTOR_STORE_LOCAL_CACHE_USERS,
+)
+
+
+def get_vector_store(user_id: int) -> VectorStore:
+    """user_id의 문서를 조회할 저장소를 고릅니다."""
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == BACKEND_LOCAL:
+        return local_store
+    if backend == BACKEND_AUTO:
+        if local_store.is_complete(user_id):
+            return local_store
+        schedule_mirror(user_id)
+    return pinecone_store
+
+
+# 이 프로세스에서 사용자별로 마지막으로 사본 백필을 확인한 시각 (공유 캐시 조회를 줄이기 위함)
+_mirror_checked: Dict[int, float] = {}
+
+
+def schedule_mirror(user_id: int):
+    """
+    ('auto') 아직 사본이 없는 사용자의 백필을 백그라운드 작업자에 넘깁니다.
+    모든 워커를 통틀어 사용자당 VECTOR_STORE_MIRROR_RETRY초에 한 번만 시도합니다. (기준을 넘는 사용자 포함)
+    """
+    interval = settings.VECTOR_STORE_MIRROR_RETRY
+    now = time.monotonic()
+    if now - _mirror_checked.get(user_id, float('-inf')) < interval:
+        return
+    _mirror_checked[user_id] = now
+    if cache.add(f"vector_mirror:{user_id}", 1, timeout=interval):
+        background.submit('vector_mirror', mirror_user, user_id)
+
+
+def mirror_user(user_id: int) -> bool:
+    """
+    user_id의 벡터를 Pinecone에서 모두 받아 로컬 사본을 만들고 완성 표시를 남깁니다.
+    벡터 수가 VECTOR_STORE_LOCAL_MAX_VECTORS를 넘으면 사본을 만들지 않고 False를 반환합니다.
+    """
+    from ..views import EMBEDDING_DIMENSIONS
+
+    max_vectors = settings.VECTOR_STORE_LOCAL_MAX_VECTORS
+    local_store.begin_backfill(user_id)
+    try:
+        # 필터에 맞는 벡터를 모두 돌려받을 만큼 top_k를 크게 잡아 id 목록을 얻습니다. (쿼리 벡터는 아무거나)
+        top_k = min(max_vectors + 1, PINECONE_MAX_TOP_K)
+        probe = [1.0] + [0.0] * (EMBEDDING_DIMENSIONS - 1)
+        results = pinecone_pool.query(
+            vector=probe, top_k=top_k, filter={"user_id": user_id},
+            include_metadata=False, include_values=False,
+        )
+        ids = [match.id for match in results.matches]
+        if len(ids) >= top_k:
+            local_store.delete_user(user_id)
+            return False
+
+        vectors = []
+        for start in range(0, len(ids), PINECONE_FETCH_BATCH):
+            fetched = pinecone_pool.fetch(ids=ids[start:start + PINECONE_FETCH_BATCH])
+            for vector_id, vector in fetched.vectors.items():
+                vectors.append({'id': vector_id, 'values': list(vector.values), 'metadata': dict(vector.metadata or {})})
+        local_store.finish_backfill(user_id, vectors)
+    except Exception:
+        local_store.delete_user(user_id)
+        raise
+    return True
+
+
+def upsert_vectors(vectors: List[Dict], invalidate_cache: bool = True):
+    """
+    설정된 백엔드에 벡터를 저장합니다. ('auto'는 Pinecone + 사본이 있는 사용자만 로컬에도 저장)
+    invalidate_cache=False는 방금 끝난 채팅 턴의 메시지처럼, 이미 최근 대화로 프롬프트에 들어가
+    검색 결과에 없어도 되는 벡터를 넣을 때 씁니다. (검색 결과 캐시를 매 턴 비우지 않도록)
+    """
+    try:
+        _upsert_vectors(vectors)
+    finally:
+        # 일부만 저장되고 실패했어도 이전 검색 결과는 더 이상 믿을 수 없습니다.
+        if invalidate_cache:
+            retrieval_cache.invalidate(int(vector['metadata']['user_id']) for vector in vectors)
+
+
+def delete_vectors(user_id: int, ids: List[str]):
+    """설정된 백엔드에서 user_id의 벡터 ids를 지웁니다. ('auto'는 Pinecone과 로컬 사본 모두)"""
+    try:
+        if settings.VECTOR_STORE_BACKEND != BACKEND_LOCAL:
+            pinecone_store.delete(user_id, ids)
+        if settings.VECTOR_STORE_BACKEND != BACKEND_PINECONE:
+            local_store.delete(user_id, ids)
+    finally:
+        retrieval_cache.invalidate([user_id])
+
+
+def _upsert_vectors(vectors: List[Dict]):
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == BACKEND_LOCAL:
+        local_store.upsert(vectors)
+        return
+
+    pinecone_store.upsert(vectors)
+    if backend != BACKEND_AUTO:
+        return
+
+    by_user: Dict[int, List[Dict]] = {}
+    for vector in vectors:
+        by_user.setdefault(int(vector['metadata']['user_id']), []).append(vector)
+
+    for user_id, user_vectors in by_user.items():
+        local_store.upsert_mirrored(user_id, user_vectors, settings.VECTOR_STORE_LOCAL_MAX_VECTORS)
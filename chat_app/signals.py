@@ -0,0 +1,155 @@
+"""
+다른 모델의 변경에 따라 캐시 등을 갱신하는 signal 수신기 모음
+(apps.ChatAppConfig.ready()에서 import되어 등록됩니다.)
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import ChatMessage, ConversationSummary, UserActivity, UserAttribute, UserProfile, UserRelationship
+from .services import analytics, background, ingestion, keyword_index, mention_tagger, response_cache, user_context
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_response_cache_on_profile_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    응답 캐시 사용 설정(response_cache_enabled)이 바뀌면 캐시된 답변을 비웁니다.
+    memory/호감도 변경은 사용자 컨텍스트가 프롬프트 지문에 들어가므로 따로 비우지 않아도 적중하지 않습니다.
+    (UserProfile.save()는 바뀐 필드만 update_fields로 넘기므로, update_fields가 없으면 새로 만든 프로필입니다.)
+    """
+    if created:
+        return
+    if update_fields is None or 'response_cache_enabled' in update_fields:
+        response_cache.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=UserAttribute)
+@receiver(post_delete, sender=UserAttribute)
+@receiver(post_save, sender=UserActivity)
+@receiver(post_delete, sender=UserActivity)
+def invalidate_response_cache_on_memory_change(sender, instance, **kwargs):
+    """사용자 속성/활동 기록이 추가·수정·삭제되면 응답 캐시를 비웁니다."""
+    response_cache.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def invalidate_user_context_on_profile_save(sender, instance, update_fields=None, **kwargs):
+    """프롬프트에 쓰이는 프로필 필드가 바뀌었을 수 있으면 사용자 컨텍스트 캐시를 비웁니다."""
+    if update_fields is None or {'memory', 'affinity_score', 'response_cache_enabled'} & set(update_fields):
+        user_context.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=UserAttribute)
+@receiver(post_delete, sender=UserAttribute)
+@receiver(post_save, sender=UserRelationship)
+@receiver(post_delete, sender=UserRelationship)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=ConversationSummary)
+@receiver(post_delete, sender=ConversationSummary)
+def invalidate_user_context_on_change(sender, instance, **kwargs):
+    """사용자 속성/인간관계/대화 요약이 추가·수정·삭제되면 사용자 컨텍스트 캐시를 비웁니다."""
+    user_context.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=UserRelationship)
+@receiver(post_delete, sender=UserRelationship)
+def invalidate_mention_tagger(sender, instance, **kwargs):
+    """인간관계가 추가·수정·삭제되면 그 사용자의 언급 매처를 다시 만들도록 합니다."""
+    mention_tagger.invalidate(instance.user_id)
+
+
+@receiver(pre_save, sender=UserActivity)
+def remember_activity_rollup_keys(sender, instance, raw=False, **kwargs):
+    """수정 전 활동의 롤업 키를 기억해 두었다가 post_save에서 차이만큼 반영합니다."""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._old_rollup_keys = []
+        return
+
+    old = (
+        UserActivity.objects.filter(pk=instance.pk)
+        .values_list('activity_date', 'place', 'companion')
+        .first()
+    )
+    instance._old_rollup_keys = analytics.rollup_keys(*old) if old else []
+
+
+def _defer_rollup_change(user_id, old_keys, new_keys):
+    """
+    롤업 반영은 활동 저장이 커밋된 뒤 백그라운드 작업자가 처리합니다.
+    (롤백된 변경은 반영되지 않고, 실패해도 재시도되며 rebuild_activity_analytics로 복구 가능)
+    """
+    if old_keys == new_keys:
+        return
+    transaction.on_commit(
+        lambda: background.submit('activity_rollups', analytics.apply_change, user_id, old_keys, new_keys)
+    )
+
+
+@receiver(post_save, sender=UserActivity)
+def update_activity_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_keys = getattr(instance, '_old_rollup_keys', [])
+    _defer_rollup_change(instance.user_id, old_keys, analytics.activity_rollup_keys(instance))
+
+
+@receiver(post_delete, sender=UserActivity)
+def update_activity_rollups_on_delete(sender, instance, **kwargs):
+    _defer_rollup_change(instance.user_id, analytics.activity_rollup_keys(instance), [])
+
+
+@receiver(post_save, sender=ChatMessage)
+@receiver(post_save, sender=UserActivity)
+def update_keyword_index_on_save(sender, instance, raw=False, **kwargs):
+    """
+    채팅 메시지/활동 기록이 저장되면 커밋 뒤 백그라운드 작업자가 그 문서만 키워드 색인에 다시 넣습니다.
+    (색인이 요청 경로를 늦추거나 실패로 원래 저장을 막지 않으며, rebuild_keyword_index로 복구 가능)
+    """
+    if raw or not settings.KEYWORD_INDEX_ENABLED:
+        return
+    source = 'chat' if sender is ChatMessage else 'activity'
+    source_id = instance.pk
+    transaction.on_commit(
+        lambda: background.submit('keyword_index', keyword_index.index_row, source, source_id)
+    )
+
+
+@receiver(post_delete, sender=ChatMessage)
+def update_keyword_index_on_chat_delete(sender, instance, **kwargs):
+    if settings.KEYWORD_INDEX_ENABLED:
+        keyword_index.remove_chat_message(instance)
+
+
+@receiver(post_delete, sender=UserActivity)
+def update_keyword_index_on_activity_delete(sender, instance, **kwargs):
+    if settings.KEYWORD_INDEX_ENABLED:
+        keyword_index.remove_document('activity', instance.pk)
+
+
+def _vector_source(sender) -> str:
+    return 'activity' if sender is UserActivity else 'relationship'
+
+
+@receiver(post_save, sender=UserActivity)
+@receiver(post_save, sender=UserRelationship)
+def sync_vectors_on_edit(sender, instance, created=False, raw=False, **kwargs):
+    """
+    수정된 활동 기록/인간관계의 벡터를 커밋 뒤 백그라운드에서 다시 만듭니다.
+    (새 행은 ingest_vectors가 커서로 가져가고, 같은 벡터 id라 아직 적재 전인 행을 고쳐도 중복되지 않습니다.)
+    """
+    if raw or created or not settings.INGESTION_SYNC_CHANGES:
+        return
+    source = _vector_source(sender)
+    transaction.on_commit(lambda: background.submit('vector_sync', ingestion.sync_row, source, instance))
+
+
+@receiver(post_delete, sender=UserActivity)
+@receiver(post_delete, sender=UserRelationship)
+def sync_vectors_on_delete(sender, instance, **kwargs):
+    """삭제된 활동 기록/인간관계의 벡터를 커밋 뒤 백그라운드에서 지웁니다."""
+    if not settings.INGESTION_SYNC_CHANGES:
+        return
+    rows = [(instance.user_id, instance.pk)]
+    source = _vector_source(sender)
+    transaction.on_commit(lambda: background.submit('vector_sync', ingestion.delete_rows, source, rows))
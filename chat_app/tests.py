@@ -0,0 +1,1464 @@
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from asgiref.sync import async_to_sync
+from openai import BadRequestError
+
+from django.contrib.auth import authenticate, login
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from chat_app import views
+from chat_app.api.views import furniture_batch_api, get_chat_history, room_state_api
+from chat_app.benchmarks.fake_servers import start_fake_openai
+from django.core.cache import cache
+
+from chat_app.models import (
+    ActivityAnalytics, ArchivedChatMessage, ChatMessage, ConversationSummary, FurnitureItem, IngestedRow,
+    IngestionCursor, KeywordDocument, KeywordPosting, Room, UserActivity, UserAttribute, UserProfile, UserRelationship,
+)
+from chat_app.services import (
+    analytics, chat_service, conversation_summary, ingestion, keyword_index, memory_export, mention_tagger, user_context,
+)
+from chat_app.services import pinecone_pool as pool_module
+from chat_app.services import (
+    admission, clients, locks, metrics, response_cache, retrieval_cache, single_flight, vector_store,
+)
+from chat_app.services.background import BackgroundWorker
+from chat_app.services.clients import closes_async_openai_client, configure_openai, get_async_openai_client
+from chat_app.services.embedding_cache import EmbeddingCache
+from chat_app.services.pinecone_pool import PineconeIndexPool
+from chat_app.services.vector_store import LocalVectorStore
+from chat_app.views import EMBEDDING_DIMENSIONS
+
+# 실제 파일 캐시(.django_cache)를 건드리지 않도록 캐시를 쓰는 테스트는 프로세스 메모리 캐시를 씁니다.
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+    'locks': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-locks'},
+}
+
+
+class ChatHistoryTests(TestCase):
+    """/api/chat/history/ 키셋 페이지네이션"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='history')
+
+    def _add_pairs(self, count: int):
+        for i in range(count):
+            ChatMessage.objects.create(user=self.user, message=f'질문 {i}', is_user=True)
+            ChatMessage.objects.create(user=self.user, message=f'답변 {i}', is_user=False)
+
+    def _get(self, **params):
+        request = self.factory.get('/api/chat/history/', params)
+        force_authenticate(request, user=self.user)
+        return get_chat_history(request)
+
+    def test_query_count_does_not_grow_with_history(self):
+        # 다음 페이지가 있는 한 AI 메시지 1회 + 사용자 메시지 1회만 조회합니다.
+        for total in (30, 300):
+            self._add_pairs(total - ChatMessage.objects.filter(user=self.user, is_user=False).count())
+            with self.assertNumQueries(2):
+                response = self._get(limit=20)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), 20)
+
+    def test_pages_follow_cursor_header_without_gaps(self):
+        self._add_pairs(5)
+
+        first = self._get(limit=2)
+        self.assertIsInstance(first.data, list)
+        self.assertEqual([pair['ai_response'] for pair in first.data], ['답변 4', '답변 3'])
+        self.assertEqual([pair['user_message'] for pair in first.data], ['질문 4', '질문 3'])
+
+        seen = [pair['id'] for pair in first.data]
+        response = first
+        while response.has_header('X-Next-Before-Id'):
+            response = self._get(limit=2, before_id=response['X-Next-Before-Id'])
+            seen += [pair['id'] for pair in response.data]
+
+        expected = list(
+            ChatMessage.objects.filter(user=self.user, is_user=False).order_by('-id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+
+class FakeIndex:
+    """Pinecone Index 대신 쓰는 로컬 가짜 인덱스"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def _call(self, name, **kwargs):
+        self.calls.append(name)
+        if self.fail:
+            raise ConnectionError('pinecone down')
+        return {'matches': []}
+
+    def query(self, **kwargs):
+        return self._call('query', **kwargs)
+
+    def upsert(self, **kwargs):
+        return self._call('upsert', **kwargs)
+
+    def describe_index_stats(self):
+        return self._call('describe_index_stats')
+
+
+@override_settings(PINECONE_RECONNECT_BACKOFF=0)
+class PineconeIndexPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.created = []
+        self.fail_next = False
+
+        def factory():
+            index = FakeIndex(fail=self.fail_next)
+            self.created.append(index)
+            return index
+
+        self.pool = PineconeIndexPool(index_factory=factory)
+
+    def test_reuses_one_handle(self):
+        self.pool.warm_up()
+        self.pool.query(vector=[0.0], top_k=1)
+        self.pool.upsert(vectors=[])
+        self.assertEqual(len(self.created), 1)
+        self.assertEqual(self.created[0].calls, ['describe_index_stats', 'query', 'upsert'])
+        self.assertEqual(self.pool.status()['state'], pool_module.STATE_CONNECTED)
+
+    def test_failure_marks_degraded_and_reconnects(self):
+        self.fail_next = True
+        with self.assertRaises(ConnectionError):
+            self.pool.query(vector=[0.0], top_k=1)
+        status = self.pool.status()
+        self.assertEqual(status['state'], pool_module.STATE_DEGRADED)
+        self.assertEqual(status['consecutive_failures'], 1)
+        self.assertIsNotNone(status['last_error_at'])
+
+        self.fail_next = False
+        self.pool.query(vector=[0.0], top_k=1)
+        self.assertEqual(len(self.created), 2)
+        self.assertEqual(self.pool.status()['state'], pool_module.STATE_CONNECTED)
+        self.assertEqual(self.pool.status()['consecutive_failures'], 0)
+
+    def test_backoff_fails_fast_without_reconnecting(self):
+        self.fail_next = True
+        with self.assertRaises(ConnectionError):
+            self.pool.query(vector=[0.0], top_k=1)
+        with override_settings(PINECONE_RECONNECT_BACKOFF=60):
+            with self.assertRaises(ConnectionError):
+                self.pool.query(vector=[0.0], top_k=1)
+        self.assertEqual(len(self.created), 1)
+
+    def test_warm_up_failure_is_recorded_not_raised(self):
+        self.fail_next = True
+        self.pool.warm_up()
+        self.assertEqual(self.pool.status()['state'], pool_module.STATE_DEGRADED)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class VectorHealthApiTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = PineconeIndexPool(index_factory=lambda: FakeIndex(fail=True))
+        self.pool.warm_up()
+        self.original_pool = views.pinecone_pool
+        views.pinecone_pool = self.pool
+
+    def tearDown(self):
+        views.pinecone_pool = self.original_pool
+
+    def _get(self, user=None, **headers):
+        request = RequestFactory().get('/api/health/vector/', headers=headers)
+        request.user = user or AnonymousUser()
+        return views.vector_health_api(request)
+
+    def test_anonymous_gets_state_only(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 503)
+        self.assertJSONEqual(response.content, {'state': 'degraded'})
+
+    def test_token_or_staff_gets_details(self):
+        for response in (
+            self._get(Authorization='Bearer secret'),
+            self._get(user=User(username='ops', is_staff=True)),
+        ):
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('pinecone down', json.loads(response.content)['last_error'])
+
+
+class QueryEmbeddingCacheTests(TestCase):
+
+    def test_embeds_normalized_text_once_per_key(self):
+        embeddings = mock.Mock()
+        embeddings.create.return_value = SimpleNamespace(data=[SimpleNamespace(embedding=[0.5, 0.25])])
+        client = SimpleNamespace(embeddings=embeddings)
+
+        with mock.patch.object(views, 'embedding_cache', EmbeddingCache(max_bytes=1 << 20)), \
+                mock.patch.object(views, 'get_openai_client', return_value=client):
+            first = views.get_query_embedding('  Hello   World ')
+            second = views.get_query_embedding('hello world')
+
+        self.assertEqual(first, second)
+        embeddings.create.assert_called_once()
+        self.assertEqual(embeddings.create.call_args.kwargs['input'], ['hello world'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHAT_VECTOR_UPSERT=False)
+class ChatStreamTests(TestCase):
+    """/api/chat/send/stream/ SSE 응답"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='stream')
+        patches = [
+            mock.patch.object(chat_service, 'search_documents', return_value=[]),
+            mock.patch.object(chat_service, 'lookup_cached_response', return_value=(None, None)),
+            mock.patch.object(chat_service, 'store_cached_response'),
+            mock.patch.object(chat_service, 'generate_response_stream', side_effect=lambda *a: iter(['안녕', '하세요'])),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_event_source_accept_header_is_negotiated(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/chat/send/stream/', '{"message": "안녕"}',
+            content_type='application/json', headers={'Accept': 'text/event-stream'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: done', body)
+
+        error = self.client.post(
+            '/api/chat/send/stream/', '{}', content_type='application/json', headers={'Accept': 'text/event-stream'},
+        )
+        self.assertEqual(error.status_code, 400)
+        self.assertTrue(error.content.startswith(b'event: error'))
+
+    def test_disconnect_saves_partial_reply(self):
+        events = chat_service.stream_chat_interaction(self.user, '안녕')
+        self.assertIn('안녕', next(events))
+        events.close() # 클라이언트 연결 끊김
+
+        messages = list(ChatMessage.objects.filter(user=self.user).order_by('id').values_list('is_user', 'message'))
+        self.assertEqual(messages, [(True, '안녕'), (False, '안녕')])
+
+
+class AsyncOpenAIClientLifecycleTests(SimpleTestCase):
+
+    def setUp(self):
+        configure_openai(api_key='test')
+        self.addCleanup(configure_openai)
+
+    def test_wsgi_request_closes_its_loop_client(self):
+        clients = []
+
+        @closes_async_openai_client
+        async def view(request):
+            clients.append(get_async_openai_client())
+            clients.append(get_async_openai_client()) # 같은 루프 안에서는 재사용
+            return HttpResponse()
+
+        for _ in range(2):
+            async_to_sync(view)(RequestFactory().get('/'))
+
+        self.assertIs(clients[0], clients[1])
+        self.assertIsNot(clients[0], clients[2])
+        self.assertTrue(all(client.is_closed() for client in clients))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHAT_VECTOR_UPSERT=False, KEYWORD_INDEX_ENABLED=False)
+class AsyncChatViewTests(TestCase):
+    """WSGI에서 비동기 채팅 뷰를 연달아 호출해도 이벤트 루프가 섞이지 않아야 합니다."""
+
+    def setUp(self):
+        self.openai = start_fake_openai()
+        self.addCleanup(self.openai.stop)
+        configure_openai(api_key='test', base_url=f"{self.openai.url}/v1", timeout=5, max_retries=0)
+        self.addCleanup(configure_openai)
+        self.user = User.objects.create_user(username='async')
+        self.client.force_login(self.user)
+
+    def test_consecutive_requests_use_fresh_clients(self):
+        for text in ('첫 번째', '두 번째', '세 번째'):
+            response = self.client.post('/api/chat/send/async/', json.dumps({'message': text}), content_type='application/json')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()['user_message'], text)
+            self.assertEqual(len(clients._async_clients), 0)
+        self.assertEqual(self.openai.counts['/v1/chat/completions'], 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RESPONSE_CACHE_SIMILARITY=0.95, RESPONSE_CACHE_TTL=60)
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cache')
+        self.context = {'affinity_score': 0, 'items': [], 'conversation_summary': ''}
+        self.docs = ['[2024-05-01 20:00] 사용자: 인터스텔라 봤어']
+
+    def _context(self, summary=''):
+        return response_cache.context_fingerprint(dict(self.context, conversation_summary=summary))
+
+    def _lookup(self, embedding, query='그 영화 어땠어?', docs=None, summary=''):
+        docs = self.docs if docs is None else docs
+        return response_cache.lookup(self.user.id, embedding, query, docs, self._context(summary))
+
+    def test_hit_requires_same_documents_and_context(self):
+        response_cache.store(self.user.id, [1.0, 0.0, 0.0], '그 영화 어땠어?', self.docs, self._context(), '인터스텔라 좋지!')
+
+        self.assertEqual(self._lookup([0.99, 0.05, 0.0]), '인터스텔라 좋지!')
+        # 이전 대화 요약이 다르거나 새 문서가 검색되면 적중하지 않습니다.
+        self.assertIsNone(self._lookup([1.0, 0.0, 0.0], summary='요약'))
+        self.assertIsNone(self._lookup([1.0, 0.0, 0.0], docs=self.docs + ['[2024-05-02 09:00] 사용자: 시험 망쳤어']))
+        # 질문 임베딩이 멀면 적중하지 않습니다.
+        self.assertIsNone(self._lookup([0.0, 1.0, 0.0]))
+
+    def test_cached_turn_retrieved_as_document_still_hits(self):
+        response_cache.store(self.user.id, [1.0, 0.0], '그 영화 어땠어?', self.docs, self._context(), '인터스텔라 좋지!')
+        docs = ['[2024-05-01 21:00] 아이: 인터스텔라 좋지!', '[2024-05-01 21:00] 사용자: 그 영화 어땠어?'] + self.docs
+
+        self.assertEqual(self._lookup([1.0, 0.0], docs=docs), '인터스텔라 좋지!')
+
+    def test_only_opt_in_change_invalidates_on_profile_save(self):
+        response_cache.store(self.user.id, [1.0, 0.0], '그 영화 어땠어?', self.docs, self._context(), '답변')
+        profile = UserProfile.objects.get(user=self.user)
+
+        profile.memory = {'취미': '영화'}
+        profile.save()
+        self.assertEqual(self._lookup([1.0, 0.0]), '답변')
+
+        profile.response_cache_enabled = True
+        profile.save()
+        self.assertIsNone(self._lookup([1.0, 0.0]))
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, RESPONSE_CACHE_ENABLED=True, RETRIEVAL_CACHE_TTL=0,
+    VECTOR_STORE_BACKEND='local', BACKGROUND_TASKS_ENABLED=False, CHAT_VECTOR_UPSERT=True,
+)
+class ResponseCacheEndToEndTests(TestCase):
+    """같은 질문을 답변을 받은 뒤 다시 하면, 직전 턴이 검색되더라도 LLM 호출 없이 캐시된 답변을 받습니다."""
+
+    def setUp(self):
+        self.openai = start_fake_openai()
+        self.addCleanup(self.openai.stop)
+        configure_openai(api_key='test', base_url=f"{self.openai.url}/v1", timeout=5, max_retries=0)
+        self.addCleanup(configure_openai)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(vector_store, 'local_store', LocalVectorStore(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        cache.clear()
+        self.user = User.objects.create_user(username='repeat')
+        UserProfile.objects.filter(user=self.user).update(response_cache_enabled=True)
+        self.client.force_login(self.user)
+
+    def _send(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/chat/send/', json.dumps({'message': text}), content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_repeated_question_hits_without_llm_call(self):
+        first = self._send('인터스텔라 어땠어?')
+        self.assertEqual(self.openai.counts['/v1/chat/completions'], 1)
+        # 직전 턴은 벡터 저장소와 키워드 색인에 들어가 다음 검색 결과에 나옵니다.
+        self.assertEqual(vector_store.local_store.count(self.user.id), 2)
+
+        hits = response_cache.stats()['hits']
+        second = self._send('인터스텔라 어땠어?')
+        self.assertEqual(self.openai.counts['/v1/chat/completions'], 1)
+        self.assertEqual(response_cache.stats()['hits'], hits + 1)
+        self.assertEqual(second['ai_response'], first['ai_response'])
+
+
+class FakeEmbeddings:
+    """'poison'이 든 입력이 있으면 배치 전체를 400으로 거절하는 embeddings 엔드포인트"""
+
+    def __init__(self):
+        self.inputs = []
+
+    def create(self, input, model, dimensions):
+        self.inputs.append(list(input))
+        if any('poison' in text for text in input):
+            request = httpx.Request('POST', 'http://fake/v1/embeddings')
+            raise BadRequestError('too long', response=httpx.Response(400, request=request), body=None)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[1.0, float(i)]) for i in range(len(input))
+        ])
+
+
+@override_settings(INGESTION_MAX_TOKENS=10)
+class IngestionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ingest')
+        self.embeddings = FakeEmbeddings()
+        client = SimpleNamespace(embeddings=self.embeddings)
+        patcher = mock.patch.object(ingestion, 'get_openai_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_truncates_to_token_limit(self):
+        self.assertEqual(ingestion.truncate_for_embedding('a' * 100), 'a' * 40)
+        self.assertEqual(ingestion.truncate_for_embedding('가' * 100), '가' * 10)
+        self.assertEqual(ingestion.truncate_for_embedding('짧은 글'), '짧은 글')
+
+    def test_poison_row_is_skipped_and_cursor_advances(self):
+        for memo in ('첫째', 'poison', '셋째'):
+            UserActivity.objects.create(user=self.user, memo=memo)
+
+        with mock.patch.object(ingestion.vector_store, 'upsert_vectors') as upsert:
+            processed = ingestion.ingest_source('activity', workers=1)
+
+        self.assertEqual(processed, 3)
+        upserted = [vector['metadata']['text'] for call in upsert.call_args_list for vector in call.args[0]]
+        self.assertEqual(len(upserted), 2)
+        self.assertFalse(any('poison' in text for text in upserted))
+        # 배치 1번 + 한 행씩 3번
+        self.assertEqual(len(self.embeddings.inputs), 4)
+        last_id = UserActivity.objects.order_by('-id').values_list('id', flat=True)[0]
+        self.assertEqual(IngestionCursor.objects.get(source='activity').last_id, last_id)
+
+    @override_settings(CACHES=LOCMEM_CACHES, INGESTION_MAX_TOKENS=8000)
+    def test_live_turn_upsert_keeps_retrieval_cache_and_is_not_reingested(self):
+        cache.clear()
+        turn = [
+            ChatMessage.objects.create(user=self.user, message='질문', is_user=True),
+            ChatMessage.objects.create(user=self.user, message='답변', is_user=False),
+        ]
+        later = ChatMessage.objects.create(user=self.user, message='다음 질문', is_user=True)
+        generation_key = retrieval_cache._generation_key(self.user.id)
+
+        with mock.patch.object(vector_store, '_upsert_vectors'):
+            ingestion.upsert_rows('chat', turn, live=True)
+            self.assertIsNone(cache.get(generation_key)) # 매 턴 검색 결과 캐시를 비우지 않습니다.
+
+            self.embeddings.inputs.clear()
+            self.assertEqual(ingestion.ingest_source('chat', workers=1), 3)
+            # 커서는 세 행을 모두 지나가지만 임베딩은 턴 직후 업서트되지 않은 행만 합니다.
+            self.assertEqual(len(self.embeddings.inputs), 1)
+            self.assertEqual(len(self.embeddings.inputs[0]), 1)
+            self.assertIn('다음 질문', self.embeddings.inputs[0][0])
+            self.assertEqual(cache.get(generation_key), 1)
+
+        self.assertEqual(IngestionCursor.objects.get(source='chat').last_id, later.id)
+        # 커서 뒤 INGESTION_CURSOR_LAG 범위의 행은 늦게 커밋된 행을 가려내기 위해 기록해 둡니다.
+        self.assertEqual(
+            set(IngestedRow.objects.values_list('row_id', flat=True)), {msg.id for msg in turn + [later]}
+        )
+
+    @override_settings(INGESTION_MAX_TOKENS=8000, INGESTION_CURSOR_LAG=100)
+    def test_row_committed_behind_cursor_is_ingested_once(self):
+        _, late, last = [ChatMessage.objects.create(user=self.user, message=f'메시지 {i}', is_user=True) for i in range(3)]
+        late_id = late.id
+        late.delete() # 커서가 지나갈 때 아직 커밋되지 않은 행
+
+        with mock.patch.object(vector_store, '_upsert_vectors'):
+            self.assertEqual(ingestion.ingest_source('chat', workers=1), 2)
+            ChatMessage.objects.create(id=late_id, user=self.user, message='늦게 커밋된 메시지', is_user=True)
+
+            self.embeddings.inputs.clear()
+            self.assertEqual(ingestion.ingest_source('chat', workers=1), 1)
+            self.assertEqual(len(self.embeddings.inputs), 1)
+            self.assertIn('늦게 커밋된 메시지', self.embeddings.inputs[0][0])
+
+            # 이미 적재한 행은 다시 임베딩하지 않습니다.
+            self.embeddings.inputs.clear()
+            self.assertEqual(ingestion.ingest_source('chat', workers=1), 0)
+            self.assertEqual(self.embeddings.inputs, [])
+        self.assertEqual(IngestionCursor.objects.get(source='chat').last_id, last.id)
+
+        # 범위를 벗어난 기록은 다음 실행 때 정리됩니다.
+        with override_settings(INGESTION_CURSOR_LAG=0):
+            ingestion.ingest_source('chat', workers=1)
+        self.assertFalse(IngestedRow.objects.exists())
+
+    @override_settings(BACKGROUND_TASKS_ENABLED=False, INGESTION_SYNC_CHANGES=True)
+    def test_edits_and_deletes_sync_vectors(self):
+        activity = UserActivity.objects.create(user=self.user, memo='처음 메모')
+        vector_id = f'activity-{activity.id}'
+
+        with mock.patch.object(ingestion.vector_store, 'upsert_vectors') as upsert, \
+                mock.patch.object(ingestion.vector_store, 'delete_vectors') as delete:
+            with self.captureOnCommitCallbacks(execute=True):
+                activity.memo = '고친 메모'
+                activity.save()
+            self.assertEqual(upsert.call_args.args[0][0]['id'], vector_id)
+            self.assertIn('고친 메모', upsert.call_args.args[0][0]['metadata']['text'])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                activity.delete()
+            delete.assert_called_once_with(self.user.id, [vector_id])
+
+
+class LocalVectorStoreTests(SimpleTestCase):
+    def test_delete_removes_only_given_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = LocalVectorStore(directory, dtype='int8')
+            store.upsert([
+                {'id': f'doc-{i}', 'values': [1.0, float(i)], 'metadata': {'user_id': 1, 'text': f'문서 {i}'}}
+                for i in range(3)
+            ])
+            store.delete(1, ['doc-1', 'missing'])
+            self.assertEqual([match['id'] for match in store.query([1.0, 0.0], 1, 5)].count('doc-1'), 0)
+            self.assertEqual(store.count(1), 2)
+
+            store.delete(1, ['doc-0', 'doc-2'])
+            self.assertFalse(store.has_user(1))
+
+    def test_backend_must_implement_the_whole_interface(self):
+        class QueryOnly(vector_store.VectorStore):
+            def query(self, vector, user_id, top_k):
+                return []
+
+        with self.assertRaises(TypeError):
+            QueryOnly()
+
+
+class MirrorIndex:
+    """사용자별 벡터를 들고 query(id 목록)/fetch/upsert에 답하는 가짜 Pinecone 인덱스"""
+
+    def __init__(self, vectors):
+        self.vectors = {vector['id']: vector for vector in vectors}
+
+    def query(self, vector, top_k, filter, **kwargs):
+        ids = [v['id'] for v in self.vectors.values() if v['metadata']['user_id'] == filter['user_id']]
+        return SimpleNamespace(matches=[SimpleNamespace(id=vector_id) for vector_id in ids[:top_k]])
+
+    def fetch(self, ids):
+        return SimpleNamespace(vectors={
+            vector_id: SimpleNamespace(values=self.vectors[vector_id]['values'], metadata=self.vectors[vector_id]['metadata'])
+            for vector_id in ids if vector_id in self.vectors
+        })
+
+    def upsert(self, vectors):
+        self.vectors.update({vector['id']: vector for vector in vectors})
+
+
+def _vector(vector_id, user_id):
+    return {'id': vector_id, 'values': [1.0] * EMBEDDING_DIMENSIONS, 'metadata': {'user_id': user_id, 'text': vector_id}}
+
+
+@override_settings(
+    VECTOR_STORE_BACKEND='auto', VECTOR_STORE_LOCAL_MAX_VECTORS=3, VECTOR_STORE_MIRROR_RETRY=0,
+    BACKGROUND_TASKS_ENABLED=False, CACHES=LOCMEM_CACHES,
+)
+class AutoVectorStoreTests(SimpleTestCase):
+    """'auto' 백엔드는 Pinecone에서 모두 받아 온 사본만 로컬에서 조회합니다."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.local = LocalVectorStore(directory.name)
+        self.index = MirrorIndex([_vector('a-1', 1), _vector('a-2', 1), _vector('b-1', 2)])
+        pool = PineconeIndexPool(index_factory=lambda: self.index)
+        for name, value in (('local_store', self.local), ('pinecone_pool', pool)):
+            patcher = mock.patch.object(vector_store, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        vector_store._mirror_checked.clear()
+
+    def test_partial_copy_is_not_used_until_backfilled(self):
+        vector_store.upsert_vectors([_vector('a-3', 1)])
+        self.assertFalse(self.local.has_user(1)) # 사본이 없는 사용자는 로컬에 일부만 쓰지 않습니다.
+
+        # 첫 조회는 Pinecone으로 가고, 그 사이 백필이 사본을 완성합니다.
+        self.assertIs(vector_store.get_vector_store(1), vector_store.pinecone_store)
+        self.assertIs(vector_store.get_vector_store(1), self.local)
+        self.assertEqual(self.local.count(1), 3)
+
+        vector_store.upsert_vectors([_vector('a-3', 1)])
+        self.assertEqual(self.local.count(1), 3)
+
+    def test_user_over_limit_is_not_mirrored(self):
+        self.index.upsert([_vector('b-2', 2), _vector('b-3', 2), _vector('b-4', 2)])
+        self.assertFalse(vector_store.mirror_user(2))
+        self.assertIs(vector_store.get_vector_store(2), vector_store.pinecone_store)
+        self.assertFalse(self.local.has_user(2))
+
+    def test_growing_past_limit_or_delete_user_clears_the_mark(self):
+        self.assertTrue(vector_store.mirror_user(1))
+        self.local.delete_user(1)
+        self.assertFalse(self.local.is_complete(1))
+
+        self.assertTrue(vector_store.mirror_user(1))
+        vector_store.upsert_vectors([_vector('a-3', 1), _vector('a-4', 1)])
+        self.assertFalse(self.local.is_complete(1))
+        self.assertFalse(self.local.has_user(1))
+
+
+class AuthQueryCountTests(TestCase):
+    """회원가입/로그인 경로는 프로필을 불필요하게 읽거나 저장하지 않습니다. (bench_auth_queries와 같은 경로)"""
+
+    def test_signup_queries(self):
+        # auth_user INSERT + chat_app_userprofile INSERT
+        with self.assertNumQueries(2):
+            User.objects.create_user(username='signup', password='pw')
+
+    def test_login_does_not_touch_profile(self):
+        User.objects.create_user(username='signin', password='pw')
+        request = RequestFactory().post('/login/')
+        request.session = SessionStore()
+
+        with self.assertNumQueries(6) as queries:
+            user = authenticate(request, username='signin', password='pw')
+            login(request, user)
+        self.assertFalse(any('userprofile' in query['sql'] for query in queries.captured_queries))
+
+
+class UserProfileDirtyFieldsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dirty')
+
+    def test_loaded_profile_saves_only_changed_fields(self):
+        profile = UserProfile.objects.get(user=self.user)
+        with self.assertNumQueries(0):
+            profile.save()
+
+        profile.affinity_score = 5
+        with self.assertNumQueries(1) as queries:
+            profile.save()
+        self.assertNotIn('memory', queries.captured_queries[0]['sql'])
+        self.assertEqual(profile.get_dirty_fields(), [])
+
+    def test_refresh_and_partial_save_keep_other_changes_dirty(self):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.affinity_score = 7
+        profile.memory = {'facts': ['고양이를 좋아한다']}
+        profile.save(update_fields=['affinity_score'])
+        self.assertEqual(profile.get_dirty_fields(), ['memory'])
+
+        profile.refresh_from_db(fields=['memory'])
+        self.assertEqual(profile.get_dirty_fields(), [])
+
+        profile.affinity_score = 9
+        profile.refresh_from_db()
+        self.assertEqual(profile.affinity_score, 7)
+        self.assertEqual(profile.get_dirty_fields(), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class MentionTaggerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        mention_tagger._taggers.clear()
+        self.user = User.objects.create_user(username='tagger')
+
+    def _add(self, name, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            rel = UserRelationship.objects.create(user=self.user, name=name, relationship_type='친구', **fields)
+        return str(rel.serial_code)
+
+    def test_requires_word_boundary_or_particle(self):
+        min_ = self._add('민')
+        minsu = self._add('민수', position='오빠')
+        tag = lambda text: mention_tagger.tag_mentions(self.user.id, text)
+
+        self.assertEqual(tag('민이랑 놀았다'), [min_])
+        self.assertEqual(tag('민수 오빠한테서는 연락이 없어'), [minsu])
+        self.assertEqual(tag('민수가 왔어'), [minsu])
+        self.assertEqual(tag('시민 공원에 갔다'), [])
+        self.assertEqual(tag('민수기를 읽었다'), [])
+
+    def test_version_survives_cache_eviction(self):
+        first = self._add('지수')
+        self.assertEqual(mention_tagger.tag_mentions(self.user.id, '지수랑'), [first])
+
+        # 공유 캐시 항목이 밀려나도 DB의 버전은 되돌아가지 않으므로, 다음 변경이 이 워커의 매처를 갱신합니다.
+        cache.clear()
+        second = self._add('하늘')
+        self.assertEqual(mention_tagger.tag_mentions(self.user.id, '하늘이랑 지수'), [second, first])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, METRICS_PROCESS_TTL=60)
+class MetricsFlushTests(SimpleTestCase):
+    """워커마다 자기 키에만 쓰고, 워커 목록은 빠졌을 때만 고칩니다."""
+
+    def setUp(self):
+        cache.clear()
+
+    def _flush_as(self, pid):
+        with mock.patch.object(metrics.os, 'getpid', return_value=pid):
+            metrics.flush()
+
+    def test_steady_state_flush_does_not_rewrite_index(self):
+        self._flush_as(101)
+        with mock.patch.object(metrics.cache, 'set', wraps=metrics.cache.set) as cache_set:
+            self._flush_as(101)
+        self.assertEqual([call.args[0] for call in cache_set.call_args_list], ['metrics:process:101'])
+
+    def test_lost_registration_heals_on_next_flush(self):
+        self._flush_as(101)
+        self._flush_as(102)
+        # 동시에 시작한 워커가 101이 없는 옛 목록으로 덮어쓴 상황
+        cache.set(metrics._PROCESSES_KEY, [102], timeout=None)
+        self._flush_as(101)
+        self.assertEqual(sorted(cache.get(metrics._PROCESSES_KEY)), [101, 102])
+
+        # 스냅샷이 만료된 워커는 다음 등록 때 목록에서 빠집니다.
+        cache.delete('metrics:process:102')
+        cache.set(metrics._PROCESSES_KEY, [102], timeout=None)
+        self._flush_as(101)
+        self.assertEqual(cache.get(metrics._PROCESSES_KEY), [101])
+
+
+class LockCacheConfigTests(SimpleTestCase):
+    """잠금/슬롯 캐시는 add가 원자적인 공유 백엔드여야 하며, 아니면 시작 시 실패합니다."""
+
+    def _caches(self, backend):
+        return dict(LOCMEM_CACHES, locks={'BACKEND': backend, 'LOCATION': 'locks'})
+
+    def test_atomic_shared_backends_pass(self):
+        for backend in locks.ATOMIC_BACKENDS:
+            with override_settings(CACHES=self._caches(backend)):
+                locks.check_configuration()
+
+    def test_file_cache_or_missing_alias_fails(self):
+        with override_settings(CACHES=self._caches('django.core.cache.backends.filebased.FileBasedCache')):
+            with self.assertRaises(ImproperlyConfigured):
+                locks.check_configuration()
+        with override_settings(CACHES={'default': LOCMEM_CACHES['default']}):
+            with self.assertRaises(ImproperlyConfigured):
+                locks.check_configuration()
+
+    def test_local_memory_needs_explicit_single_process_opt_in(self):
+        with override_settings(CACHES=LOCMEM_CACHES, LOCK_CACHE_ALLOW_LOCAL=False):
+            with self.assertRaises(ImproperlyConfigured):
+                locks.check_configuration()
+        with override_settings(CACHES=LOCMEM_CACHES, LOCK_CACHE_ALLOW_LOCAL=True):
+            locks.check_configuration()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CHAT_SEND_INFLIGHT_TIMEOUT=5)
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        locks.lock_cache().clear()
+        self.calls = 0
+
+    def _handler(self, result=({'reply': 'ok'}, 201), started=None, release=None):
+        def fn():
+            self.calls += 1
+            if started:
+                started.set()
+            if release:
+                release.wait(5)
+            return result
+        return fn
+
+    def test_leader_runs_and_completed_result_is_not_replayed_without_key(self):
+        key = single_flight.make_key(1, '응')
+        self.assertEqual(single_flight.run_once(key, None, self._handler()), (({'reply': 'ok'}, 201), False))
+        # 처리가 끝난 뒤 다시 보낸 같은 짧은 메시지는 새로 처리합니다.
+        self.assertEqual(single_flight.run_once(key, None, self._handler()), (({'reply': 'ok'}, 201), False))
+        self.assertEqual(self.calls, 2)
+
+    def test_idempotency_key_replays_completed_result(self):
+        key = single_flight.make_key(1, '응', 'client-key')
+        single_flight.run_once(key, 'client-key', self._handler())
+        result, replayed = single_flight.run_once(key, 'client-key', self._handler(({'reply': 'new'}, 201)))
+        self.assertEqual((result, replayed), (({'reply': 'ok'}, 201), True))
+        self.assertEqual(self.calls, 1)
+
+    def test_waiter_gets_leader_result(self):
+        key = single_flight.make_key(1, '안녕')
+        started, release = threading.Event(), threading.Event()
+        leader = []
+        thread = threading.Thread(target=lambda: leader.append(
+            single_flight.run_once(key, None, self._handler(started=started, release=release))
+        ))
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+
+        waiter = single_flight.run_once(key, None, self._handler(({'reply': 'dup'}, 201)))
+        thread.join(5)
+        self.assertEqual(leader, [(({'reply': 'ok'}, 201), False)])
+        self.assertEqual(waiter, (({'reply': 'ok'}, 201), True))
+        self.assertEqual(self.calls, 1)
+
+    def test_waiter_takes_over_when_leader_fails(self):
+        key = single_flight.make_key(1, '안녕')
+        started, release = threading.Event(), threading.Event()
+        failing = self._handler(({'error': 'llm'}, 503), started=started, release=release)
+        thread = threading.Thread(target=single_flight.run_once, args=(key, None, failing))
+        thread.start()
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+
+        result, replayed = single_flight.run_once(key, None, self._handler())
+        thread.join(5)
+        self.assertEqual((result, replayed), (({'reply': 'ok'}, 201), False))
+        self.assertEqual(self.calls, 2)
+
+    def test_lock_lives_in_lock_cache(self):
+        key = single_flight.make_key(1, '안녕')
+        held = []
+
+        def fn():
+            held.append((locks.lock_cache().get(single_flight._lock_key(key)), cache.get(single_flight._lock_key(key))))
+            return {'reply': 'ok'}, 201
+
+        single_flight.run_once(key, None, fn)
+        self.assertIsNotNone(held[0][0])
+        self.assertIsNone(held[0][1])
+        self.assertIsNone(locks.lock_cache().get(single_flight._lock_key(key)))
+
+    def test_leader_exception_releases_lock(self):
+        key = single_flight.make_key(1, '안녕')
+
+        def boom():
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            single_flight.run_once(key, None, boom)
+        self.assertEqual(single_flight.run_once(key, None, self._handler())[1], False)
+
+    def test_async_waiter_gets_leader_result(self):
+        key = single_flight.make_key(1, '안녕')
+
+        async def scenario():
+            release = asyncio.Event()
+
+            async def leader_fn():
+                self.calls += 1
+                await release.wait()
+                return {'reply': 'ok'}, 201
+
+            async def waiter_fn():
+                self.calls += 1
+                return {'reply': 'dup'}, 201
+
+            leader = asyncio.ensure_future(single_flight.arun_once(key, None, leader_fn))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(single_flight.arun_once(key, None, waiter_fn))
+            await asyncio.sleep(0.1)
+            release.set()
+            return await leader, await waiter
+
+        leader, waiter = async_to_sync(scenario)()
+        self.assertEqual(leader, (({'reply': 'ok'}, 201), False))
+        self.assertEqual(waiter, (({'reply': 'ok'}, 201), True))
+        self.assertEqual(self.calls, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, LLM_MAX_CONCURRENCY=1, LLM_QUEUE_MAX=1, LLM_QUEUE_TIMEOUT=2)
+class ConcurrencyLimiterTests(SimpleTestCase):
+    """
+    sync gunicorn 워커는 프로세스마다 요청을 하나만 처리하므로, 워커마다 따로 세는 제한은 걸리지 않습니다.
+    두 ConcurrencyLimiter 인스턴스(= 두 워커 프로세스)가 공유 캐시의 슬롯을 함께 쓰는지 확인합니다.
+    """
+
+    def setUp(self):
+        cache.clear()
+        locks.lock_cache().clear()
+        self.worker_a = admission.ConcurrencyLimiter()
+        self.worker_b = admission.ConcurrencyLimiter()
+
+    def test_slot_is_shared_across_workers(self):
+        lease = self.worker_a.acquire()
+        # B는 대기 자리를 잡고 기다리다가 A가 반납하면 들어갑니다.
+        threading.Timer(0.1, self.worker_a.release, args=(lease,)).start()
+        lease_b = self.worker_b.acquire()
+        self.assertEqual(lease_b[0], lease[0])
+        self.worker_b.release(lease_b)
+
+    def test_full_queue_and_timeout_are_rejected_across_workers(self):
+        lease = self.worker_a.acquire()
+        reasons = []
+
+        def wait_in_b():
+            try:
+                self.worker_b.acquire()
+            except admission.AdmissionRejected as e:
+                reasons.append(e.reason)
+
+        waiter = threading.Thread(target=wait_in_b)
+        waiter.start()
+        time.sleep(0.1)
+
+        # 실행 슬롯 1개와 대기 자리 1개가 다른 워커들에게 잡혀 있으므로 바로 503입니다.
+        with self.assertRaises(admission.AdmissionRejected) as rejected:
+            admission.ConcurrencyLimiter().acquire()
+        self.assertEqual((rejected.exception.status_code, rejected.exception.reason), (503, 'queue_full'))
+
+        waiter.join(5)
+        self.assertEqual(reasons, ['queue_timeout'])
+        self.worker_a.release(lease)
+        self.worker_b.release(self.worker_b.acquire())
+
+    def test_held_slot_survives_bulk_cache_eviction(self):
+        lease = self.worker_a.acquire()
+        # 기본 캐시가 가득 차서 항목을 버려도 잠금 캐시의 슬롯은 그대로입니다.
+        cache.clear()
+        with self.assertRaises(admission.AdmissionRejected):
+            with override_settings(LLM_QUEUE_MAX=0):
+                self.worker_b.acquire()
+        self.assertEqual(locks.lock_cache().get(lease[0]), lease[1])
+        self.worker_a.release(lease)
+
+    @override_settings(LLM_SLOT_TTL=1)
+    def test_leaked_slot_expires(self):
+        self.worker_a.acquire() # 반납하지 못하고 죽은 워커
+        lease = self.worker_b.acquire()
+        self.worker_b.release(lease)
+
+    def test_async_acquire_shares_slots(self):
+        lease = self.worker_a.acquire()
+        with self.assertRaises(admission.AdmissionRejected):
+            with override_settings(LLM_QUEUE_MAX=0):
+                async_to_sync(self.worker_b.aacquire)()
+        self.worker_a.release(lease)
+        self.worker_b.release(async_to_sync(self.worker_b.aacquire)())
+
+
+@override_settings(
+    KEYWORD_INDEX_ENABLED=True, KEYWORD_MAX_DF_RATIO=1.0,
+    KEYWORD_SKIP_VECTOR_COVERAGE=0.9, KEYWORD_SKIP_VECTOR_MIN_TERMS=3, BACKGROUND_TASKS_ENABLED=False,
+    INGESTION_SYNC_CHANGES=False,
+)
+class KeywordIndexTests(TestCase):
+    """키워드(BM25) 색인과 벡터 조회 생략 판단"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='keyword')
+        patches = [
+            mock.patch.object(views, 'get_query_embedding', return_value=[0.0] * EMBEDDING_DIMENSIONS),
+            mock.patch.object(views, 'query_user_documents', return_value=['벡터 문서']),
+        ]
+        self.embedding, self.vector_query = [patcher.start() for patcher in patches]
+        for patcher in patches:
+            self.addCleanup(patcher.stop)
+
+    def _chat(self, text, is_user=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ChatMessage.objects.create(user=self.user, message=text, is_user=is_user)
+
+    def _activity(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return UserActivity.objects.create(user=self.user, **fields)
+
+    def _documents(self, user=None):
+        return set(KeywordDocument.objects.filter(user=user or self.user).values_list('source', 'source_id'))
+
+    def test_saved_rows_are_indexed_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            message = ChatMessage.objects.create(user=self.user, message='성수동 카페', is_user=True)
+        # 요청 경로(커밋 전)에서는 색인하지 않습니다.
+        self.assertEqual(self._documents(), set())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._documents(), {('chat', message.id)})
+        terms = set(KeywordPosting.objects.filter(document__source_id=message.id).values_list('term', flat=True))
+        self.assertLessEqual({'성수', '수동', '카페'}, terms)
+
+        activity = self._activity(place='성수동')
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.place = '망원동'
+            activity.save()
+        self.assertEqual(keyword_index.search(self.user.id, '망원동').texts, [ingestion.user_activity_text(activity)])
+        self.assertEqual(keyword_index.search(self.user.id, '성수동').texts, [ingestion.chat_message_text(message)])
+
+    def test_row_deleted_before_task_runs_is_not_indexed(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            activity = UserActivity.objects.create(user=self.user, place='성수동')
+        activity.delete()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._documents(), set())
+
+    def test_bm25_ranks_rarer_and_denser_matches_first(self):
+        short = self._chat('블루보틀 카페')
+        long = self._chat('블루보틀 말고 다른 카페도 많이 가 봤는데 거기가 제일 나았어')
+        self._chat('카페 가자')
+
+        result = keyword_index.search(self.user.id, '블루보틀 카페')
+        texts = [ingestion.chat_message_text(msg) for msg in (short, long)]
+        self.assertEqual(result.texts[:2], texts)
+        self.assertEqual(result.scores, sorted(result.scores, reverse=True))
+
+    def test_fuse_prefers_documents_found_by_both(self):
+        fused = keyword_index.fuse(['a', 'b', 'c'], ['c', 'd'], n_results=3)
+        self.assertEqual(fused, ['c', 'a', 'b'])
+
+    def test_rebuild_replaces_only_the_given_users_documents(self):
+        other = User.objects.create_user(username='keyword-other')
+        message = self._chat('성수동 카페')
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatMessage.objects.create(user=other, message='망원동 빵집', is_user=True)
+        # signal 없이 들어온 행(bulk_create)과 원본이 사라진 문서
+        activity = UserActivity.objects.bulk_create([UserActivity(user=self.user, place='연남동')])[0]
+        KeywordDocument.objects.filter(user=self.user).update(text='예전 텍스트')
+        KeywordDocument.objects.create(
+            source='chat', source_id=999999, user=self.user, text='지워진 메시지', timestamp=message.timestamp, length=1,
+        )
+
+        counts = keyword_index.rebuild([self.user.id])
+        self.assertEqual(counts, {'chat': 1, 'activity': 1})
+        self.assertEqual(self._documents(), {('chat', message.id), ('activity', activity.id)})
+        self.assertEqual(keyword_index.search(self.user.id, '성수동').texts, [ingestion.chat_message_text(message)])
+        self.assertEqual(len(self._documents(other)), 1)
+
+    def test_matching_activity_skips_vector_lookup(self):
+        activity = self._activity(place='성수동', memo='블루보틀 카페')
+        self._chat('오늘 날씨 좋다')
+
+        docs = views.search_documents('성수동 블루보틀', self.user.id)
+        self.assertEqual(docs[0], ingestion.user_activity_text(activity))
+        self.vector_query.assert_not_called()
+
+    def test_old_identical_chat_question_does_not_skip_vector_lookup(self):
+        old = self._chat('홍대 라멘집 어디였지')
+        self._activity(place='홍대', memo='친구랑 산책')
+
+        docs = views.search_documents('홍대 라멘집 어디였지', self.user.id)
+        # 예전의 같은 질문은 질문 n-gram을 모두 덮지만, 활동 기록이 아니므로 벡터 조회를 합니다.
+        self.vector_query.assert_called_once()
+        self.assertIn(ingestion.chat_message_text(old), docs)
+        self.assertIn('벡터 문서', docs)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CONVERSATION_KEEP_TURNS=1, CHAT_PROMPT_HISTORY_TURNS=1)
+class ConversationCompactionTests(TestCase):
+
+    def setUp(self):
+        locks.lock_cache().clear()
+        self.user = User.objects.create_user(username='compact')
+        patcher = mock.patch.object(conversation_summary, 'summarize', side_effect=lambda previous, batch: f"{previous}+{len(batch)}")
+        self.summarize = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _add_pairs(self, count: int):
+        for i in range(count):
+            ChatMessage.objects.create(user=self.user, message=f'질문 {i}', is_user=True)
+            ChatMessage.objects.create(user=self.user, message=f'답변 {i}', is_user=False)
+
+    def test_batches_end_with_ai_message(self):
+        messages = [SimpleNamespace(id=i, is_user=i % 2 == 0) for i in range(9)] # 사용자, AI, ... 사용자
+        batches = conversation_summary._pair_aligned_batches(messages, 3)
+        self.assertEqual([[msg.id for msg in batch] for batch in batches], [[0, 1, 2, 3], [4, 5, 6, 7]])
+        self.assertTrue(all(not batch[-1].is_user for batch in batches))
+
+    def test_archive_moves_folded_pairs_and_history_reads_across(self):
+        self._add_pairs(5)
+        originals = list(ChatMessage.objects.filter(user=self.user).order_by('id').values_list('id', 'message'))
+
+        result = conversation_summary.compact_user(self.user.id, archive=True, min_messages=1, batch_messages=3)
+        self.assertEqual((result['folded'], result['archived'], result['batches']), (8, 8, 2))
+        # 최근 한 턴은 핫 테이블에 남고, 나머지는 원래 id 그대로 보관 테이블로 옮겨집니다.
+        self.assertEqual(
+            list(ChatMessage.objects.filter(user=self.user).order_by('id').values_list('id', 'message')), originals[8:]
+        )
+        archived = ArchivedChatMessage.objects.filter(user=self.user).order_by('original_id')
+        self.assertEqual(list(archived.values_list('original_id', 'message')), originals[:8])
+        summary = ConversationSummary.objects.get(user=self.user)
+        self.assertEqual((summary.last_message_id, summary.message_count), (originals[7][0], 8))
+
+        factory = APIRequestFactory()
+        pairs, before_id = [], None
+        while True:
+            request = factory.get('/api/chat/history/', {'limit': 2, **({'before_id': before_id} if before_id else {})})
+            force_authenticate(request, user=self.user)
+            response = get_chat_history(request)
+            pairs += [(pair['user_message'], pair['ai_response']) for pair in response.data]
+            if not response.has_header('X-Next-Before-Id'):
+                break
+            before_id = response['X-Next-Before-Id']
+        self.assertEqual(pairs, [(f'질문 {i}', f'답변 {i}') for i in reversed(range(5))])
+
+    def test_user_locked_in_lock_cache_is_skipped(self):
+        self._add_pairs(3)
+        key = conversation_summary._lock_key(self.user.id)
+        locks.lock_cache().add(key, 'other-worker', timeout=60)
+
+        result = conversation_summary.compact_user(self.user.id, min_messages=1, batch_messages=2)
+        self.assertEqual(result['skipped'], 'locked')
+        self.summarize.assert_not_called()
+        # 다른 프로세스의 잠금은 풀지 않습니다.
+        self.assertEqual(locks.lock_cache().get(key), 'other-worker')
+
+
+@override_settings(BACKGROUND_TASKS_ENABLED=True, BACKGROUND_QUEUE_SIZE=1)
+class BackgroundWorkerTests(SimpleTestCase):
+    def test_shutdown_with_full_queue_returns_within_timeout(self):
+        worker = BackgroundWorker()
+        started, release = threading.Event(), threading.Event()
+        worker.submit('block', lambda: (started.set(), release.wait(5)))
+        started.wait(5)
+        worker.submit('queued', lambda: None) # 큐(1칸)가 꽉 찹니다.
+
+        began = time.monotonic()
+        worker.shutdown(timeout=0.2)
+        self.assertLess(time.monotonic() - began, 1)
+        release.set()
+
+
+class RoomStateApiTests(TestCase):
+    """/api/room/state/ 쿼리 수와 ETag 조건부 요청"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='room')
+        self.room = Room.objects.create(user=self.user)
+
+    def _get(self, etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        request = self.factory.get('/api/room/state/', headers=headers)
+        force_authenticate(request, user=self.user)
+        return room_state_api(request)
+
+    def _add_items(self, count: int):
+        FurnitureItem.objects.bulk_create([FurnitureItem(room=self.room, item_type='chair') for _ in range(count)])
+
+    def test_query_count_does_not_grow_with_furniture(self):
+        for total in (3, 30):
+            self._add_items(total - self.room.furniture_items.count())
+            with self.assertNumQueries(2):
+                response = self._get()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['furniture_items']), total)
+
+    def test_etag_round_trip(self):
+        self._add_items(2)
+        first = self._get()
+        etag = first['ETag']
+
+        not_modified = self._get(etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIsNone(not_modified.data)
+        self.assertEqual(not_modified['ETag'], etag)
+
+        # 가구 하나가 바뀌면 ETag가 달라지고 다시 본문을 보냅니다.
+        item = self.room.furniture_items.first()
+        item.position_x = 3.0
+        item.save()
+        changed = self._get(etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+
+class FurnitureBatchApiTests(TestCase):
+    """/api/room/furniture/batch/ 버전 충돌, 롤백, 쿼리 수"""
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.create_user(username='furniture')
+        self.room = Room.objects.create(user=self.user)
+
+    def _post(self, version=None, create=(), update=(), delete=()):
+        payload = {
+            'version': self.room.version if version is None else version,
+            'create': list(create), 'update': list(update), 'delete': list(delete),
+        }
+        request = self.factory.post('/api/room/furniture/batch/', payload, format='json')
+        force_authenticate(request, user=self.user)
+        response = furniture_batch_api(request)
+        self.room.refresh_from_db()
+        return response
+
+    def _add_items(self, count: int):
+        return FurnitureItem.objects.bulk_create([FurnitureItem(room=self.room, item_type='chair') for _ in range(count)])
+
+    def test_stale_version_is_rejected_with_current_version(self):
+        self.assertEqual(self._post(create=[{'item_type': 'bed'}]).status_code, 200)
+
+        response = self._post(version=0, create=[{'item_type': 'desk'}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(list(self.room.furniture_items.values_list('item_type', flat=True)), ['bed'])
+
+    def test_bad_item_rolls_back_the_whole_batch(self):
+        kept = self._add_items(1)[0]
+        response = self._post(
+            create=[{'item_type': 'bed'}],
+            update=[{'id': kept.id, 'position_x': 5.0}, {'id': 999999, 'position_x': 1.0}],
+            delete=[kept.id + 1000],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.room.version, 0)
+        kept.refresh_from_db()
+        self.assertEqual(kept.position_x, 0.0)
+        self.assertEqual(self.room.furniture_items.count(), 1)
+
+    def test_duplicate_update_ids_are_rejected(self):
+        item = self._add_items(1)[0]
+        response = self._post(update=[{'id': item.id, 'position_x': 1.0}, {'id': item.id, 'position_x': 2.0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.room.version, 0)
+        item.refresh_from_db()
+        self.assertEqual(item.position_x, 0.0)
+
+    def test_update_query_count_does_not_grow_with_items(self):
+        counts = []
+        for total in (2, 20):
+            items = self._add_items(total)
+            update = [{'id': item.id, 'position_x': 1.5, 'rotation': 90.0} for item in items]
+            with CaptureQueriesContext(connection) as queries:
+                response = self._post(update=update)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['updated']), total)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(
+            set(self.room.furniture_items.values_list('position_x', 'rotation')), {(1.5, 90.0)}
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BACKGROUND_TASKS_ENABLED=False)
+class UserContextTests(TestCase):
+    """프롬프트용 사용자 컨텍스트 캐시와 토큰 예산"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='context')
+        UserAttribute.objects.create(user=self.user, fact_type='MBTI', content='INFP')
+
+    def _assert_cached(self):
+        with self.assertNumQueries(0):
+            return user_context.get_user_context(self.user.id)
+
+    def test_cache_hit_needs_no_queries(self):
+        with self.assertNumQueries(4): # 프로필, 속성, 인간관계, 대화 요약
+            first = user_context.get_user_context(self.user.id)
+        self.assertEqual(self._assert_cached(), first)
+        self.assertEqual([item['text'] for item in first['items']], ['MBTI: INFP'])
+
+    def test_memory_changes_invalidate(self):
+        user_context.get_user_context(self.user.id)
+        UserAttribute.objects.create(user=self.user, fact_type='생일', content='10월 31일')
+        self.assertIn('생일: 10월 31일', [item['text'] for item in user_context.get_user_context(self.user.id)['items']])
+
+        UserRelationship.objects.create(user=self.user, relationship_type='친구', name='민수')
+        self.assertIn('relationship', [item['kind'] for item in user_context.get_user_context(self.user.id)['items']])
+
+        profile = UserProfile.objects.get(user=self.user)
+        profile.memory = {'취미': '영화'}
+        profile.save()
+        self.assertIn('취미: 영화', [item['text'] for item in user_context.get_user_context(self.user.id)['items']])
+
+    def test_activity_save_keeps_cached_context(self):
+        # 활동 기록은 사용자 컨텍스트에 들어가지 않으므로(검색 문서로만 쓰임) 캐시를 비우지 않습니다.
+        user_context.get_user_context(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserActivity.objects.create(user=self.user, place='성수동')
+        self._assert_cached()
+
+    def test_token_budget_keeps_most_relevant_items(self):
+        context = {
+            'affinity_score': 10,
+            'items': [
+                {'kind': 'memory', 'text': '좋아하는 음식: 떡볶이'},
+                {'kind': 'attribute', 'text': '직업: 개발자'},
+                {'kind': 'relationship', 'text': '인간관계 - 민수: 친구', 'serial_code': 'a'},
+            ],
+        }
+        block = user_context.build_user_context(context, '떡볶이 먹으러 갈까', budget_tokens=30)
+        self.assertEqual(block.splitlines(), ['호감도: 10', '- 좋아하는 음식: 떡볶이', '- 직업: 개발자'])
+
+        tight = user_context.build_user_context(context, '떡볶이 먹으러 갈까', budget_tokens=20)
+        self.assertEqual(tight.splitlines(), ['호감도: 10', '- 좋아하는 음식: 떡볶이'])
+        self.assertLessEqual(sum(user_context.estimate_tokens(line) for line in tight.splitlines()), 20)
+
+        # 언급된 사람은 관련도와 상관없이 먼저 넣습니다.
+        boosted = user_context.build_user_context(context, '떡볶이', budget_tokens=20, boost_serial_codes=['a'])
+        self.assertEqual(boosted.splitlines()[1], '- 인간관계 - 민수: 친구')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RETRIEVAL_CACHE_TTL=60, VECTOR_STORE_BACKEND='local')
+class RetrievalCacheTests(SimpleTestCase):
+    """사용자별 벡터 검색 결과 캐시의 적중/미스와 세대 무효화"""
+
+    def setUp(self):
+        cache.clear()
+        self.queries = []
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(vector_store, 'local_store', LocalVectorStore(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _search(self, user_id=1, embedding=(1.0, 0.0), top_k=5):
+        def query():
+            self.queries.append(user_id)
+            return [f'문서 {len(self.queries)}']
+        return retrieval_cache.get_or_query(user_id, list(embedding), top_k, query)
+
+    def test_hit_and_miss(self):
+        self.assertEqual(self._search(), ['문서 1'])
+        self.assertEqual(self._search(), ['문서 1'])
+        self.assertEqual(len(self.queries), 1)
+
+        # 다른 임베딩, 다른 top_k, 다른 사용자는 각각 새로 조회합니다.
+        self._search(embedding=(0.0, 1.0))
+        self._search(top_k=3)
+        self._search(user_id=2)
+        self.assertEqual(len(self.queries), 4)
+
+    def test_upsert_bumps_only_that_users_generation(self):
+        self._search(user_id=1)
+        self._search(user_id=2)
+        vector_store.upsert_vectors([_vector('a-1', 1)])
+
+        self.assertEqual(self._search(user_id=1), ['문서 3'])
+        self.assertEqual(self._search(user_id=2), ['문서 2'])
+        self.assertEqual(cache.get(retrieval_cache._generation_key(1)), 1)
+
+        vector_store.delete_vectors(1, ['a-1'])
+        self.assertEqual(cache.get(retrieval_cache._generation_key(1)), 2)
+        self.assertEqual(self._search(user_id=1), ['문서 4'])
+
+    def test_live_chat_upsert_keeps_cached_results(self):
+        self._search(user_id=1)
+        vector_store.upsert_vectors([_vector('a-1', 1)], invalidate_cache=False)
+        self.assertEqual(self._search(user_id=1), ['문서 1'])
+        self.assertEqual(len(self.queries), 1)
+
+
+@override_settings(BACKGROUND_TASKS_ENABLED=False, INGESTION_SYNC_CHANGES=False, KEYWORD_INDEX_ENABLED=False)
+class ActivityAnalyticsTests(TestCase):
+    """활동 롤업의 증분 반영(apply_delta)은 재구축(rebuild_rollups)과 같은 결과여야 합니다."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analytics')
+
+    def _save(self, activity):
+        with self.captureOnCommitCallbacks(execute=True):
+            activity.save()
+        return activity
+
+    def _stored(self):
+        return analytics.stored_rollups([self.user.id])
+
+    def test_incremental_changes_match_rebuild(self):
+        day = date(2024, 5, 1)
+        cafe = self._save(UserActivity(user=self.user, activity_date=day, place='카페', companion='민수'))
+        self._save(UserActivity(user=self.user, activity_date=day, place='카페', companion='민수'))
+        park = self._save(UserActivity(user=self.user, activity_date=day + timedelta(days=40), place='공원 '))
+        self._save(UserActivity(user=self.user, place='날짜 없음'))
+
+        cafe.place = '도서관'
+        self._save(cafe)
+        with self.captureOnCommitCallbacks(execute=True):
+            park.delete()
+
+        incremental = self._stored()
+        self.assertEqual(analytics.find_mismatches([self.user.id]), [])
+        self.assertEqual(analytics.rebuild_rollups([self.user.id]), len(incremental))
+        self.assertEqual(self._stored(), incremental)
+        self.assertEqual(incremental[(self.user.id, ('monthly', date(2024, 5, 1), '카페', '민수'))], 1)
+        self.assertEqual(incremental[(self.user.id, ('weekly', date(2024, 4, 29), '도서관', '민수'))], 1)
+        # 0이 된 행(공원)은 지우고, 장소나 날짜가 없는 활동은 집계하지 않습니다.
+        self.assertFalse(ActivityAnalytics.objects.filter(user=self.user, place__in=['공원', '날짜 없음']).exists())
+
+    def test_apply_delta_creates_increments_and_removes_rows(self):
+        keys = analytics.rollup_keys(date(2024, 5, 1), '카페', None)
+        analytics.apply_delta(self.user.id, keys, 2)
+        self.assertEqual(set(self._stored().values()), {2})
+        self.assertEqual(len(self._stored()), 3)
+
+        analytics.apply_delta(self.user.id, keys, -5)
+        self.assertEqual(ActivityAnalytics.objects.filter(user=self.user).count(), 0)
+
+    def test_find_mismatches_reports_drift_and_rebuild_fixes_it(self):
+        self._save(UserActivity(user=self.user, activity_date=date(2024, 5, 1), place='카페'))
+        ActivityAnalytics.objects.filter(user=self.user, period_type='yearly').update(count=7)
+        ActivityAnalytics.objects.filter(user=self.user, period_type='weekly').delete()
+
+        mismatches = sorted(analytics.find_mismatches([self.user.id]), key=lambda m: m['key'][0])
+        self.assertEqual(
+            [(m['key'][0], m['expected'], m['stored']) for m in mismatches],
+            [('weekly', 1, 0), ('yearly', 1, 7)],
+        )
+        analytics.rebuild_rollups([self.user.id])
+        self.assertEqual(analytics.find_mismatches([self.user.id]), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BACKGROUND_TASKS_ENABLED=False, INGESTION_SYNC_CHANGES=False)
+class MemoryExportTests(TestCase):
+    """기억 내보내기 -> 가져오기 왕복"""
+
+    def setUp(self):
+        self.source = User.objects.create_user(username='export-source')
+        self.target = User.objects.create_user(username='export-target')
+        UserProfile.objects.filter(user=self.source).update(affinity_score=42, memory={'취미': '영화'})
+        ArchivedChatMessage.objects.create(
+            original_id=1, user=self.source, message='예전 질문', is_user=True, timestamp=timezone.now() - timedelta(days=30),
+        )
+        ChatMessage.objects.create(user=self.source, message='최근 질문', is_user=True)
+        ChatMessage.objects.create(user=self.source, message='최근 답변', is_user=False)
+        UserActivity.objects.create(user=self.source, activity_date=date(2024, 5, 1), place='카페', memo='라떼')
+        UserAttribute.objects.create(user=self.source, fact_type='MBTI', content='INFP')
+        UserRelationship.objects.create(user=self.source, relationship_type='친구', name='민수')
+        room = Room.objects.create(user=self.source, room_name='내 방')
+        FurnitureItem.objects.create(room=room, item_type='bed', position_x=1.5)
+
+    def _export_gzip_file(self) -> str:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/memory.ndjson.gz"
+        with open(path, 'wb') as f:
+            for chunk in memory_export.gzip_stream(memory_export.iter_export(self.source, chunk_size=1), flush_bytes=16):
+                f.write(chunk)
+        return path
+
+    def _import(self, path):
+        with memory_export.open_export(path) as lines:
+            return memory_export.import_lines(lines, self.target, batch_size=1)
+
+    def test_gzip_round_trip(self):
+        path = self._export_gzip_file()
+        counts = self._import(path)
+
+        self.assertEqual(counts, {
+            'chat_message': 3, 'user_activity': 1, 'user_attribute': 1, 'user_relationship': 1, 'furniture_item': 1,
+        })
+        profile = UserProfile.objects.get(user=self.target)
+        self.assertEqual((profile.affinity_score, profile.memory), (42, {'취미': '영화'}))
+        self.assertEqual(
+            list(ChatMessage.objects.filter(user=self.target).order_by('timestamp').values_list('message', flat=True)),
+            ['예전 질문', '최근 질문', '최근 답변'],
+        )
+        source_activity = UserActivity.objects.get(user=self.source)
+        activity = UserActivity.objects.get(user=self.target)
+        self.assertEqual((activity.place, activity.created_at), ('카페', source_activity.created_at))
+        self.assertEqual(Room.objects.get(user=self.target).room_name, '내 방')
+        self.assertEqual(FurnitureItem.objects.get(room_id=self.target.pk).position_x, 1.5)
+        # 원래 주인이 있는 serial_code는 새로 발급합니다.
+        self.assertNotEqual(
+            UserRelationship.objects.get(user=self.target).serial_code,
+            UserRelationship.objects.get(user=self.source).serial_code,
+        )
+        self.assertEqual(analytics.find_mismatches([self.target.id]), [])
+
+    def test_second_import_skips_existing_relationships_and_attributes(self):
+        path = self._export_gzip_file()
+        self._import(path)
+        counts = self._import(path)
+
+        self.assertEqual((counts['user_relationship'], counts['user_attribute']), (0, 0))
+        self.assertEqual(UserRelationship.objects.filter(user=self.target).count(), 1)
+        self.assertEqual(UserAttribute.objects.filter(user=self.target).count(), 1)
+        # 대화/활동 기록은 중복을 가리지 않습니다. (모듈 docstring 참고)
+        self.assertEqual(counts['chat_message'], 3)
@@ -7,7 +7,15 @@ from .api import views as api_views
 urlpatterns = [
     path('', views.chat_view, name='chat_view'),
     path('api/send_message/', views.send_message_api, name='send_message_api'),
+    path('api/send_message/stream/', views.send_message_stream_api, name='send_message_stream_api'),
+    path('api/health/vector/', views.vector_health_api, name='api_vector_health'),
+    path('api/health/embedding-cache/', views.embedding_cache_stats_api, name='api_embedding_cache_stats'),
+    path('metrics/', views.metrics_api, name='metrics'),
     path('api/chat/history/', api_views.get_chat_history, name='api_chat_history'),
     path('api/chat/send/', api_views.send_chat_message, name='api_chat_send'),
-        path('api/room/state/', api_views.room_state_api, name='api_room_state'),
+    path('api/chat/send/async/', api_views.send_chat_message_async, name='api_chat_send_async'),
+    path('api/chat/send/stream/', api_views.send_chat_message_stream, name='api_chat_send_stream'),
+    path('api/room/state/', api_views.room_state_api, name='api_room_state'),
+    path('api/room/furniture/batch/', api_views.furniture_batch_api, name='api_room_furniture_batch'),
+    path('api/memory/export/', api_views.memory_export_api, name='api_memory_export'),
 ]
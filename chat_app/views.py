@@ -1,80 +1,149 @@
-from openai import OpenAI
-from pinecone import Pinecone, ServerlessSpec
-from typing import List, Dict
+import asyncio
+from asgiref.sync import sync_to_async
+from typing import List, Dict, Iterator, Optional
 from datetime import datetime
 from django.shortcuts import render
 import os
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 import json 
+import time
+from .services import admission, keyword_index, metrics, retrieval_cache
+from .services.clients import closes_async_openai_client, get_async_openai_client, get_openai_client
+from .services.pinecone_pool import pinecone_pool
+from .services.embedding_cache import embedding_cache, make_cache_key, normalize_query
+from .services.vector_store import get_vector_store
 
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 
 def get_pinecone_index():
-    """Pinecone 클라이언트를 초기화하고 인덱스를 반환하는 함수"""
-    PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-    PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
-    
-    # 환경 변수 체크
-    if not PINECONE_API_KEY or not PINECONE_ENVIRONMENT or not PINECONE_INDEX_NAME:
-        # Django runserver 체크 단계에서 에러가 나지 않도록 일반적인 Exception 처리
-        raise EnvironmentError("필수 Pinecone 환경 변수(KEY, ENV, NAME)가 설정되지 않았습니다.")
+    """프로세스 전역에서 재사용하는 Pinecone 인덱스 핸들을 반환하는 함수"""
+    return pinecone_pool.get_index()
 
-    INDEX_DIMENSION = 1024 # 1024로 고정
-    
-    # 1. 클라이언트 초기화
-    pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
+# OpenAI 클라이언트는 처음 호출할 때 만듭니다. (워커 부팅/관리 명령에서 SDK import 비용과 API 키 요구를 피함)
+# 비동기 경로에서는 get_async_openai_client()로 이벤트 루프별 클라이언트를 쓰고,
+# 비동기 뷰는 closes_async_openai_client로 감싸 WSGI에서 요청마다 생기는 클라이언트를 닫습니다.
+EMBEDDING_MODEL = "text-embedding-3-large" 
+EMBEDDING_DIMENSIONS = 1024
 
-    # 3. 인덱스 연결
-    return pc.Index(PINECONE_INDEX_NAME)
+def get_query_embedding(query: str) -> List[float]:
+    """
+    쿼리 임베딩을 반환합니다.
+    같은(정규화 기준) 질문은 임베딩 캐시에서 꺼내 OpenAI 호출을 생략합니다.
+    """
+    cache_key = make_cache_key(query, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    query_embedding = embedding_cache.get(cache_key)
+    if query_embedding is not None:
+        return query_embedding
 
-# 초기화 함수는 별도로 호출하지 않고, 필요한 함수 내에서 호출합니다.
-# OpenAI 클라이언트 초기화 (이것은 그대로 모듈 레벨에 둘 수 있습니다.)
-client_openai = OpenAI()
-EMBEDDING_MODEL = "text-embedding-3-large" 
+    # 캐시 키와 같은 정규화 텍스트를 임베딩합니다.
+    with metrics.timed('embedding'):
+        response = get_openai_client().embeddings.create(
+            input = [normalize_query(query)],
+            model = EMBEDDING_MODEL,
+            dimensions = EMBEDDING_DIMENSIONS
+        )
+    query_embedding = response.data[0].embedding
+    embedding_cache.set(cache_key, query_embedding, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    return query_embedding
+
+def query_user_documents(query_embedding: List[float], user_id: int, n_results: int = 5) -> List[str]:
+    """쿼리 임베딩으로 사용자의 문서를 벡터 저장소에서 찾아 문서 내용 목록을 반환합니다."""
+    # 배포 설정(VECTOR_STORE_BACKEND)과 사용자 데이터 크기에 따라 Pinecone 또는 로컬 저장소를 사용합니다.
+    # 어느 쪽이든 해당 user_id의 문서만 검색됩니다.
+    # 같은 임베딩의 최근 결과가 있으면 재사용합니다. (그 사용자의 벡터가 업서트되면 무효화)
+    def query() -> List[str]:
+        with metrics.timed('vector_query'):
+            matches = get_vector_store(user_id).query(query_embedding, user_id, n_results)
+        return [match['text'] for match in matches]
+
+    return retrieval_cache.get_or_query(user_id, query_embedding, n_results, query)
+
+def keyword_search(
+    query: str, user_id: int, n_results: int = 5, before: Optional[datetime] = None
+    ) -> keyword_index.KeywordResult:
+    """로컬 키워드(BM25) 색인을 검색합니다. 꺼져 있거나 실패하면 빈 결과를 반환합니다."""
+    if not settings.KEYWORD_INDEX_ENABLED:
+        return keyword_index.KeywordResult()
+    try:
+        return keyword_index.search(user_id, query, n_results, before)
+    except Exception as e:
+        print(f"키워드 검색 중 오류가 발생했습니다: {e}")
+        return keyword_index.KeywordResult()
 
 def search_documents(
-    query: str, user_id: int, n_results: int = 5
+    query: str, user_id: int, n_results: int = 5, before: Optional[datetime] = None
     ) -> List[str]:
     """
     Pinecone에서 쿼리와 관련된 문서를 검색합니다.
     (컬렉션 이름 대신 인덱스 이름을 사용하며, 필터링 방식이 달라집니다.)
+    로컬 키워드 색인 결과와 RRF로 합치고, 키워드 결과가 충분히 정확하면 벡터 조회를 생략합니다.
+    before: 이 시각 이후에 저장된 문서(현재 턴의 메시지)는 키워드 검색에서 제외합니다.
     """
-    try:
-        pinecone_index = get_pinecone_index() 
+    # 1. 키워드 검색 (로컬 DB)
+    keyword = keyword_search(query, user_id, n_results, before)
+    if keyword.strong:
+        metrics.inc('retrieval_vector_skipped_total')
+        print(f"키워드 검색으로 {len(keyword.texts)}개의 관련 문서를 찾았습니다. (벡터 조회 생략)")
+        return keyword.texts
 
+    try:
         PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 
         print(f"'{PINECONE_INDEX_NAME}' 인덱스에서 관련 문서를 검색합니다...")
-        # 1. 쿼리 임베딩 생성 (ChromaDB와 동일)
-        response = client_openai.embeddings.create(
-            input = [query],
+        # 2. 쿼리 임베딩 생성 (캐시에 있으면 재사용)
+        query_embedding = get_query_embedding(query)
+
+        # 3. 사용자 문서 검색
+        retrieved_docs = query_user_documents(query_embedding, user_id, n_results)
+            
+        print(f"{len(retrieved_docs)}개의 관련 문서를 찾았습니다.")
+    except Exception as e:
+        print(f"문서 검색 중 오류가 발생했습니다: {e}")
+        retrieved_docs = []
+    return keyword_index.fuse(retrieved_docs, keyword.texts, n_results)
+
+async def aget_query_embedding(query: str) -> List[float]:
+    """get_query_embedding의 비동기 버전입니다."""
+    cache_key = make_cache_key(query, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    query_embedding = await sync_to_async(embedding_cache.get)(cache_key)
+    if query_embedding is not None:
+        return query_embedding
+
+    with metrics.timed('embedding'):
+        response = await get_async_openai_client().embeddings.create(
+            input = [normalize_query(query)],
             model = EMBEDDING_MODEL,
-            dimensions = 1024
-        )
-        query_embedding = response.data[0].embedding
-
-        # ChromaDB의 컬렉션 쿼리를 Pinecone의 인덱스 쿼리로 변경합니다.
-        # where={"user_id": user_id} 필터링 로직은 메타데이터 필터로 처리됩니다.
-        results = pinecone_index.query(
-            vector=query_embedding,
-            top_k=n_results,
-            filter={"user_id": user_id}, # 메타데이터 필터링
-            include_metadata=True
+            dimensions = EMBEDDING_DIMENSIONS
         )
+    query_embedding = response.data[0].embedding
+    await sync_to_async(embedding_cache.set)(cache_key, query_embedding, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+    return query_embedding
+
+async def asearch_documents(
+    query: str, user_id: int, n_results: int = 5, before: Optional[datetime] = None
+    ) -> List[str]:
+    """
+    search_documents의 비동기 버전입니다.
+    키워드 색인과 벡터 저장소 조회는 동기 방식이므로 별도 스레드에서 실행합니다.
+    """
+    keyword = await sync_to_async(keyword_search)(query, user_id, n_results, before)
+    if keyword.strong:
+        metrics.inc('retrieval_vector_skipped_total')
+        print(f"키워드 검색으로 {len(keyword.texts)}개의 관련 문서를 찾았습니다. (벡터 조회 생략)")
+        return keyword.texts
+
+    try:
+        query_embedding = await aget_query_embedding(query)
+        retrieved_docs = await asyncio.to_thread(query_user_documents, query_embedding, user_id, n_results)
 
-        retrieved_docs = []
-        for match in results.matches:
-            # Pinecone 결과에서 문서 내용(metadata의 'text' 키 등)을 추출
-            document_content = match.metadata.get('text', '문서 내용 없음')
-            retrieved_docs.append(document_content)
-            
         print(f"{len(retrieved_docs)}개의 관련 문서를 찾았습니다.")
-        return retrieved_docs
     except Exception as e:
         print(f"문서 검색 중 오류가 발생했습니다: {e}")
-        return []
+        retrieved_docs = []
+    return keyword_index.fuse(retrieved_docs, keyword.texts, n_results)
 
 # --- (parse_message_intent, generate_response 등 나머지 함수는 동일하게 유지) ---
 
@@ -85,8 +154,7 @@ if __name__ == "__main__":
     print("종료하시려면 'exit' 또는 'quit'을 입력하세요.")
 
     # 🚨 중요: Pinecone을 사용하기 전, 벡터를 미리 인덱스에 '업서트(Upsert)'하는 과정이 필요합니다.
-    # 이 예시에서는 생략했지만, 실제 운영 전에 별도의 스크립트로 데이터를 업로드해야 합니다.
-    # 예: pinecone_index.upsert(vectors=[(id, vector, metadata)])
+    # 채팅/일기/인간관계 데이터는 `python manage.py ingest_vectors`로 적재합니다.
     
     # 예시 실행을 위해 user_id 임시 설정
     example_user_id = 1 
@@ -111,7 +179,8 @@ if __name__ == "__main__":
 
 @csrf_exempt # 개발 환경에서 테스트를 위해 CSRF를 임시로 비활성화합니다.
 @require_POST
-def send_message_api(request):
+@closes_async_openai_client
+async def send_message_api(request):
     try:
         data = json.loads(request.body)
         user_query = data.get('message', '').strip()
@@ -120,16 +189,22 @@ def send_message_api(request):
         if not user_query:
             return JsonResponse({'error': '메시지가 비어있습니다.'}, status=400)
 
-        # 1. Pinecone 검색 실행
-        retrieved_documents = search_documents(
-            query=user_query, 
-            user_id=user_id, 
-            n_results=5 
-        )
+        # 과부하 시 바로 503으로 돌려보냅니다. (임시 사용자 ID라 사용자별 속도 제한은 적용하지 않음)
+        async with admission.aadmit(None):
+            # 1. Pinecone 검색 실행
+            retrieved_documents = await asearch_documents(
+                query=user_query, 
+                user_id=user_id, 
+                n_results=5 
+            )
 
-        final_response = generate_response(user_query, retrieved_documents)
+            final_response = await agenerate_response(user_query, retrieved_documents)
         return JsonResponse({'response': final_response})
     
+    except admission.AdmissionRejected as e:
+        response = JsonResponse({'error': e.message}, status=e.status_code)
+        response['Retry-After'] = str(e.retry_after)
+        return response
     except EnvironmentError as e:
         return JsonResponse({'error': str(e)}, status=500)
     except Exception as e:
@@ -137,6 +212,78 @@ def send_message_api(request):
         print(f"API 처리 중 오류 발생: {e}")
         return JsonResponse({'error': '서버 처리 중 오류가 발생했습니다.'}, status=500)        
 
+@csrf_exempt # 개발 환경에서 테스트를 위해 CSRF를 임시로 비활성화합니다.
+@require_POST
+def send_message_stream_api(request):
+    """
+    send_message_api의 스트리밍(SSE) 버전입니다.
+    - data: {"delta": "..."}  생성되는 토큰 조각
+    - event: done             전체 응답 ({"response": "..."})
+    - event: error            오류 ({"error": "..."})
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': '잘못된 JSON 형식입니다.'}, status=400)
+
+    user_query = data.get('message', '').strip()
+    user_id = 1 # 임시 사용자 ID
+
+    if not user_query:
+        return JsonResponse({'error': '메시지가 비어있습니다.'}, status=400)
+
+    def event_stream():
+        retrieved_documents = search_documents(
+            query=user_query, 
+            user_id=user_id, 
+            n_results=5 
+        )
+
+        chunks = []
+        try:
+            for delta in generate_response_stream(user_query, retrieved_documents):
+                chunks.append(delta)
+                yield format_sse({'delta': delta})
+        except Exception as e:
+            print(f"LLM 스트리밍 중 오류 발생: {e}")
+            yield format_sse({'error': LLM_ERROR_MESSAGE}, event='error')
+            return
+
+        yield format_sse({'response': ''.join(chunks).strip()}, event='done')
+
+    try:
+        ticket = admission.acquire(None)
+    except admission.AdmissionRejected as e:
+        response = JsonResponse({'error': e.message}, status=e.status_code)
+        response['Retry-After'] = str(e.retry_after)
+        return response
+
+    return sse_response(admission.ReleasingStream(ticket, event_stream()))
+
+def _has_metrics_token(request) -> bool:
+    return bool(settings.METRICS_TOKEN) and request.headers.get('Authorization') == f"Bearer {settings.METRICS_TOKEN}"
+
+def vector_health_api(request):
+    """
+    Pinecone 연결 상태(connected/degraded)를 반환합니다.
+    마지막 오류 내용/시각 등 세부 정보는 스태프 사용자나 METRICS_TOKEN을 보낸 요청에만 보여 줍니다.
+    """
+    pool_status = pinecone_pool.status()
+    status_code = 503 if pool_status['state'] == 'degraded' else 200
+    if not (request.user.is_staff or _has_metrics_token(request)):
+        pool_status = {'state': pool_status['state']}
+    return JsonResponse(pool_status, status=status_code)
+
+def embedding_cache_stats_api(request):
+    """쿼리 임베딩 캐시의 적중/미스 카운터를 반환합니다. (현재 워커 프로세스 기준)"""
+    return JsonResponse(embedding_cache.stats())
+
+def metrics_api(request):
+    """단계별 지연 시간 히스토그램과 토큰 사용량을 Prometheus 텍스트 형식으로 반환합니다. (모든 워커 합산)"""
+    if settings.METRICS_TOKEN and not _has_metrics_token(request):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def chat_view(request):
     return render(request, 'chat_app/chat_interface.html')
 
@@ -145,9 +292,20 @@ def chat_view(request):
 
 FINETUNED_MODEL_ID = "gpt-3.5-turbo" # 사용할 LLM 모델 (gpt-4o가 더 좋지만 gpt-3.5-turbo도 충분합니다)
 
-def generate_response(query: str, retrieved_docs: List[str]) -> str:
+LLM_ERROR_MESSAGE = "죄송합니다. AI 응답을 생성하는 중 서버 오류가 발생했습니다."
+
+def build_chat_messages(
+    query: str,
+    retrieved_docs: List[str],
+    history: Optional[List[Dict]] = None,
+    user_context: str = "",
+    conversation_summary: str = ""
+    ) -> List[Dict]:
     """
-    사용자 쿼리와 검색된 문서를 기반으로 LLM 응답을 생성합니다.
+    사용자 쿼리와 검색된 문서로 LLM에 보낼 메시지 목록을 만듭니다.
+    - history: 최근 대화 ({"role", "content"} 목록, 오래된 순)
+    - user_context: 사용자 프로필/기억을 요약한 텍스트 블록
+    - conversation_summary: history보다 오래된 대화의 롤링 요약
     """
     # 1. 시스템 프롬프트 생성 (RAG의 핵심)
     if retrieved_docs:
@@ -168,18 +326,109 @@ def generate_response(query: str, retrieved_docs: List[str]) -> str:
             "현재는 검색할 문서가 없으므로 일반적인 지식과 상식에 기반하여 자연스러운 대화를 진행하세요."
         )
 
-    # 2. OpenAI API 호출
+    if user_context:
+        system_prompt += f"\n\n--- 사용자 정보 ---\n{user_context}\n-------------------\n"
+
+    if conversation_summary:
+        system_prompt += f"\n\n--- 이전 대화 요약 ---\n{conversation_summary}\n-------------------\n"
+
+    return [
+        {"role": "system", "content": system_prompt},
+        *(history or []),
+        {"role": "user", "content": query}
+    ]
+
+def generate_response(
+    query: str,
+    retrieved_docs: List[str],
+    history: Optional[List[Dict]] = None,
+    user_context: str = "",
+    conversation_summary: str = ""
+    ) -> str:
+    """
+    사용자 쿼리와 검색된 문서를 기반으로 LLM 응답을 생성합니다.
+    """
+    # OpenAI API 호출
     try:
-        response = client_openai.chat.completions.create(
-            model=FINETUNED_MODEL_ID,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
+        with metrics.timed('llm'):
+            response = get_openai_client().chat.completions.create(
+                model=FINETUNED_MODEL_ID,
+                messages=build_chat_messages(query, retrieved_docs, history, user_context, conversation_summary),
+                temperature=0.7,
+                max_tokens=500
+            )
+        metrics.record_llm_usage(FINETUNED_MODEL_ID, response.usage)
         return response.choices[0].message.content.strip()
     except Exception as e:
         print(f"LLM 응답 생성 중 오류 발생: {e}")
-        return "죄송합니다. AI 응답을 생성하는 중 서버 오류가 발생했습니다."
+        return LLM_ERROR_MESSAGE
+
+def generate_response_stream(
+    query: str,
+    retrieved_docs: List[str],
+    history: Optional[List[Dict]] = None,
+    user_context: str = "",
+    conversation_summary: str = ""
+    ) -> Iterator[str]:
+    """
+    generate_response의 스트리밍 버전입니다.
+    LLM이 토큰을 생성하는 대로 텍스트 조각을 yield합니다. (오류는 호출한 쪽에서 처리)
+    """
+    started = time.perf_counter()
+    first_token = True
+    stream = get_openai_client().chat.completions.create(
+        model=FINETUNED_MODEL_ID,
+        messages=build_chat_messages(query, retrieved_docs, history, user_context, conversation_summary),
+        temperature=0.7,
+        max_tokens=500,
+        stream=True,
+        stream_options={"include_usage": True} # 마지막 청크에 토큰 사용량이 담겨 옵니다.
+    )
+    for chunk in stream:
+        if chunk.usage is not None:
+            metrics.record_llm_usage(FINETUNED_MODEL_ID, chunk.usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if first_token:
+                metrics.record_stage('llm_first_token', time.perf_counter() - started)
+                first_token = False
+            yield delta
+    metrics.record_stage('llm', time.perf_counter() - started)
+
+async def agenerate_response(
+    query: str,
+    retrieved_docs: List[str],
+    history: Optional[List[Dict]] = None,
+    user_context: str = "",
+    conversation_summary: str = ""
+    ) -> str:
+    """generate_response의 비동기 버전입니다."""
+    try:
+        with metrics.timed('llm'):
+            response = await get_async_openai_client().chat.completions.create(
+                model=FINETUNED_MODEL_ID,
+                messages=build_chat_messages(query, retrieved_docs, history, user_context, conversation_summary),
+                temperature=0.7,
+                max_tokens=500
+            )
+        metrics.record_llm_usage(FINETUNED_MODEL_ID, response.usage)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"LLM 응답 생성 중 오류 발생: {e}")
+        return LLM_ERROR_MESSAGE
+
+def format_sse(data: Dict, event: str = None) -> str:
+    """Server-Sent Events 형식의 메시지 한 건을 만듭니다."""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+def sse_response(events: Iterator[str]) -> StreamingHttpResponse:
+    """SSE 스트림을 프록시 버퍼링 없이 바로 내보내는 응답을 만듭니다."""
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # nginx 등 리버스 프록시의 버퍼링 방지
+    return response